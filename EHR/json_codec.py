@@ -0,0 +1,68 @@
+"""
+JSON encoding and decoding of message bodies and log payloads, with a fast backend when one is
+installed.
+
+JSON_CODEC picks the backend: `auto` (default) uses msgspec if installed, else orjson, else the
+standard library; `msgspec`, `orjson` or `stdlib` ask for one. msgspec comes first because it
+decodes integers over 64 bits exactly, where orjson turns them into floats. Every backend
+writes compact UTF-8 (no spaces, non-ASCII kept as is), as httpx's `json=` does, so bodies look
+the same whichever is used; the fast ones write a NaN or infinite float as null. Input a fast
+backend refuses (non-string dict keys, NaN in a body, ...) goes to the standard library
+instead, so the backend does not narrow what is accepted, and malformed input raises
+ValueError (json.JSONDecodeError) either way.
+
+Encode a message once and reuse the bytes: send them with `content=` and keep the text for logs.
+"""
+import json
+import logging
+import os
+
+_REQUESTED = os.getenv("JSON_CODEC", "auto").lower()
+if _REQUESTED not in ("auto", "orjson", "msgspec", "stdlib"):
+    raise ValueError(f"JSON_CODEC must be auto, orjson, msgspec or stdlib, not {_REQUESTED!r}")
+
+_fast_dumps = None
+_fast_loads = None
+BACKEND = "stdlib"
+
+if _REQUESTED in ("auto", "msgspec"):
+    try:
+        import msgspec
+        _fast_dumps, _fast_loads, BACKEND = msgspec.json.encode, msgspec.json.decode, "msgspec"
+    except ImportError:
+        pass
+if BACKEND == "stdlib" and _REQUESTED in ("auto", "orjson"):
+    try:
+        import orjson
+        _fast_dumps, _fast_loads, BACKEND = orjson.dumps, orjson.loads, "orjson"
+    except ImportError:
+        pass
+if BACKEND != _REQUESTED and _REQUESTED not in ("auto", "stdlib"):
+    logging.getLogger("json_codec").warning("JSON_CODEC=%s is not installed, using %s", _REQUESTED, BACKEND)
+
+
+def dumps(obj) -> bytes:
+    """`obj` as compact UTF-8 JSON."""
+    if _fast_dumps is not None:
+        try:
+            return _fast_dumps(obj)
+        except Exception: # outside the fast backend's types; the standard library decides
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj) -> str:
+    """`obj` as compact JSON text, e.g. for a log record."""
+    if _fast_dumps is not None:
+        return dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: bytes | str):
+    """Decode JSON text or bytes (a request body). Raises ValueError when it is not JSON."""
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(data)
+        except Exception:
+            pass
+    return json.loads(data)
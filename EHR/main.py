@@ -34,7 +34,8 @@ app.add_middleware(
     allow_origins= ["*"],
     allow_credentials= False,
     allow_headers=["*"],
-    allow_methods=["*"]
+    allow_methods=["*"],
+    expose_headers=["X-Next-Cursor"], # /v1/logs pagination cursor
 )
 model.Base.metadata.create_all(bind=engine) # once you run the server, then you should comment this, so this won't do issue with testing.
 
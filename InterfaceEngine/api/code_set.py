@@ -0,0 +1,98 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+
+import code_sets
+from rate_limiting import limiter
+
+router = APIRouter(tags=["Code Set"])
+
+_MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+
+@router.post("/{name}", status_code=status.HTTP_201_CREATED)
+@limiter.limit("10/minute")  # Limit to 10 requests per minute per IP
+async def import_code_set(name: str, request: Request, response: Response,
+                          code_column: str | None = None, value_column: str | None = None):
+    """
+    Import (or replace) the code set `name` from a CSV request body, for use by `map` rules as
+    `{"code_set": "<name>"}`. Route workers pick up a replaced table within
+    CODE_SET_RELOAD_CHECK_SECS, without a restart.
+
+    **Path Parameters:**
+    - `name` (str): Letters, digits, `_` and `-`
+
+    **Query Parameters:**
+    - `code_column`, `value_column` (str, optional): Header names of the code and mapped-value
+      columns. Without them the CSV has no header and the first two columns are used.
+
+    **Request Body:** CSV text (`Content-Type: text/csv`); codes match case-insensitively.
+
+    **Response (201 Created):**
+    - `name` (str), `entries` (int): Distinct codes imported
+
+    **Error Responses:**
+    - 400 Bad Request: Invalid name, columns not in the header, or a body that is not UTF-8 CSV
+    - 413 Payload Too Large: Body over 200 MB (use `python -m code_sets import` instead)
+    """
+    body = await request.body()
+    if len(body) > _MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail="CSV too large; import it with `python -m code_sets import`")
+    if (code_column is None) != (value_column is None):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="give both code_column and value_column, or neither")
+    try:
+        text = body.decode("utf-8-sig")
+        # Sorting and writing a large table takes a while; keep it off the event loop.
+        entries = await asyncio.to_thread(code_sets.import_csv, name, text, code_column, value_column)
+    except (UnicodeDecodeError, ValueError) as exp:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exp))
+    return {"name": name, "entries": entries}
+
+
+@router.get("/all-code-sets", status_code=status.HTTP_200_OK)
+async def all_code_sets():
+    """
+    List the imported code sets.
+
+    **Response (200 OK):**
+    List of `{name, entries, size_bytes}`.
+    """
+    return await asyncio.to_thread(code_sets.list_code_sets)
+
+
+@router.get("/{name}/lookup", status_code=status.HTTP_200_OK)
+async def lookup_code(name: str, code: str):
+    """
+    Look one code up in a code set, the way a `map` rule would.
+
+    **Response (200 OK):**
+    - `code` (str), `value` (str | null): The mapped value, null when the code is not in the table
+
+    **Error Responses:**
+    - 404 Not Found: No such code set
+    """
+    try:
+        table = code_sets.get_code_set(name)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Code set {name!r} not found")
+    return {"code": code, "value": table.get(code.lower())}
+
+
+@router.delete("/{name}", status_code=status.HTTP_200_OK)
+@limiter.limit("10/minute")  # Limit to 10 requests per minute per IP
+async def delete_code_set(name: str, request: Request, response: Response):
+    """
+    Delete a code set. Map rules still referencing it fail their messages until it is imported again.
+
+    **Error Responses:**
+    - 404 Not Found: No such code set
+    - 409 Conflict: A file of the table is still mapped by another process (Windows); retry later
+    """
+    try:
+        await asyncio.to_thread(code_sets.delete_code_set, name)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Code set {name!r} not found")
+    except OSError as exp:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exp))
+    return {"message": "Code set deleted successfully"}
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import secrets
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse
+
+import profiling
+
+router = APIRouter(tags=["Debug"])
+
+# Debug endpoints are off unless DEBUG_ADMIN_TOKEN is set; callers send it as X-Admin-Token.
+_ADMIN_TOKEN = os.getenv("DEBUG_ADMIN_TOKEN")
+
+def require_admin(request: Request):
+    if not _ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not secrets.compare_digest(request.headers.get("X-Admin-Token", ""), _ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+
+@router.post("/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def profile(seconds: float = 10, output: str = "collapsed"):
+    """
+    Sample the live process for `seconds` and return the result as text.
+
+    **Query Parameters:**
+    - `seconds` (float): Sampling duration, 0 < seconds <= 60 (default 10)
+    - `output` (str): "collapsed" (default) — one `frame;frame;... count` line per stack, for
+      flamegraph.pl / speedscope — or "summary" — top functions by own and cumulative samples
+
+    **Error Responses:**
+    - 400 Bad Request: Invalid seconds/output
+    - 403 Forbidden: Missing or wrong X-Admin-Token
+    - 409 Conflict: Another profile is running
+    """
+    if not 0 < seconds <= profiling.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"seconds must be in (0, {profiling.PROFILE_MAX_SECONDS}]")
+    if output not in ("collapsed", "summary"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="output must be 'collapsed' or 'summary'")
+    try:
+        # The sampler runs on its own thread so the loop keeps serving (and gets sampled).
+        return await asyncio.to_thread(profiling.sample_profile, seconds, output)
+    except RuntimeError as exp:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exp))
+
+@router.get("/loop-lag", dependencies=[Depends(require_admin)])
+async def loop_lag():
+    """
+    Event-loop lag over the sampling window.
+
+    **Response (200 OK):**
+    - `max` (float): Worst lag in seconds
+    - `p99` (float): 99th percentile lag in seconds
+    - `samples` (int): Samples in the window
+    """
+    return profiling.lag_stats()
+
+@router.get("/slow-steps", dependencies=[Depends(require_admin)])
+async def slow_steps(limit: int = 50):
+    """
+    Recent loop steps that ran longer than SLOW_STEP_THRESHOLD_MS, newest first.
+
+    **Response (200 OK):**
+    List of `{at, duration_ms, step, stack}`; `stack` is the loop thread's stack captured while
+    the step was still running (null if it finished before the watchdog looked).
+    """
+    return profiling.slow_steps(limit=max(1, min(limit, 200)))
@@ -4,13 +4,16 @@ from logging.handlers import RotatingFileHandler
 from fastapi import APIRouter, status, HTTPException, Depends, Response, Request
 from sqlalchemy.orm import Session
 
-from schemas.endpoint import AddEndpoint
+from schemas.endpoint import AddEndpoint, UpdateEndpointValidation
 import models
 from database import get_db
+import json_codec
 from rate_limiting import limiter
-from validation.mappings import FHIR_EXACT_CANONICAL, FHIR_PATTERN_CANONICAL, HL7_EXACT_CANONICAL
+import response_cache
+from validation.mappings import canonical_name, canonical_names
 from validation.fhir_validation import validate_unknown_fhir_resource, fhir_extract_paths
 from validation.hl7_validation import hl7_extract_paths
+from validation import structural
 
 router = APIRouter(tags=["Endpoint"])
 
@@ -43,20 +46,33 @@ def server_endpoint(server_id: int, request: Request, response: Response, db:Ses
     - `endpoint_id`: Unique endpoint identifier
     - `server_id`: The parent server's ID
     - `url`: The endpoint URL
+    - `validation`: How messages received on it are validated (`"none"`, `"structural"` or `"full"`)
 
     **Note:**
     - Returns an empty list if the server has no registered endpoints.
 
+    **Caching:** the response carries an `ETag`; a poll with `If-None-Match` gets `304 Not Modified`
+    until a server or endpoint changes (see response_cache.py).
+
     **Error Responses:**
     - `404 Not Found`: No server exists with the given `server_id`
     - `400 Bad Request`: Unexpected database error
     """
+    return response_cache.respond(
+        request, response_cache.CONFIG, f"server-endpoint/{server_id}", lambda: _server_endpoints(server_id, db))
+
+
+def _server_endpoints(server_id: int, db: Session) -> bytes:
     if not db.get(models.Server, server_id):
         logger.warning(f"Server endpoint list rejected: server id {server_id} does not exist")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"server id {server_id} does not exists")
     try:
         data = db.query(models.Endpoints).filter(models.Endpoints.server_id == server_id).all()
-        return data
+        return json_codec.dumps([
+            {"endpoint_id": endpoint.endpoint_id, "server_id": endpoint.server_id, "url": endpoint.url,
+             "validation": endpoint.validation}
+            for endpoint in data
+        ])
 
     except Exception as exp:
         logger.error(f"Server endpoint list failed for server_id={server_id}: {str(exp)}")
@@ -79,12 +95,20 @@ async def add_endpoint(endpoint: AddEndpoint, request: Request, response: Respon
     - `sample_msg` (dict | str, required): A sample message in the specified protocol format.
         - For `"FHIR"`: Provide a JSON object — either a single FHIR resource or a FHIR Bundle.
         - For `"HL7"`: Provide a raw HL7 v2.x string with segments separated by newlines (`\\n`).
+    - `validation` (str, optional): How messages received on this endpoint are validated:
+        - `"none"` (default): not validated.
+        - `"structural"`: checked against validators compiled from the FHIR R4B / HL7 v2
+          definitions (required elements and fields, cardinality, segment order, primitive
+          and data type formats); microseconds per message.
+        - `"full"`: the whole message is validated with fhir.resources / hl7apy (strict);
+          milliseconds per message.
 
     **Response (201 Created):**
     Returns a confirmation message:
     - `message`: "Endpoint added successfully"
 
     **Side Effects:**
+    - Validates the `sample_msg` at the chosen `validation` tier.
     - Parses the `sample_msg` to extract field paths.
     - Matches extracted paths against the canonical mapping table to assign human-readable names.
     - Stores the discovered fields as `EndpointField` records in the database, linked to this endpoint.
@@ -101,11 +125,12 @@ async def add_endpoint(endpoint: AddEndpoint, request: Request, response: Respon
     **Error Responses:**
     - `400 Bad Request`: Server does not exist
     - `400 Bad Request`: URL already exists for this server
+    - `400 Bad Request`: The sample message fails the chosen `validation` tier
     - `400 Bad Request`: Failed to extract fields from the provided sample message
     """
     logger.info(
         f"Add endpoint request received: server_id={endpoint.server_id}, url={endpoint.url}, "
-        f"server_protocol={endpoint.server_protocol}"
+        f"server_protocol={endpoint.server_protocol}, validation={endpoint.validation}"
     )
 
     if not db.get(models.Server, endpoint.server_id):
@@ -128,10 +153,19 @@ async def add_endpoint(endpoint: AddEndpoint, request: Request, response: Respon
         logger.warning(f"Add endpoint rejected: unsupported server protocol '{endpoint.server_protocol}'")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Server Protocol is not FHIR or HL7")
 
+    # Messages that fail their endpoint's tier are rejected, so the sample has to pass it too.
+    sample_msg = endpoint.sample_msg.strip() if isinstance(endpoint.sample_msg, str) else endpoint.sample_msg
+    errors = structural.validation_errors(endpoint.validation, endpoint.server_protocol, sample_msg)
+    if errors:
+        logger.warning(f"Add endpoint rejected: sample message fails {endpoint.validation} validation: {errors}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Sample message fails {endpoint.validation} validation: {structural.describe(errors)}")
+
     try:
         new_endpoint = models.Endpoints(
             server_id=endpoint.server_id,
             url=endpoint.url,
+            validation=endpoint.validation,
         )
         db.add(new_endpoint)
         db.flush()
@@ -157,6 +191,7 @@ async def add_endpoint(endpoint: AddEndpoint, request: Request, response: Respon
             )
             logger.info(f"HL7 endpoint fields added successfully for endpoint_id={new_endpoint.endpoint_id}")
         db.commit()
+        response_cache.bump(response_cache.CONFIG)
         return {"message": "Endpoint added successfully"}
     except Exception as e:
         db.rollback()
@@ -164,6 +199,49 @@ async def add_endpoint(endpoint: AddEndpoint, request: Request, response: Respon
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{str(e)}")
 
 
+@router.put("/endpoint-validation/{endpoint_id}", status_code=status.HTTP_200_OK)
+@limiter.limit("10/minute")  # Limit to 10 requests per minute per IP
+def update_endpoint_validation(endpoint_id: int, body: UpdateEndpointValidation, request: Request, response: Response,
+                               db: Session = Depends(get_db)):
+    """
+    Change how the messages received on an endpoint are validated.
+
+    **Path Parameters:**
+    - `endpoint_id` (int, required): The unique ID of the endpoint.
+
+    **Request Body:**
+    - `validation` (str, required): `"none"`, `"structural"` or `"full"` (see `/add-endpoint`).
+
+    **Response (200 OK):**
+    Returns a confirmation message:
+    - `message`: "Endpoint validation updated successfully"
+
+    **Note:**
+    - Takes effect from the next message received on the endpoint; messages that fail their
+      endpoint's tier are rejected with `400 Bad Request` (MLLP: `AR`).
+
+    **Error Responses:**
+    - `404 Not Found`: No endpoint exists with the given `endpoint_id`
+    - `400 Bad Request`: Unexpected database error
+    """
+    existing_endpoint = db.get(models.Endpoints, endpoint_id)
+    if not existing_endpoint:
+        logger.warning(f"Endpoint validation update rejected: endpoint id {endpoint_id} does not exist")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"endpoint id {endpoint_id} does not exists")
+
+    try:
+        existing_endpoint.validation = body.validation
+        db.commit()
+        response_cache.bump(response_cache.CONFIG)
+        logger.info(f"Endpoint {existing_endpoint.url} (id={endpoint_id}) validation set to {body.validation}")
+        return {"message": "Endpoint validation updated successfully"}
+
+    except Exception as exp:
+        db.rollback()
+        logger.error(f"Endpoint validation update failed for endpoint_id={endpoint_id}: {str(exp)}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exp))
+
+
 @router.get("/endpoint_field_path/{endpoint_id}", status_code=status.HTTP_200_OK)
 @limiter.limit("40/minute")  # Limit to 40 requests per minute per IP
 def endpoint_field_paths(endpoint_id: int, request: Request, response: Response, db:Session = Depends(get_db)):
@@ -239,17 +317,11 @@ def add_fhir_endpoint_fields(endpoint_id: int, sample_msg: str,  db: Session) ->
                 # Prefix with resource type for the same reason as above.
                 paths.extend([f"{resource_type}-{p}" for p in raw_paths]
         )
-        logger.info(f"Path Extraction Completed for endpoint_id={endpoint_id}, withh paths:\n{paths}")
+        logger.info(f"Path Extraction Completed for endpoint_id={endpoint_id}, with {len(paths)} paths")
 
         if len(paths) > 0:
-            endpoint_fields = {}
-            for path in paths:
-
-                name = resolve_canonical_name(full_path=path)
-                if not name:
-                    continue
-                endpoint_fields[path] = name 
-                logger.info(f"Mapped path {path} to canonical name {name}")
+            endpoint_fields = resolve_canonical_names(paths)
+            logger.info(f"Mapped paths to canonical names: {endpoint_fields}")
             
             new_fields = []
             for path, name in endpoint_fields.items():
@@ -301,14 +373,8 @@ def add_hl7_endpoint_fields(endpoint_id: int, sample_msg: str,  db: Session) ->
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"segment not valid: {segment}")
             
             segment_type, paths = hl7_extract_paths(segment)
-            endpoint_fields = {}
-            for path in paths:
-                    
-                name = resolve_canonical_name(full_path=path)
-                if not name:
-                    continue
-                endpoint_fields[path] = name
-                logger.info(f"Mapped path {path} to canonical name {name}")
+            endpoint_fields = resolve_canonical_names(paths)
+            logger.info(f"Mapped paths to canonical names: {endpoint_fields}")
                
             new_fields = []
             for path, name in endpoint_fields.items():
@@ -339,25 +405,34 @@ def resolve_canonical_name(full_path: str) -> str | None:
     Layer 1 — Exact match in FHIR_EXACT_CANONICAL or HL7_EXACT_CANONICAL.
     Layer 2 — Suffix pattern match in FHIR_PATTERN_CANONICAL (FHIR only).
 
+    Both are dict lookups compiled at import, and results are memoized per path
+    (validation/mappings.py canonical_name).
+
     Args:
         full_path: e.g. "Patient-name[0].family"  or  "PID-5.1"
 
     Returns:
         Canonical name string, or None if no mapping found.
     """
-    # ── Layer 1: exact match ─────────────────────────────────────────────────
-    if full_path in FHIR_EXACT_CANONICAL:
-        return FHIR_EXACT_CANONICAL[full_path]
-
-    if full_path in HL7_EXACT_CANONICAL:
-        return HL7_EXACT_CANONICAL[full_path]
-
-    # ── Layer 2: FHIR suffix pattern ─────────────────────────────────────────
-    if "-" in full_path:
-        resource_type, suffix = full_path.split("-", 1)
-        for pattern, name_template in FHIR_PATTERN_CANONICAL:
-            if suffix == pattern:
-                return name_template.replace("{resource}", resource_type.lower())
-
-    logger.warning(f"No canonical mapping found for path {full_path}, skipping.")
-    return None  # truly unknown — caller decides whether to skip or store raw
+    name = canonical_name(full_path)
+    if name is None:
+        logger.warning(f"No canonical mapping found for path {full_path}, skipping.")
+    return name
+
+
+def resolve_canonical_names(paths) -> dict[str, str]:
+    """
+    Resolve a whole path list at once, as resolve_canonical_name does one path.
+
+    Args:
+        paths: Full prefixed paths, possibly repeated (a Bundle sample repeats each
+            resource's paths once per entry).
+
+    Returns:
+        dict: path → canonical name, for each distinct path that has one, in first-seen order.
+        Paths without a mapping are left out and logged together in one warning.
+    """
+    names, unmapped = canonical_names(paths)
+    if unmapped:
+        logger.warning(f"No canonical mapping found for {len(unmapped)} paths, skipping: {unmapped}")
+    return names
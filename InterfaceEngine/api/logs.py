@@ -1,15 +1,25 @@
+import base64
+from datetime import datetime
 from typing import List
 import json
 
 from fastapi import APIRouter, status, HTTPException, Depends, Response, Request
+from fastapi.params import Query
+from pydantic import TypeAdapter
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 
-from schemas.logs_schema import LogEntry, LogMsg, LogResponse
+from schemas.logs_schema import LogEntry, LogMsg, LogResponse, LogPage, TraceEntry
+import log_retention
 import models
+import response_cache
+import tracing
 from database import get_db
 
 router = APIRouter(tags=["Logs"])
 
+_LOG_LIST = TypeAdapter(list[LogEntry])
+
 def _format_log_message(message: str | None) -> str | None:
     if not message:
         return None
@@ -23,7 +33,7 @@ def _format_log_message(message: str | None) -> str | None:
         return message
 
 @router.get("/show-logs", status_code=status.HTTP_200_OK, response_model=list[LogEntry])
-async def show_logs(db: Session = Depends(get_db)):
+async def show_logs(request: Request, db: Session = Depends(get_db)):
     """
     Retrieve all logs from the database.
 
@@ -36,12 +46,19 @@ async def show_logs(db: Session = Depends(get_db)):
     - `operation_heading` (str): Heading or title of the operation
     - `operation_message` (str): Detailed message about the operation
 
+    **Caching:** the response carries an `ETag`; a poll with `If-None-Match` gets `304 Not Modified`
+    until new logs are written (see response_cache.py).
+
     **Error Responses:**
     - 409 Conflict: Database retrieval error
     """
+    return response_cache.respond(request, response_cache.LOGS, "show-logs", lambda: _show_logs(db))
+
+
+def _show_logs(db: Session) -> bytes:
     try:
         logs = db.query(models.Logs).order_by(models.Logs.datetime.desc()).limit(30).all()
-        return logs
+        return _LOG_LIST.dump_json(_LOG_LIST.validate_python(logs, from_attributes=True))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 
@@ -64,6 +81,7 @@ async def show_log_msg(log_id: int, db: Session = Depends(get_db)):
     try:
         log = db.query(models.Logs).filter(models.Logs.log_id == log_id).first()
         if log:
+            log_retention.fill_bodies(db, [log])
             log.src_message = _format_log_message(log.src_message)
             log.dest_message = _format_log_message(log.dest_message)
 
@@ -71,7 +89,126 @@ async def show_log_msg(log_id: int, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
 
+@router.get("/traces", status_code=status.HTTP_200_OK, response_model=list[TraceEntry])
+async def show_traces(limit: int = 20, route: str | None = None):
+    """
+    Slowest recent route deliveries with their stage breakdown, from the in-memory trace buffer.
+
+    **Query Parameters:**
+    - `limit` (int): How many traces to return, slowest first (default 20, max 500)
+    - `route` (str, optional): Only traces of this route name
+
+    **Response (200 OK):**
+    Returns a list of traces, where each trace contains:
+    - `trace_id` (str): Trace id assigned by ingest (or the caller's `X-Trace-Id`)
+    - `route` (str): Route the message was delivered through
+    - `worker` (int | None): route_worker that processed it
+    - `started_at` (datetime): When the message was enqueued for the route
+    - `outcome` (str): delivered | parked | failed | cancelled
+    - `total_ms` (float): Enqueue to done
+    - `stages_ms` (dict): queue_wait, transform, build, deliver and other (time between stages)
+    """
+    return tracing.slowest(limit=max(1, min(limit, 500)), route=route)
+
+# Columns of the summary view: everything except the src/dest message bodies.
+_LOG_SUMMARY_COLUMNS = (
+    models.Logs.log_id,
+    models.Logs.datetime,
+    models.Logs.status,
+    models.Logs.operation_heading,
+    models.Logs.operation_message,
+    models.Logs.dest_system_name,
+    models.Logs.src_systemid,
+)
+_LOG_FULL_COLUMNS = _LOG_SUMMARY_COLUMNS + (
+    models.Logs.src_message, models.Logs.dest_message,
+    models.Logs.src_payload_hash, models.Logs.dest_payload_hash,
+)
+_MAX_LOG_PAGE_SIZE = 500
+
+def _encode_log_cursor(log_datetime: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{log_datetime.isoformat()}|{log_id}".encode()).decode()
+
+def _decode_log_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        log_datetime, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(log_datetime), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+@router.get("/query", status_code=status.HTTP_200_OK, response_model=LogPage, response_model_exclude_unset=True)
+def query_logs(
+    src_systemid: str | None = None,
+    dest_system_name: str | None = None,
+    status_filter: str | None = Query(None, alias="status"), # `status` is the fastapi module here
+    since: datetime | None = None,
+    until: datetime | None = None,
+    channel: str | None = None,
+    view: str = "summary",
+    limit: int = 50,
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Filtered, keyset-paginated log query, newest first. Covers the live `logs` table, i.e. the
+    last LOG_HOT_DAYS days; older days are archived to `logs_archive_<yyyymmdd>` tables.
+
+    **Query Parameters (all optional):**
+    - `src_systemid` (str): Source system id, e.g. "EHR-1"
+    - `dest_system_name` (str): Destination server name
+    - `status` (str): "Success" or "Fail"
+    - `since` / `until` (datetime): Time range, inclusive start / exclusive end
+    - `channel` (str): Route name (matches `operation_heading` "Channel: <name>")
+    - `view` (str): "summary" (default, no message bodies) or "full"
+    - `limit` (int): Page size, default 50, max 500
+    - `cursor` (str): `next_cursor` of the previous page
+
+    **Response (200 OK):**
+    - `items`: log entries; `src_message`/`dest_message` only with `view=full`
+    - `next_cursor` (str | None): Pass back as `cursor` for the next page; null on the last page
+
+    **Error Responses:**
+    - 400 Bad Request: Invalid cursor or view
+    """
+    if view not in ("summary", "full"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="view must be 'summary' or 'full'")
+    limit = max(1, min(limit, _MAX_LOG_PAGE_SIZE))
+
+    query = db.query(*(_LOG_FULL_COLUMNS if view == "full" else _LOG_SUMMARY_COLUMNS))
+    if src_systemid is not None:
+        query = query.filter(models.Logs.src_systemid == src_systemid)
+    if dest_system_name is not None:
+        query = query.filter(models.Logs.dest_system_name == dest_system_name)
+    if status_filter is not None:
+        query = query.filter(models.Logs.status == status_filter)
+    if channel is not None:
+        query = query.filter(models.Logs.operation_heading == f"Channel: {channel}")
+    if since is not None:
+        query = query.filter(models.Logs.datetime >= since)
+    if until is not None:
+        query = query.filter(models.Logs.datetime < until)
+    if cursor is not None:
+        cursor_datetime, cursor_log_id = _decode_log_cursor(cursor)
+        # Row-value comparison (datetime, log_id) < (..., ...), spelled out for MSSQL.
+        query = query.filter(or_(
+            models.Logs.datetime < cursor_datetime,
+            and_(models.Logs.datetime == cursor_datetime, models.Logs.log_id < cursor_log_id),
+        ))
+
+    # One extra row tells us whether there is a next page without a COUNT(*).
+    rows = query.order_by(models.Logs.datetime.desc(), models.Logs.log_id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_log_cursor(rows[-1].datetime, rows[-1].log_id)
+    items = [dict(row._mapping) for row in rows]
+    if view == "full":
+        log_retention.fill_bodies(db, items)
+    return {"items": items, "next_cursor": next_cursor}
+
 @router.get("/engine/logs", response_model=List[LogResponse])
 def get_all_engine_logs(db: Session = Depends(get_db)):
-    """Engine ke saare logs fetch karne ki API"""
-    return db.query(models.Logs).all()
\ No newline at end of file
+    """Engine ke saare logs fetch karne ki API. Poori table bhejti hai — naye callers `/logs/query` use karein."""
+    logs = db.query(models.Logs).all()
+    log_retention.fill_bodies(db, logs)
+    return logs
\ No newline at end of file
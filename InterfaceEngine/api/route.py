@@ -1,18 +1,27 @@
 import logging
+import re
 from logging.handlers import RotatingFileHandler
 
 from fastapi import APIRouter, Request, Response, status, HTTPException, Depends
 from fastapi.params import Query
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, joinedload
 
+import code_sets
 from database import get_db
+import json_codec
 from schemas.route import GetRoute, AddRoute
 import models
-from validation.suggestion import generate_single_suggestion
+from validation.suggestion import generate_bulk_suggestions, generate_single_suggestion
+from validation.transformation import compile_regex_rule
+from validation.date_format import DateFormatRule
 from rate_limiting import limiter
+import response_cache
 
 router = APIRouter(tags=["Route"])
 
+_ROUTE_LIST = TypeAdapter(list[GetRoute])
+
 logger = logging.getLogger("route_logger")
 logger.setLevel(logging.INFO)
 logger.propagate = False
@@ -23,6 +32,31 @@ if not logger.handlers:
     logger.addHandler(handler)
 
 
+def _rule_config_error(mappings: list) -> str | None:
+    """
+    Why the first regex/format rule in `mappings` cannot be compiled, or a map rule names a code
+    set that does not exist; None when all of them are fine.
+    """
+    for index, rule in enumerate(mappings):
+        config = rule.get('config') or {}
+        if rule.get('transform') == 'regex':
+            if not isinstance(config.get('from'), str) or not isinstance(config.get('to'), str):
+                return f"regex rule {index}: config needs string 'from' and 'to'"
+            try:
+                compile_regex_rule(config['from'], config['to'])
+            except re.error as exp:
+                return f"regex rule {index}: {exp}"
+        elif rule.get('transform') == 'format':
+            try:
+                DateFormatRule.from_config(config)
+            except ValueError as exp:
+                return f"format rule {index}: {exp}"
+        elif rule.get('transform') == 'map' and 'code_set' in config:
+            if not isinstance(config['code_set'], str) or not code_sets.exists(config['code_set']):
+                return f"map rule {index}: code set {config['code_set']!r} does not exist"
+    return None
+
+
 @router.get("/all-routes", status_code=status.HTTP_200_OK, response_model=list[GetRoute])
 @limiter.limit("40/minute")  # Limit to 40 requests per minute per IP
 def all_routes(request: Request, response: Response,db: Session = Depends(get_db)):
@@ -55,9 +89,16 @@ def all_routes(request: Request, response: Response,db: Session = Depends(get_db
     **Note:**
     - Returns an empty list if no routes have been configured.
 
+    **Caching:** the response carries an `ETag`; a poll with `If-None-Match` gets `304 Not Modified`
+    until a server, endpoint or route changes (see response_cache.py).
+
     **Error Responses:**
     - `400 Bad Request`: Unexpected database error
     """
+    return response_cache.respond(request, response_cache.CONFIG, "all-routes", lambda: _all_routes(db))
+
+
+def _all_routes(db: Session) -> bytes:
     logger.info("All routes request received")
 
     try:
@@ -74,7 +115,7 @@ def all_routes(request: Request, response: Response,db: Session = Depends(get_db
             } for route in routes
         ]
         logger.info(f"All routes fetched successfully: total_routes={len(response)}")
-        return response
+        return _ROUTE_LIST.dump_json(_ROUTE_LIST.validate_python(response))
     except Exception as e:
         logger.error(f"Error retrieving routes: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{str(e)}")
@@ -127,15 +168,24 @@ def get_rules(request: Request, response: Response, route_id: int, db: Session =
 
     **Supported Transform Types:**
     - `copy`: Direct value copy from source to destination
-    - `map`: Value substitution using a lookup table in `config` (e.g., `{"Male": "M", "Female": "F"}`)
+    - `map`: Value substitution using a lookup table in `config` (e.g., `{"Male": "M", "Female": "F"}`),
+      or a code set imported via /code-set (`{"code_set": "loinc_local"}`, inline entries override it)
     - `format`: Date/time format conversion using `config` (e.g., `{"from": "%Y-%m-%d", "to": "%Y%m%d"}`)
     - `split`: Split a single source value into multiple destinations using a delimiter
     - `concat`: Merge multiple source values into a single destination field
 
+    **Caching:** the response carries an `ETag`; a poll with `If-None-Match` gets `304 Not Modified`
+    until a server, endpoint or route changes (see response_cache.py). A 404 is not cached.
+
     **Error Responses:**
     - `404 Not Found`: No route exists with the given `route_id`
     - `400 Bad Request`: Unexpected database error
     """
+    return response_cache.respond(
+        request, response_cache.CONFIG, f"mapping_rules/{route_id}", lambda: _mapping_rules(route_id, db))
+
+
+def _mapping_rules(route_id: int, db: Session) -> bytes:
     logger.info(f"Mapping rules request received for route_id={route_id}")
 
     if not db.get(models.Route, route_id):
@@ -256,7 +306,7 @@ def get_rules(request: Request, response: Response, route_id: int, db: Session =
         logger.info(
             f"Mapping rules fetched successfully for route_id={route_id}: total_rules={len(mapping_data)}"
         )
-        return mapping_data
+        return json_codec.dumps(mapping_data)
 
     except Exception as exp:
         logger.error(f"Error retrieving mapping rules for route id {route_id}: {str(exp)}")
@@ -356,6 +406,63 @@ def mapping_suggestion(
         logger.error(f"Error retrieving mapping suggestion: {str(exp)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exp))
 
+@router.get("/mapping_suggestions/src_endpoint_id/{src_endpoint_id}/dest_endpoint_id/{dest_endpoint_id}", status_code=status.HTTP_200_OK)
+@limiter.limit("30/minute")  # Limit to 30 requests per minute per IP
+def bulk_mapping_suggestions(
+    request: Request, response: Response,
+    src_endpoint_id: int,
+    dest_endpoint_id: int,
+    db: Session = Depends(get_db)):
+    """
+    Generate the mapping suggestions for a whole source and destination endpoint pair in one call.
+
+    Every destination field whose canonical name is also the name of a source field gets a
+    one-to-one rule, with the transform and config `/mapping_suggestion` would suggest for that
+    pair. The endpoints (with their servers) and all their fields are loaded in two queries.
+
+    **Path Parameters:**
+    - `src_endpoint_id` (int): Source endpoint ID.
+    - `dest_endpoint_id` (int): Destination endpoint ID.
+
+    **Response (200 OK):**
+    JSON object:
+    - `src_endpoint_id`, `dest_endpoint_id`: the endpoints
+    - `mappings`: suggested rules in the `rules.mappings` format of `/add-route`
+      (`src_paths`, `dest_paths`, `transform`, `config`), plus the canonical `name` matched
+    - `unmatched_src_field_ids`: source fields no rule reads
+    - `unmatched_dest_field_ids`: destination fields with no source field of the same name
+
+    **Error Responses:**
+    - `404 Not Found`: src or destination endpoint id not found
+    - `400 Bad Request`: Unexpected processing error.
+    """
+    endpoints = {
+        endpoint.endpoint_id: endpoint
+        for endpoint in db.query(models.Endpoints).options(joinedload(models.Endpoints.server))
+        .filter(models.Endpoints.endpoint_id.in_([src_endpoint_id, dest_endpoint_id])).all()
+    }
+    if src_endpoint_id not in endpoints or dest_endpoint_id not in endpoints:
+        logger.warning(
+            f"Bulk mapping suggestion rejected: src or destination endpoint id not found "
+            f"src_endpoint_id={src_endpoint_id}, dest_endpoint_id={dest_endpoint_id}"
+        )
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="src or destination endpoint id not found")
+
+    fields = db.query(models.EndpointFields).filter(
+        models.EndpointFields.endpoint_id.in_([src_endpoint_id, dest_endpoint_id])).all()
+
+    try:
+        suggestions = generate_bulk_suggestions(
+            src_server= endpoints[src_endpoint_id].server,
+            dest_server= endpoints[dest_endpoint_id].server,
+            src_fields= [field for field in fields if field.endpoint_id == src_endpoint_id],
+            dest_fields= [field for field in fields if field.endpoint_id == dest_endpoint_id]
+        )
+        return {"src_endpoint_id": src_endpoint_id, "dest_endpoint_id": dest_endpoint_id, **suggestions}
+    except Exception as exp:
+        logger.error(f"Error generating bulk mapping suggestions: {str(exp)}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exp))
+
 @router.post("/add-route", status_code=status.HTTP_201_CREATED)
 @limiter.limit("10/minute")  # Limit to 10 requests per minute per IP
 def add_route(data: AddRoute,request: Request, response: Response, db: Session = Depends(get_db)):
@@ -392,8 +499,8 @@ def add_route(data: AddRoute,request: Request, response: Response, db: Session =
     |------|------------|-------------|-----------------|
     | `copy` | 1 field | 1 field | `{}` |
     | `map` | 1 field | 1 field | `{"Male": "M", "Female": "F"}` |
-    | `format` | 1 field | 1 field | `{"from": "%Y-%m-%d", "to": "%Y%m%d"}` |
-    | `regex` | 1 field | 1 field | `{"pattern": r"(\d{4})-(\d{2})-(\d{2})", "replacement": r"\1\2\3"}` |
+    | `format` | 1 field | 1 field | `{"from": "%Y-%m-%d", "to": "%Y%m%d"}`, optional `"fallbacks": ["%Y-%m-%dT%H:%M:%S%z"]` |
+    | `regex` | 1 field | 1 field | `{"from": r"\d+", "to": r"patient/\d+"}` |
     | `split` | 1 field | multiple fields | `{"delimiter": " "}` |
     | `concat` | multiple fields | 1 field | `{}` |
 
@@ -412,7 +519,7 @@ def add_route(data: AddRoute,request: Request, response: Response, db: Session =
     - `409 Conflict`: A route with the same src/dest endpoint pair already exists
     - `404 Not Found`: src or dest server/endpoint ID not found
     - `403 Forbidden`: A single rule has both multiple src_paths and multiple dest_paths
-    - `400 Bad Request`: Invalid transform type, or unexpected database error
+    - `400 Bad Request`: Invalid transform type, a regex/format rule that does not compile, an unknown code set, or unexpected database error
     """
     logger.info(
         f"Add route request received: name={data.name}, src_endpoint_id={data.src_endpoint_id}, "
@@ -446,6 +553,11 @@ def add_route(data: AddRoute,request: Request, response: Response, db: Session =
     if not db.get(models.Endpoints, data.dest_endpoint_id):
         logger.warning(f"Add route rejected: dest endpoint id {data.dest_endpoint_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="dest endpoint id not found")
+
+    config_error = _rule_config_error(data.rules['mappings'])
+    if config_error:
+        logger.warning(f"Add route rejected: {config_error}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=config_error)
         
     try:
         route = models.Route(
@@ -515,6 +627,7 @@ def add_route(data: AddRoute,request: Request, response: Response, db: Session =
 
         db.add_all(rules)
     db.commit() # this is added outside the loop so all the mapping_rules are added permentlly at the same time.
+    response_cache.bump(response_cache.CONFIG)
     logger.info(
         f"Add route completed successfully: route_id={route.route_id}, total_mapping_rules={len(data.rules['mappings'])}"
     )
@@ -570,7 +683,7 @@ def edit_route(route_id: int, data: AddRoute, request: Request, response: Respon
     - `409 Conflict`: A route with the same src/dest endpoint pair already exists (for a different route)
     - `404 Not Found`: src or dest server/endpoint ID not found
     - `403 Forbidden`: A single rule has both multiple src_paths and multiple dest_paths
-    - `400 Bad Request`: Invalid transform type or unexpected database error
+    - `400 Bad Request`: Invalid transform type, a regex/format rule that does not compile, an unknown code set, or unexpected database error
     """
     logger.info(f"Edit route request received: route_id={route_id}, name={data.name}")
 
@@ -619,6 +732,11 @@ def edit_route(route_id: int, data: AddRoute, request: Request, response: Respon
         logger.warning(f"Edit route rejected: dest endpoint id {data.dest_endpoint_id} not found")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="dest endpoint id not found")
 
+    config_error = _rule_config_error(data.rules['mappings'])
+    if config_error:
+        logger.warning(f"Edit route rejected: {config_error}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=config_error)
+
     try:
         # Update route header fields
         route.name = data.name
@@ -682,6 +800,7 @@ def edit_route(route_id: int, data: AddRoute, request: Request, response: Respon
             db.add_all(rules)
 
         db.commit()
+        response_cache.bump(response_cache.CONFIG)
         db.refresh(route)
 
         # Fetch updated mapping rules for response
@@ -746,6 +865,7 @@ def delete_route(route_id: int, request: Request, response: Response, db: Sessio
         db.query(models.MappingRule).filter(models.MappingRule.route_id == route_id).delete()
         db.delete(route)
         db.commit()
+        response_cache.bump(response_cache.CONFIG)
         logger.info(f"Delete route completed successfully: route_id={route_id}")
     except Exception as exp:
         db.rollback()
@@ -1,25 +1,38 @@
 import asyncio
+import hashlib
+import json
 import logging
 from logging.handlers import RotatingFileHandler
+import os
 import ssl
+import time
 
 import httpx
 from fastapi import APIRouter, status, HTTPException, Depends, Request, Response
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, joinedload
 
 from schemas.server import AddUpdateServer, GetServer
 from schemas.toggel import UpdateStatus 
 import models
+import mllp
 from database import get_db, session_local
 from rate_limiting import limiter
+import response_cache
 
 router = APIRouter(tags=["Server"])
 
+_SERVER_LIST = TypeAdapter(list[GetServer])
+
 # Shared SSL context: building one loads the whole Windows cert store (~0.75s, blocking the
 # event loop). server_health/get_lis_payer construct a client every 30s — without this they
 # froze the loop on every iteration.
 _SHARED_SSL_CONTEXT = ssl.create_default_context()
 
+_CONNECTED_SYSTEMS_INTERVAL_SECS = int(os.getenv("CONNECTED_SYSTEMS_INTERVAL_SECS", "30"))
+# Re-send an unchanged topology at most this often, in case an EHR restarted and lost its copy.
+_CONNECTED_SYSTEMS_RESYNC_SECS = int(os.getenv("CONNECTED_SYSTEMS_RESYNC_SECS", "600"))
+
 logger = logging.getLogger("server_logger")
 logger.setLevel(logging.INFO)
 logger.propagate = False
@@ -58,7 +71,8 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
     Register a new external server (EHR, LIS, Payer, etc.) in the Interface Engine.
 
     Before saving, the engine performs a live health check by hitting the server's `/health`
-    endpoint. If the server is unreachable or returns a non-200 response, registration is rejected.
+    endpoint (for an MLLP server, by opening a TCP connection to it). If the server is unreachable
+    or returns a non-200 response, registration is rejected.
 
     **Request Body:**
     - `name` (str, required): Unique descriptive name for this server (e.g., "EHR-Server", "LIS-Lab").
@@ -66,6 +80,9 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
     - `port` (int, required): Port number on which the server is running (e.g., 8001).
     - `protocol` (str, required): Messaging protocol this server uses — `"FHIR"` or `"HL7"`.
     - `category`: Server category (`"EHR"` or `"PHR"` or `"LIS"` or `"Payer"`)
+    - `transport` (str, optional): How messages are delivered to the server — `"http"` (default,
+      POST to the endpoint url) or `"mllp"` (HL7 over a persistent TCP connection to `ip:port`,
+      HL7 servers only). Stored in the server's `profile`.
 
     **Response (201 Created):**
     Returns a confirmation message:
@@ -78,7 +95,8 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
 
     **Constraints:**
     - Server name must be unique.
-    - The server must be reachable and return HTTP 200 on `GET http://{ip}:{port}/health`.
+    - The server must be reachable and return HTTP 200 on `GET http://{ip}:{port}/health`
+      (`mllp`: accept a TCP connection on `ip:port`).
 
     **Error Responses:**
     - `409 Conflict`: A server with this name already exists
@@ -93,16 +111,19 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
         logger.warning(f"Attempt to add server with duplicate IP, port, and system_id: {server.ip}:{server.port}:{server.system_id}")
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Server with the same ip, port, and system_id already exists")
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0), verify=_SHARED_SSL_CONTEXT) as client:
-        is_reachable, reason = await add_server_reachability_check(client, server.ip, server.port, server.system_id)
-        if not is_reachable:
-            logger.error(
-                f"Add-server failed for {server.name} ({server.ip}:{server.port}): {reason}"
-            )
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Server is not reachable or unhealthy: {reason}"
-            )
+    if server.transport == "mllp":
+        is_reachable, reason = await mllp.is_reachable(server.ip, server.port)
+    else:
+        async with httpx.AsyncClient(timeout=httpx.Timeout(10.0), verify=_SHARED_SSL_CONTEXT) as client:
+            is_reachable, reason = await add_server_reachability_check(client, server.ip, server.port, server.system_id)
+    if not is_reachable:
+        logger.error(
+            f"Add-server failed for {server.name} ({server.ip}:{server.port}): {reason}"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Server is not reachable or unhealthy: {reason}"
+        )
 
     # config means that the server accept this kind of data, and send this kind of data, we will use this config in
     # the transformation part to know how to transform the data, for example if the date format is different in the
@@ -138,6 +159,8 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
         config["practitioner_reference_format"] = ".+" # e.g. Practitioner/PRAC-001, we will extract the practitioner id from this reference and then use it in the transformation
         config["encounter_reference_format"] = ".+" # e.g. Encounter/45, we will extract the encounter id from this reference and then use it in the transformation
 
+    config["transport"] = server.transport or "http"
+
     try:
         new_server = models.Server(
             system_id=server.system_id,
@@ -151,6 +174,7 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
         )
         db.add(new_server)
         db.commit()
+        response_cache.bump(response_cache.CONFIG)
         logger.info(f"Added server {server.name} successfully with IP {server.ip} and port {server.port}")
         return {"message": "Server added successfully"}
     except Exception as e:
@@ -159,7 +183,7 @@ async def add_server(server: AddUpdateServer, request: Request, response: Respon
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{str(e)}")
 
 @router.get("/all-servers", status_code=status.HTTP_200_OK, response_model=list[GetServer])
-def all_servers(db: Session = Depends(get_db)):
+def all_servers(request: Request, db: Session = Depends(get_db)):
     """
     Retrieve all registered servers in the Interface Engine.
 
@@ -174,17 +198,25 @@ def all_servers(db: Session = Depends(get_db)):
     - `protocol`: Messaging protocol (`"FHIR"` or `"HL7"`)
     - `category`: Server category (`"EHR"` or `"PHR"` or `"LIS"` or `"Payer"`)
     - `status`: Current health status (`"Active"` or `"Inactive"`)
+    - `transport`: How messages are delivered to the server (`"http"` or `"mllp"`)
 
     **Note:**
     - `status` is automatically updated every 60 seconds by the background health checker.
     - Returns an empty list if no servers are registered.
 
+    **Caching:** the response carries an `ETag`; a poll with `If-None-Match` gets `304 Not Modified`
+    until a server is added, changed or removed, or its status changes (see response_cache.py).
+
     **Error Responses:**
     - `400 Bad Request`: Unexpected database error
     """
+    return response_cache.respond(request, response_cache.CONFIG, "all-servers", lambda: _all_servers(db))
+
+
+def _all_servers(db: Session) -> bytes:
     try:
         servers = db.query(models.Server).all()
-        return servers
+        return _SERVER_LIST.dump_json(_SERVER_LIST.validate_python(servers, from_attributes=True))
     except Exception as e:
         logger.exception(f"Error retrieving all servers: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{str(e)}")
@@ -200,7 +232,7 @@ def specific_server(server_id: int, db: Session = Depends(get_db)):
 
     **Response (200 OK):**
     Returns the server record including:
-    - `server_id`, `name`, `ip`, `port`, `protocol`, `category`, `status`
+    - `server_id`, `name`, `ip`, `port`, `protocol`, `category`, `status`, `transport`
 
     **Error Responses:**
     - `404 Not Found`: No server exists with the given `server_id`
@@ -227,6 +259,7 @@ def update_server(server_id: int, server: AddUpdateServer, request: Request, res
     - `port` (int, required): Updated port number.
     - `protocol` (str, required): Updated messaging protocol (`"FHIR"` or `"HL7"`).
     - `category`: Server category (`"EHR"` or `"PHR"` or `"LIS"` or `"Payer"`)
+    - `transport` (str, optional): `"http"` or `"mllp"` (HL7 servers only). Left as it is when omitted.
 
     **Response (200 OK):**
     Returns a confirmation message:
@@ -238,6 +271,7 @@ def update_server(server_id: int, server: AddUpdateServer, request: Request, res
     **Error Responses:**
     - `404 Not Found`: No server exists with the given `server_id`
     - `409 Conflict`: Another server already has the requested name
+    - `400 Bad Request`: The server would keep `mllp` transport with a FHIR protocol
     - `400 Bad Request`: Unexpected database error
     """
     existing_server = db.query(models.Server).filter(models.Server.server_id == server_id).first()
@@ -249,6 +283,10 @@ def update_server(server_id: int, server: AddUpdateServer, request: Request, res
     if db.query(models.Server).filter(models.Server.server_id != server_id, models.Server.name == server.name).first():
         logger.exception(f"Attempt to update server id {server_id} with duplicate name: {server.name}")
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Server with this name already exists")
+
+    transport = server.transport or existing_server.transport
+    if transport == "mllp" and server.protocol != "HL7":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="mllp transport is only available for HL7 servers")
         
     try:
         existing_server.name = server.name
@@ -256,7 +294,9 @@ def update_server(server_id: int, server: AddUpdateServer, request: Request, res
         existing_server.port = server.port
         existing_server.protocol = server.protocol
         existing_server.category = server.category
+        existing_server.profile = {**(existing_server.profile or {}), "transport": transport}
         db.commit()
+        response_cache.bump(response_cache.CONFIG)
         logger.info(f"Updated server {existing_server.name} successfully")
         return {"message": "Server updated successfully"}
 
@@ -308,6 +348,7 @@ def delete_server(server_id: int, request: Request, response: Response, db: Sess
         logger.info(f"All endpoints and fields are deleted for server id {server_id} due to server deletion")
         db.delete(existing_server)
         db.commit()
+        response_cache.bump(response_cache.CONFIG)
         logger.info(f"Deleted server with id {server_id} successfully")
         return {"message": "Server deleted successfully"}
     
@@ -321,7 +362,8 @@ async def server_health():
 
     Runs an infinite loop, sleeping 30 seconds between each check. On each iteration it:
     1. Queries all servers from the database.
-    2. Hits `GET http://{ip}:{port}/health` for each server with a 5-second timeout.
+    2. Hits `GET http://{ip}:{port}/health` for each server with a 5-second timeout (MLLP
+       servers: opens a TCP connection to `ip:port`).
     3. Updates each server's `status` to `"Active"` or `"Inactive"` if it changed.
     4. Commits the changes to the database.
 
@@ -333,16 +375,23 @@ async def server_health():
         try:
                 db = session_local()
                 servers = db.query(models.Server).all()
+                status_changed = False
 
                 async with httpx.AsyncClient(verify=_SHARED_SSL_CONTEXT) as client:
                     for server in servers:
-                        is_alive= await server_health_check(client, server.ip, server.port, server.system_id)
+                        if (server.profile or {}).get("transport") == "mllp":
+                            is_alive, _ = await mllp.is_reachable(server.ip, server.port)
+                        else:
+                            is_alive= await server_health_check(client, server.ip, server.port, server.system_id)
                         new_status = 'Active' if is_alive else 'Inactive'
                         if server.status != new_status:
                             server.status = new_status
+                            status_changed = True
                             logger.info(f"Updated status for server {server.name} ({server.ip}:{server.port}) to {new_status}")
                 
                 db.commit()
+                if status_changed:
+                    response_cache.bump(response_cache.CONFIG)
         except Exception as exp:
             if db:
                 db.rollback()
@@ -397,64 +446,113 @@ async def add_server_reachability_check(client: httpx.AsyncClient, ip: str, port
     except Exception as exp:
         return False, f"unexpected error: {exp}"
 
+def build_connected_systems(db: Session) -> list[dict]:
+    """
+    Build the EHR -> connected labs/payers topology with ONE eager-loaded query.
+
+    Any active EHR→LIS route makes that lab "connected" (don't filter by msg_type: the EHR may
+    use multiple message types — orders, results, etc. — for the same lab). Same for payers.
+    Labs/payers are de-duplicated with a set and sorted, so the same topology always produces
+    the same payload (and the same content hash).
+    """
+    all_routes = (
+        db.query(models.Route)
+        .options(joinedload(models.Route.src_server), joinedload(models.Route.dest_server))
+        .all()
+    )
+
+    data_by_ehr: dict[str, dict[str, set[tuple[str, str]]]] = {}
+    for route in all_routes:
+        src_server = route.src_server
+        dest_server = route.dest_server
+
+        if not src_server or not dest_server:
+            continue
+        if src_server.category != "EHR" or dest_server.status != "Active":
+            continue
+
+        ehr_data = data_by_ehr.setdefault(src_server.system_id, {"labs": set(), "payers": set()})
+        if dest_server.category == "LIS":
+            ehr_data["labs"].add((dest_server.system_id, dest_server.name))
+        elif dest_server.category == "Payer":
+            ehr_data["payers"].add((dest_server.system_id, dest_server.name))
+
+    return [
+        {
+            "ehr_system_id": ehr_system_id,
+            "labs": [{"system_id": sid, "name": name} for sid, name in sorted(ehr_data["labs"])],
+            "payers": [{"system_id": sid, "name": name} for sid, name in sorted(ehr_data["payers"])],
+        }
+        for ehr_system_id, ehr_data in sorted(data_by_ehr.items())
+    ]
+
+
+def _topology_hash(data: list) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+# (ip, port) of an EHR host -> (content hash, monotonic time) of the last payload it accepted.
+_last_pushed: dict[tuple[str, int], tuple[str, float]] = {}
+
+
 async def get_lis_payer():
     """
-        create a list, that tells that from this ehr we can send data to this lab and this payer.
-        use to display the labs and payers in the ehr while adding patient, and visiting notes.
+    Publish the EHR -> connected labs/payers list to every registered EHR.
+
+    Every CONNECTED_SYSTEMS_INTERVAL_SECS the topology is rebuilt (one query) and split per EHR
+    host: several EHR system_ids can share one ip:port, and each host only gets the entries of the
+    EHRs registered on it. A host is only POSTed to when its payload's content hash differs from
+    the last one it accepted — i.e. when a route or a lab/payer status actually changed — or when
+    CONNECTED_SYSTEMS_RESYNC_SECS has passed (covers an EHR that restarted and lost its copy).
+    Pushes to different hosts run concurrently.
     """
     while True:
-        db = None
         try:
-            db = session_local()
-            all_routes = db.query(models.Route).all()
-            
-            data_by_ehr = {}
-            for route in all_routes:
-                src_server = route.src_server # takes the entire server data.
-                dest_server = route.dest_server
-                
-                if not src_server or not dest_server:
+            with session_local() as db:
+                data = build_connected_systems(db)
+                ehr_servers = db.query(models.Server).filter(models.Server.category == "EHR").all()
+
+            targets: dict[tuple[str, int], dict] = {}
+            for ehr in ehr_servers:
+                target = targets.setdefault((ehr.ip, ehr.port), {"system_ids": set(), "active": False})
+                target["system_ids"].add(ehr.system_id)
+                target["active"] = target["active"] or ehr.status == "Active"
+
+            # Forget hosts that were removed or went down so they get a fresh push when they return.
+            for host in list(_last_pushed):
+                if host not in targets or not targets[host]["active"]:
+                    _last_pushed.pop(host, None)
+
+            pushes = []
+            now = time.monotonic()
+            for (ip, port), target in targets.items():
+                if not target["active"]:
                     continue
-
-                if src_server.category != "EHR" or dest_server.status != "Active":
+                payload = [entry for entry in data if entry["ehr_system_id"] in target["system_ids"]]
+                content_hash = _topology_hash(payload)
+                last = _last_pushed.get((ip, port))
+                if last and last[0] == content_hash and now - last[1] < _CONNECTED_SYSTEMS_RESYNC_SECS:
                     continue
+                pushes.append((ip, port, payload, content_hash))
 
-                ehr_data = data_by_ehr.setdefault(src_server.system_id, {
-                    "ehr_system_id": src_server.system_id,
-                    "labs": [],
-                    "payers": []
-                })
-
-                # Any active EHR→LIS route makes that lab "connected" (don't filter by msg_type:
-                # the EHR may use multiple message types — orders, results, etc. — for the same lab).
-                if dest_server.category == "LIS":
-                    lab = {
-                        "system_id": dest_server.system_id,
-                        "name": dest_server.name
-                    }
-                    if lab not in ehr_data["labs"]:
-                        ehr_data["labs"].append(lab)
-
-                elif dest_server.category == "Payer":
-                    payer = {
-                        "system_id": dest_server.system_id,
-                        "name": dest_server.name
-                    }
-                    if payer not in ehr_data["payers"]:
-                        ehr_data["payers"].append(payer)
-
-            data = list(data_by_ehr.values())
-            async with httpx.AsyncClient(verify=_SHARED_SSL_CONTEXT) as client:
-                is_sent = await connected_systems_to_ehr(client, "127.0.0.1", 8001, data)
-                if is_sent:
-                    logger.info(
-                        "Sent connected systems to EHR: ehrs=%s labs=%s payers=%s",
-                        len(data),
-                        sum(len(e["labs"]) for e in data),
-                        sum(len(e["payers"]) for e in data),
-                    )
-                else:
-                    logger.error("Failed to send connected systems data to EHR")
+            if pushes:
+                async with httpx.AsyncClient(verify=_SHARED_SSL_CONTEXT) as client:
+                    results = await asyncio.gather(*(
+                        connected_systems_to_ehr(client, ip, port, payload, content_hash)
+                        for ip, port, payload, content_hash in pushes
+                    ))
+                for (ip, port, payload, content_hash), is_sent in zip(pushes, results):
+                    if is_sent:
+                        _last_pushed[(ip, port)] = (content_hash, now)
+                        logger.info(
+                            "Sent connected systems to EHR %s:%s: ehrs=%s labs=%s payers=%s hash=%s",
+                            ip, port, len(payload),
+                            sum(len(e["labs"]) for e in payload),
+                            sum(len(e["payers"]) for e in payload),
+                            content_hash[:12],
+                        )
+                    else:
+                        logger.error("Failed to send connected systems data to EHR %s:%s", ip, port)
 
         except asyncio.CancelledError:
             raise
@@ -462,32 +560,32 @@ async def get_lis_payer():
             # Background task — log and keep looping. Raising HTTPException here was a bug
             # (there's no HTTP context to handle it; it would kill the watcher).
             logger.exception(f"get_lis_payer iteration failed: {str(exp)}")
-        finally:
-            if db:
-                db.close()
-        
-        await asyncio.sleep(30) # update the data after every 30 seconds
+
+        await asyncio.sleep(_CONNECTED_SYSTEMS_INTERVAL_SECS)
     
-async def connected_systems_to_ehr(client, ip: str, port: int, data: list):
+async def connected_systems_to_ehr(client, ip: str, port: int, data: list, content_hash: str | None = None):
     """
-    Perform a single health check against a server's `/health` endpoint.
+    Push the connected labs/payers list to one EHR host.
 
-    Sends `POST http://{ip}:{port}/connected-labs-insuraces` with a 10-second timeout.
+    Sends `POST http://{ip}:{port}/connected-labs-insuraces` with a 10-second timeout. The payload's
+    content hash is sent as `X-Topology-Hash` so the receiver can tell versions apart.
 
     Args:
         client (httpx.AsyncClient): A shared async HTTP client.
         ip (str): Server IP address or hostname.
         port (int): Server port number.
+        data (list): Connected systems entries for the EHRs registered on this host.
+        content_hash (str | None): sha256 of the canonical JSON payload.
 
     Returns:
         bool: `True` if the server responds with HTTP 200, `False` for any error or non-200 response.
     """
+    headers = {"X-Topology-Hash": content_hash} if content_hash else None
     try:
-        response = await client.post(f"http://{ip}:{port}/connected-labs-insuraces", json=data, timeout=10)
+        response = await client.post(f"http://{ip}:{port}/connected-labs-insuraces", json=data, headers=headers, timeout=10)
         if response.status_code != 200:
             logger.warning(f"Failed to send connected systems data to EHR for {ip}:{port} with status code {response.status_code}")  
         return response.status_code == 200
     except:
         logger.error(f"Exception occurred while sending connected systems data to EHR for {ip}:{port}")
-        return False
-
+        return False
\ No newline at end of file
@@ -0,0 +1,155 @@
+"""
+Transform cost per message: the old per-message loop of route_worker vs MappingPlan batches.
+
+    cd InterfaceEngine && python -m benchmarks.batch_transform [--messages 2000] [--batch 32]
+
+A route with copy, map, format, regex, concat and split rules over an ADT-like message with
+a repeated segment, like a backlog being drained after redelivery or a batch release.
+"""
+import argparse
+import asyncio
+from collections import Counter
+import logging
+import time
+from types import SimpleNamespace
+
+from validation.date_format import DateFormatRule
+from validation.mapping_plan import MappingPlan
+from validation.transformation import compile_regex_rule, fill_duplicate_missing_values, increment_segment
+
+SRC_PATHS = {1: "PID-3", 2: "PID-5.1", 3: "PID-5.2", 4: "PID-7", 5: "PID-8", 6: "PID-11", 7: "NK1-2", 8: "NK1-3"}
+DEST_PATHS = {11: "Patient-identifier[0].value", 12: "Patient-name[0].given", 13: "Patient-name[0].family",
+              14: "Patient-birthDate", 15: "Patient-gender", 16: "Patient-address[0].line", 17: "Patient-address[0].city",
+              18: "Patient-contact[0].name.text", 19: "Patient-contact[0].relationship"}
+RULES = [
+    SimpleNamespace(mapping_rule_id=1, transform_type="regex", config={"from": r"MRN-\d+", "to": r"\d+"}, src_field_id=1, dest_field_id=11),
+    SimpleNamespace(mapping_rule_id=2, transform_type="copy", config={}, src_field_id=2, dest_field_id=12),
+    SimpleNamespace(mapping_rule_id=3, transform_type="copy", config={}, src_field_id=3, dest_field_id=13),
+    SimpleNamespace(mapping_rule_id=4, transform_type="format", config={"from": "%Y%m%d", "to": "%Y-%m-%d"}, src_field_id=4, dest_field_id=14),
+    SimpleNamespace(mapping_rule_id=5, transform_type="map", config={"m": "male", "f": "female"}, src_field_id=5, dest_field_id=15),
+    SimpleNamespace(mapping_rule_id=6, transform_type="split", config={"delimiter": "^"}, src_field_id=6, dest_field_id=16),
+    SimpleNamespace(mapping_rule_id=7, transform_type="split", config={"delimiter": "^"}, src_field_id=6, dest_field_id=17),
+    SimpleNamespace(mapping_rule_id=8, transform_type="concat", config={"delimiter": " "}, src_field_id=7, dest_field_id=18),
+    SimpleNamespace(mapping_rule_id=9, transform_type="concat", config={"delimiter": " "}, src_field_id=8, dest_field_id=18),
+    SimpleNamespace(mapping_rule_id=10, transform_type="copy", config={}, src_field_id=8, dest_field_id=19),
+]
+
+
+def message(i: int):
+    simple_paths = ["PID-3", "PID-5.1", "PID-5.2", "PID-7", "PID-8", "PID-11", "NK1-2", "NK1-3", "NK1-2", "NK1-3"]
+    src_path_to_value = {
+        "PID[1]-3": f"MRN-{i}", "PID[1]-5.1": f"Given{i}", "PID[1]-5.2": f"Family{i % 97}",
+        "PID[1]-7": f"19{50 + i % 50}{1 + i % 12:02d}{1 + i % 28:02d}", "PID[1]-8": "MF"[i % 2],
+        "PID[1]-11": f"{i} Main St^City{i % 13}", "NK1[1]-2": f"Kin{i}", "NK1[1]-3": "Spouse",
+        "NK1[2]-2": f"Other{i}", "NK1[2]-3": "Child",
+    }
+    return src_path_to_value, simple_paths
+
+
+async def per_message(src_path_to_value, simple_paths, regex_rules, format_rules):
+    """The transform stage of route_worker before batching, without its logging."""
+    normal_src_paths_counter, split_src_paths_counter, concat_src_paths_counter = [], [], []
+    simple_path_counts = Counter(simple_paths)
+    output_data, concat_data, split_data = {}, {}, {}
+    for rule in RULES:
+        if rule.transform_type == "concat":
+            concat_data.setdefault(rule.dest_field_id, []).append(rule)
+        elif rule.transform_type == "split":
+            split_data.setdefault(rule.src_field_id, []).append(rule)
+        else:
+            src_path = SRC_PATHS[rule.src_field_id]
+            for _ in range(simple_path_counts[src_path]):
+                src_path = await increment_segment(segment_path=src_path, list_data=normal_src_paths_counter)
+                normal_src_paths_counter.append(src_path)
+                if src_path not in src_path_to_value:
+                    continue
+                value = src_path_to_value[src_path]
+                if rule.transform_type == "map":
+                    value = rule.config.get(str(value).lower(), value)
+                elif rule.transform_type == "regex":
+                    pattern, replacement = regex_rules[rule.mapping_rule_id]
+                    value = pattern.sub(replacement, value)
+                elif rule.transform_type == "format":
+                    value = format_rules[rule.mapping_rule_id](value)
+                dest_path = await increment_segment(output_data=output_data, segment_path=DEST_PATHS[rule.dest_field_id])
+                output_data[dest_path] = value
+    for dest_id, concat_rules in concat_data.items():
+        multiple_src_paths_to_concat: dict[int, list[str]] = {}
+        delimiter = " "
+        for concat_rule in concat_rules:
+            delimiter = concat_rule.config.get("delimiter", " ")
+            src_path = SRC_PATHS[concat_rule.src_field_id]
+            for i in range(simple_path_counts[src_path]):
+                current_src_path = await increment_segment(segment_path=src_path, list_data=concat_src_paths_counter)
+                concat_src_paths_counter.append(current_src_path)
+                if current_src_path in src_path_to_value:
+                    multiple_src_paths_to_concat.setdefault(i, []).append(str(src_path_to_value[current_src_path]))
+        for values in multiple_src_paths_to_concat.values():
+            dest_path = await increment_segment(output_data=output_data, segment_path=DEST_PATHS[dest_id])
+            output_data[dest_path] = delimiter.join(values)
+    for src_id, split_rules in split_data.items():
+        for _ in range(simple_path_counts[SRC_PATHS[src_id]]):
+            src_path = await increment_segment(segment_path=SRC_PATHS[src_id], list_data=split_src_paths_counter)
+            split_src_paths_counter.append(src_path)
+            if src_path not in src_path_to_value:
+                continue
+            parts = str(src_path_to_value[src_path]).split(split_rules[0].config.get("delimiter", " "))
+            last_dest_path = None
+            for i, split_rule in enumerate(split_rules):
+                if i < len(parts):
+                    dest_path = await increment_segment(output_data=output_data, segment_path=DEST_PATHS[split_rule.dest_field_id])
+                    output_data[dest_path] = parts[i]
+                    last_dest_path = dest_path
+            if len(parts) > len(split_rules) and last_dest_path:
+                output_data[last_dest_path] += " " + (" ").join(parts[len(split_rules):])
+    return fill_duplicate_missing_values(output_data)
+
+
+async def run(args):
+    regex_rules = {r.mapping_rule_id: compile_regex_rule(r.config["from"], r.config["to"]) for r in RULES if r.transform_type == "regex"}
+    format_rules = {r.mapping_rule_id: DateFormatRule.from_config(r.config) for r in RULES if r.transform_type == "format"}
+    messages = [message(i) for i in range(args.messages)]
+
+    plan = MappingPlan("benchmark", RULES, SRC_PATHS, DEST_PATHS, regex_rules, format_rules)
+    batches = [messages[i:i + args.batch] for i in range(0, len(messages), args.batch)]
+    batched = [output for batch in batches for output in await plan.transform_batch(batch)]
+    for (src_path_to_value, simple_paths), output in zip(messages, batched):
+        assert output == await per_message(src_path_to_value, simple_paths, regex_rules, format_rules)
+
+    async def timed(label, coro_fn, baseline=None):
+        started = time.perf_counter()
+        await coro_fn()
+        per_message_us = (time.perf_counter() - started) / len(messages) * 1e6
+        speedup = f"  {baseline / per_message_us:5.1f}x" if baseline else ""
+        print(f"{label:<32} {per_message_us:8.1f} us/message{speedup}")
+        return per_message_us
+
+    async def old_loop():
+        for src_path_to_value, simple_paths in messages:
+            await per_message(src_path_to_value, simple_paths, regex_rules, format_rules)
+
+    async def plan_single():
+        for item in messages:
+            await plan.transform_batch([item])
+
+    async def plan_batched():
+        for batch in batches:
+            await plan.transform_batch(batch)
+
+    print(f"{args.messages} messages, {len(RULES)} rules, batch {args.batch}")
+    baseline = await timed("per-message loop (before)", old_loop)
+    await timed("MappingPlan, batch of 1", plan_single, baseline)
+    await timed(f"MappingPlan, batch of {args.batch}", plan_batched, baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
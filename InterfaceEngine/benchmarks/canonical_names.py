@@ -0,0 +1,99 @@
+"""
+Canonical-name resolution of a sample message's paths, as add_endpoint stores its fields:
+
+- before: resolve_canonical_name per path, with FHIR_EXACT_CANONICAL, HL7_EXACT_CANONICAL and a
+  scan of the FHIR_PATTERN_CANONICAL list, once per path (repeated paths included);
+- bulk: canonical_names over the path list (CANONICAL_BY_PATH, PATTERN_BY_SUFFIX and the
+  memoized canonical_name), as resolve_canonical_names calls it; cold cache and warm.
+
+    cd InterfaceEngine && python -m benchmarks.canonical_names [--entries 500] [--rounds 20]
+
+The sample is a results Bundle of one Patient and --entries Observations, so most paths repeat
+once per entry. The old resolver's warning calls are kept but their logger is disabled, so its
+numbers leave out the log file writes.
+"""
+import argparse
+import logging
+import time
+
+from benchmarks import fhir_stream
+from validation.fhir_validation import fhir_extract_paths
+from validation.mappings import (FHIR_EXACT_CANONICAL, FHIR_PATTERN_CANONICAL, HL7_EXACT_CANONICAL,
+                                 canonical_name, canonical_names)
+
+logger = logging.getLogger("benchmarks.canonical_names")
+logger.disabled = True
+
+
+def before(full_path: str) -> str | None:
+    """resolve_canonical_name before the compiled lookups."""
+    if full_path in FHIR_EXACT_CANONICAL:
+        return FHIR_EXACT_CANONICAL[full_path]
+
+    if full_path in HL7_EXACT_CANONICAL:
+        return HL7_EXACT_CANONICAL[full_path]
+
+    if "-" in full_path:
+        resource_type, suffix = full_path.split("-", 1)
+        for pattern, name_template in FHIR_PATTERN_CANONICAL:
+            if suffix == pattern:
+                return name_template.replace("{resource}", resource_type.lower())
+
+    logger.warning(f"No canonical mapping found for path {full_path}, skipping.")
+    return None
+
+
+def before_all(paths: list) -> dict:
+    endpoint_fields = {}
+    for path in paths:
+        name = before(path)
+        if not name:
+            continue
+        endpoint_fields[path] = name
+    return endpoint_fields
+
+
+def sample_paths(entries: int) -> list:
+    paths = []
+    for entry in fhir_stream.bundle(entries)["entry"]:
+        resource = entry["resource"]
+        paths.extend(f"{resource['resourceType']}-{p}" for p in fhir_extract_paths(resource))
+    return paths
+
+
+def bulk(paths: list) -> dict:
+    return canonical_names(paths)[0]
+
+
+def run(args):
+    paths = sample_paths(args.entries)
+    table_paths = list(FHIR_EXACT_CANONICAL) + list(HL7_EXACT_CANONICAL)
+    table_paths += [f"Observation-{pattern}" for pattern, _ in FHIR_PATTERN_CANONICAL]
+    print(f"{len(paths)} paths ({len(set(paths))} distinct); checked on {len(table_paths)} table paths")
+    assert bulk(table_paths) == before_all(table_paths)
+    assert bulk(paths) == before_all(paths)
+
+    def cold(paths):
+        canonical_name.cache_clear()
+        return bulk(paths)
+
+    timings = []
+    for label, resolve in (("before", before_all), ("bulk, cold", cold), ("bulk, warm", bulk)):
+        started = time.perf_counter()
+        for _ in range(args.rounds):
+            resolve(paths)
+        timings.append((time.perf_counter() - started) / args.rounds * 1e6)
+        speedup = f"  {timings[0] / timings[-1]:6.1f}x" if len(timings) > 1 else ""
+        print(f"{label:<12} {timings[-1]:10.1f} us/sample{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
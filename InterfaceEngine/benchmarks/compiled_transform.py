@@ -0,0 +1,91 @@
+"""
+Interpreted vs compiled MappingPlan transforms (ROUTE_TRANSFORM_BACKEND), per route.
+
+    cd InterfaceEngine && python -m benchmarks.compiled_transform [--messages 5000] [--batch 32]
+
+Routes are modelled on the simulator's channels (their rules live in the engine database):
+- ADT: EHR patient registration, FHIR -> HL7 ADT for the LIS/Payer (copy, map, format, regex,
+  concat, split), see benchmarks/batch_transform.py
+- ORU: LIS results, HL7 ORU^R01 with repeated OBX -> FHIR Observations for the EHR (copy, map,
+  format on every OBX)
+"""
+import argparse
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+from benchmarks import batch_transform
+from validation.date_format import DateFormatRule
+from validation.mapping_plan import MappingPlan
+from validation.transformation import compile_regex_rule
+
+ORU_SRC_PATHS = {1: "PID-3", 2: "OBR-4", 3: "OBX-3", 4: "OBX-5", 5: "OBX-6", 6: "OBX-8", 7: "OBX-14", 8: "OBR-2"}
+ORU_DEST_PATHS = {11: "Patient-identifier[0].value", 12: "DiagnosticReport-code.text", 13: "Observation-code.text",
+                  14: "Observation-valueQuantity.value", 15: "Observation-valueQuantity.unit",
+                  16: "Observation-interpretation[0].text", 17: "Observation-effectiveDateTime", 18: "DiagnosticReport-identifier[0].value"}
+ORU_RULES = [
+    SimpleNamespace(mapping_rule_id=21, transform_type="copy", config={}, src_field_id=1, dest_field_id=11),
+    SimpleNamespace(mapping_rule_id=22, transform_type="copy", config={}, src_field_id=2, dest_field_id=12),
+    SimpleNamespace(mapping_rule_id=23, transform_type="copy", config={}, src_field_id=3, dest_field_id=13),
+    SimpleNamespace(mapping_rule_id=24, transform_type="copy", config={}, src_field_id=4, dest_field_id=14),
+    SimpleNamespace(mapping_rule_id=25, transform_type="copy", config={}, src_field_id=5, dest_field_id=15),
+    SimpleNamespace(mapping_rule_id=26, transform_type="map", config={"h": "High", "l": "Low", "n": "Normal"}, src_field_id=6, dest_field_id=16),
+    SimpleNamespace(mapping_rule_id=27, transform_type="format", config={"from": "%Y%m%d%H%M%S", "to": "%Y-%m-%dT%H:%M:%S"}, src_field_id=7, dest_field_id=17),
+    SimpleNamespace(mapping_rule_id=28, transform_type="copy", config={}, src_field_id=8, dest_field_id=18),
+]
+OBX_PER_MESSAGE = 8
+
+
+def oru_message(i: int):
+    simple_paths = ["PID-3", "OBR-2", "OBR-4"] + ["OBX-3", "OBX-5", "OBX-6", "OBX-8", "OBX-14"] * OBX_PER_MESSAGE
+    src_path_to_value = {"PID[1]-3": f"MRN{i}", "OBR[1]-2": f"ORD{i}", "OBR[1]-4": "CBC"}
+    for n in range(1, OBX_PER_MESSAGE + 1):
+        src_path_to_value.update({
+            f"OBX[{n}]-3": f"TEST{n}", f"OBX[{n}]-5": f"{(i * n) % 200 / 10}", f"OBX[{n}]-6": "g/dL",
+            f"OBX[{n}]-8": "HLN"[(i + n) % 3], f"OBX[{n}]-14": f"2025{1 + i % 12:02d}{1 + n:02d}0930{n:02d}",
+        })
+    return src_path_to_value, simple_paths
+
+
+def _plan(name, rules, src_paths, dest_paths, compile_transforms):
+    regex_rules = {r.mapping_rule_id: compile_regex_rule(r.config["from"], r.config["to"]) for r in rules if r.transform_type == "regex"}
+    format_rules = {r.mapping_rule_id: DateFormatRule.from_config(r.config) for r in rules if r.transform_type == "format"}
+    return MappingPlan(name, rules, src_paths, dest_paths, regex_rules, format_rules, compile_transforms=compile_transforms)
+
+
+async def run(args):
+    routes = [
+        ("ADT", batch_transform.RULES, batch_transform.SRC_PATHS, batch_transform.DEST_PATHS, batch_transform.message),
+        ("ORU", ORU_RULES, ORU_SRC_PATHS, ORU_DEST_PATHS, oru_message),
+    ]
+    print(f"{args.messages} messages per route, batch {args.batch}; messages/second")
+    print(f"{'route':<6} {'batch':>6} {'interpreted':>12} {'compiled':>10}")
+    for name, rules, src_paths, dest_paths, make_message in routes:
+        messages = [make_message(i) for i in range(args.messages)]
+        interpreted = _plan(name, rules, src_paths, dest_paths, False)
+        compiled = _plan(name, rules, src_paths, dest_paths, True)
+        assert await interpreted.transform_batch(messages) == await compiled.transform_batch(messages)
+
+        for batch_size in (1, args.batch):
+            batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+            rates = []
+            for plan in (interpreted, compiled):
+                started = time.perf_counter()
+                for batch in batches:
+                    await plan.transform_batch(batch)
+                rates.append(len(messages) / (time.perf_counter() - started))
+            print(f"{name:<6} {batch_size:>6} {rates[0]:>12,.0f} {rates[1]:>10,.0f}  {rates[1] / rates[0]:4.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-call cost of `format` rules: strptime/strftime with the old exception-driven fallback vs a
+compiled DateFormatRule.
+
+    cd InterfaceEngine && python -m benchmarks.date_format [--calls 200000] [--distinct 5000]
+
+`--distinct` distinct input values are cycled; the compiled rule is also timed with its
+result cache disabled (every value new) to show the parser/formatter on their own.
+"""
+import argparse
+from datetime import datetime, timedelta
+import time
+
+from validation import date_format
+from validation.date_format import DateFormatRule
+
+CASES = [
+    ("FHIR date -> HL7", "%Y-%m-%d", "%Y%m%d", "{:%Y-%m-%d}"),
+    ("HL7 timestamp -> FHIR", "%Y%m%d%H%M%S", "%Y-%m-%dT%H:%M:%S", "{:%Y%m%d%H%M%S}"),
+    ("FHIR instant -> HL7", "%Y-%m-%dT%H:%M:%S%z", "%Y%m%d%H%M%S", "{:%Y-%m-%dT%H:%M:%S}+05:00"),
+    ("fallback (DB timestamp)", "%Y-%m-%d", "%Y%m%d", "{:%Y-%m-%d %H:%M:%S}"),
+]
+
+
+def old_format(value, from_format: str, to_format: str):
+    """The format transform as route_worker ran it before rules were compiled."""
+    try:
+        return datetime.strptime(str(value), from_format).strftime(to_format)
+    except Exception:
+        try:
+            return datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S").strftime(to_format)
+        except ValueError:
+            return value
+
+
+def _time(fn, values) -> float:
+    started = time.perf_counter()
+    for value in values:
+        fn(value)
+    return (time.perf_counter() - started) / len(values) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200_000)
+    parser.add_argument("--distinct", type=int, default=1000)
+    args = parser.parse_args()
+
+    start = datetime(1950, 1, 1, 8, 30, 15)
+    print(f"{'case':<26} {'strptime':>10} {'compiled':>10} {'no cache':>10}   us/call")
+    for label, from_format, to_format, value_format in CASES:
+        distinct = [value_format.format(start + timedelta(days=i, seconds=i * 37)) for i in range(args.distinct)]
+        values = [distinct[i % len(distinct)] for i in range(args.calls)]
+
+        rule = DateFormatRule(from_format, to_format)
+        uncached = DateFormatRule(from_format, to_format)
+        uncached._convert_cached = uncached._convert # measure the fast paths alone
+        for value in distinct:
+            assert rule(value) == old_format(value, from_format, to_format), (label, value)
+
+        old = _time(lambda v: old_format(v, from_format, to_format), values)
+        compiled = _time(rule, values)
+        no_cache = _time(uncached, values)
+        print(f"{label:<26} {old:10.3f} {compiled:10.3f} {no_cache:10.3f}   ({old / no_cache:.1f}x without cache)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+FHIR message build cost: the step-by-step build (regex per path, _set_nested per value) vs
+FHIRMessageTemplate.
+
+    cd InterfaceEngine && python -m benchmarks.fhir_build [--messages 5000] [--observations 8]
+
+A Bundle like the one an LIS results route sends to the EHR: a Patient, a DiagnosticReport and
+one Observation per OBX, as output_data after set_null_if_not_available.
+"""
+import argparse
+import json
+import time
+
+from validation.fhir_validation import FHIRMessageTemplate, _build_resources, _bundle
+
+DEST_PATH_TO_RESOURCE = {
+    "Patient-identifier[0].value": "Patient", "Patient-name[0].family": "Patient", "Patient-name[0].given": "Patient",
+    "Patient-birthDate": "Patient", "Patient-gender": "Patient",
+    "DiagnosticReport-identifier[0].value": "DiagnosticReport", "DiagnosticReport-code.text": "DiagnosticReport",
+    "DiagnosticReport-status": "DiagnosticReport",
+    "Observation-code.coding[0].code": "Observation", "Observation-code.text": "Observation",
+    "Observation-valueQuantity.value": "Observation", "Observation-valueQuantity.unit": "Observation",
+    "Observation-interpretation[0].text": "Observation", "Observation-effectiveDateTime": "Observation",
+    "Observation-status": "Observation",
+}
+
+
+def output_data(i: int, observation_count: int) -> dict:
+    data = {
+        "Patient[1]-identifier[0].value": f"MRN{i}", "Patient[1]-name[0].family": f"Family{i % 97}",
+        "Patient[1]-name[0].given": f"Given{i}", "Patient[1]-birthDate": f"19{50 + i % 50}-01-01", "Patient[1]-gender": "male",
+        "DiagnosticReport[1]-identifier[0].value": f"ORD{i}", "DiagnosticReport[1]-code.text": "CBC",
+        "DiagnosticReport[1]-status": None,
+    }
+    for n in range(1, observation_count + 1):
+        data.update({
+            f"Observation[{n}]-code.coding[0].code": f"TEST{n}", f"Observation[{n}]-code.text": f"Test {n}",
+            f"Observation[{n}]-valueQuantity.value": f"{(i * n) % 200 / 10}", f"Observation[{n}]-valueQuantity.unit": "g/dL",
+            f"Observation[{n}]-interpretation[0].text": "High", f"Observation[{n}]-effectiveDateTime": "2025-01-01T09:30:00",
+            f"Observation[{n}]-status": "final",
+        })
+    return data
+
+
+def run(args):
+    messages = [output_data(i, args.observations) for i in range(args.messages)]
+    template = FHIRMessageTemplate(DEST_PATH_TO_RESOURCE)
+    step_by_step = lambda data: _bundle(_build_resources(data.items(), DEST_PATH_TO_RESOURCE))
+    without_id = lambda bundle: json.dumps(dict(bundle, id=None))
+    for data in messages[:100]:
+        assert without_id(step_by_step(data)) == without_id(template.build(data))
+
+    print(f"{args.messages} messages, {len(messages[0])} output paths ({args.observations} Observations)")
+    timings = []
+    for label, build in (("step by step (before)", step_by_step), ("FHIRMessageTemplate", template.build)):
+        started = time.perf_counter()
+        for data in messages:
+            build(data)
+        timings.append((time.perf_counter() - started) / len(messages) * 1e6)
+        speedup = f"  {timings[0] / timings[-1]:5.1f}x" if len(timings) > 1 else ""
+        print(f"{label:<22} {timings[-1]:8.1f} us/message{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--observations", type=int, default=8)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
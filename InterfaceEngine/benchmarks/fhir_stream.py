@@ -0,0 +1,125 @@
+"""
+Ingest cost of a large results Bundle, from the body to the extracted paths and values:
+
+- before: the whole body decoded, and each path numbered with increment_segment against all the
+  paths so far (grows with the square of the path count; keep --entries in the hundreds);
+- whole body: the same with the occurrence counters _process_message now uses;
+- fhir_stream: read_bundle over the body in 64 KB chunks, keeping the mapped fields only.
+
+    cd InterfaceEngine && python -m benchmarks.fhir_stream [--entries 200] [--mapped 4]
+    python -m benchmarks.fhir_stream --entries 20000 --no-before   # whole body vs stream at size
+
+Peak memory is what tracemalloc sees allocated on top of the body bytes, in a second run.
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import json_codec
+from validation import fhir_stream
+from validation.fhir_validation import fhir_extract_paths, get_fhir_value_by_path
+from validation.transformation import increment_segment
+
+CHUNK_BYTES = 64 * 1024
+
+
+def bundle(entries: int) -> dict:
+    entry = [{"resource": {"resourceType": "Patient", "identifier": [{"value": "MRN1"}],
+                           "name": [{"family": "Family", "given": ["Given"]}], "gender": "female"}}]
+    for n in range(entries):
+        entry.append({"fullUrl": f"urn:uuid:{n:08d}", "resource": {
+            "resourceType": "Observation", "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": f"{n % 900}-{n % 9}", "display": f"Test {n}"}], "text": f"Test {n}"},
+            "valueQuantity": {"value": n / 10, "unit": "g/dL", "system": "http://unitsofmeasure.org", "code": "g/dL"},
+            "referenceRange": [{"low": {"value": 1.0}, "high": {"value": 9.0}, "text": "1-9"}],
+            "interpretation": [{"text": "High"}], "effectiveDateTime": "2025-01-01T09:30:00Z",
+            "note": [{"text": "Specimen received in good condition. " * 4}],
+        }})
+    return {"resourceType": "Bundle", "type": "collection", "identifier": {"value": "EHR-1"}, "entry": entry}
+
+
+async def before(body: bytes):
+    """`req.json()` and the whole-Bundle extraction of _process_message before streaming."""
+    payload = json_codec.loads(body)
+    simple_paths, paths, bundle_path_to_resource = [], [], {}
+    for entry in payload.get("entry", []):
+        resource = entry.get("resource", {})
+        res_type = resource.get("resourceType", "Unknown")
+        for p in fhir_extract_paths(resource):
+            full_path = f"{res_type}-{p}"
+            simple_paths.append(full_path)
+            full_path = await increment_segment(segment_path=full_path, list_data=paths)
+            paths.append(full_path)
+            bundle_path_to_resource[full_path] = resource
+    return simple_paths, {path: get_fhir_value_by_path(obj=bundle_path_to_resource[path], path=path) for path in paths}
+
+
+async def whole(body: bytes):
+    """The same, with the paths numbered by occurrence counters."""
+    payload = json_codec.loads(body)
+    simple_paths, paths, bundle_path_to_resource, occurrences = [], [], {}, {}
+    for entry in payload.get("entry", []):
+        resource = entry.get("resource", {})
+        res_type = resource.get("resourceType", "Unknown")
+        for p in fhir_extract_paths(resource):
+            full_path = f"{res_type}-{p}"
+            simple_paths.append(full_path)
+            occurrence = occurrences[full_path] = occurrences.get(full_path, 0) + 1
+            full_path = f"{res_type}[{occurrence}]-{p}"
+            paths.append(full_path)
+            bundle_path_to_resource[full_path] = resource
+    return simple_paths, {path: get_fhir_value_by_path(obj=bundle_path_to_resource[path], path=path) for path in paths}
+
+
+async def streamed(body: bytes, wanted_paths: set):
+    async def chunks():
+        for start in range(0, len(body), CHUNK_BYTES):
+            yield body[start:start + CHUNK_BYTES]
+    return await fhir_stream.read_bundle(chunks(), wanted_paths)
+
+
+async def run(args):
+    body = json.dumps(bundle(args.entries)).encode("utf-8")
+    wanted_paths = {"Patient-identifier[0].value", "Patient-name[0].family", "Observation-code.coding[0].code",
+                    "Observation-valueQuantity.value", "Observation-valueQuantity.unit", "Observation-status"}
+    wanted_paths = set(sorted(wanted_paths)[:args.mapped])
+    print(f"Bundle of {args.entries + 1} entries, {len(body) / 1e6:.1f} MB; {len(wanted_paths)} mapped fields")
+
+    simple_paths, values = await whole(body)
+    if not args.no_before:
+        assert (simple_paths, values) == await before(body)
+    result = await streamed(body, wanted_paths)
+    assert result.simple_paths == [path for path in simple_paths if path in wanted_paths]
+    assert result.src_path_to_value == {path: value for path, value in values.items() if path in result.src_path_to_value}
+    assert len(result.src_path_to_value) == len(result.simple_paths)
+
+    timings = []
+    extracts = [("before", lambda: before(body))] if not args.no_before else []
+    extracts += [("whole body", lambda: whole(body)), ("fhir_stream", lambda: streamed(body, wanted_paths))]
+    for label, extract in extracts:
+        started = time.perf_counter()
+        await extract()
+        timings.append(time.perf_counter() - started)
+        peak = ""
+        if label != "before":
+            tracemalloc.start()
+            await extract()
+            peak = f"  peak {tracemalloc.get_traced_memory()[1] / 1e6:6.1f} MB"
+            tracemalloc.stop()
+        speedup = f"  {timings[0] / timings[-1]:6.1f}x" if len(timings) > 1 else ""
+        print(f"{label:<12} {timings[-1] * 1000:9.1f} ms{peak}{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--mapped", type=int, default=4)
+    parser.add_argument("--no-before", action="store_true", help="skip the quadratic numbering")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
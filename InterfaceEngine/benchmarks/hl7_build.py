@@ -0,0 +1,135 @@
+"""
+HL7 message build cost: build_hl7_message before templating vs HL7MessageTemplate.
+
+    cd InterfaceEngine && python -m benchmarks.hl7_build [--messages 5000] [--obx 8]
+
+An ORU^R01-like output_data (PID, PV1, OBR and repeated OBX with components and
+subcomponents), as a route from the EHR to the LIS builds it. The old builder's per-field log
+calls are kept but their logger is disabled, so its numbers leave out the log file writes.
+"""
+import argparse
+from datetime import datetime
+import logging
+import re
+import time
+from uuid import uuid4
+
+from validation.hl7_validation import HL7MessageTemplate
+
+logger = logging.getLogger("benchmarks.hl7_build")
+logger.disabled = True
+
+
+def output_data(i: int, obx_count: int) -> dict:
+    data = {
+        "PID[1]-3": f"MRN{i}", "PID[1]-5.1": f"Family{i % 97}", "PID[1]-5.2": f"Given{i}",
+        "PID[1]-7": f"19{50 + i % 50}0101", "PID[1]-8": "MF"[i % 2], "PID[1]-3.4.1": "HOSP",
+        "PV1[1]-2": "O", "PV1[1]-3": f"Ward{i % 7}",
+        "OBR[1]-2": f"ORD{i}", "OBR[1]-4.1": "CBC", "OBR[1]-4.2": "Complete blood count",
+        "PID[1]-11": None, # mapped but absent in the source, as set_null_if_not_available leaves it
+    }
+    for n in range(1, obx_count + 1):
+        data.update({
+            f"OBX[{n}]-2": "NM", f"OBX[{n}]-3.1": f"TEST{n}", f"OBX[{n}]-3.2": f"Test {n}",
+            f"OBX[{n}]-5": f"{(i * n) % 200 / 10}", f"OBX[{n}]-6": "g/dL", f"OBX[{n}]-8": "HLN"[(i + n) % 3],
+            f"OBX[{n}]-14": f"20250101093{n % 10}00",
+        })
+    return data
+
+
+def before(output_data: dict, src: str, dest: str, msg_type: str) -> str:
+    """build_hl7_message before templating."""
+    logger.info(f"Building HL7 message with src: {src}, dest: {dest}, msg_type: {msg_type}, output_data keys: {list(output_data.keys())}")
+    msh = f"MSH|^~\\&|{src}||{dest}||{datetime.now().strftime('%Y%m%d%H%M%S')}||{msg_type}|MSG{uuid4()}|P|2.5"
+    seg_data = {}
+    for path, value in output_data.items():
+        if value is None:
+            continue
+        path_core = (path.split("-", 1)[1] if not path.split("-")[0].isupper() else path) if path.count("-") >= 1 else path
+        parts = re.split(r"-|\.", path_core)
+        if len(parts) < 2:
+            continue
+        seg_match = re.fullmatch(r"([A-Z0-9]{2,})(?:\[(\d+)\])?", parts[0].upper())
+        if not seg_match:
+            continue
+        occurrence = int(seg_match.group(2)) if seg_match.group(2) else 1
+        try:
+            field = int(parts[1])
+        except ValueError:
+            continue
+        comp = int(parts[2]) if len(parts) > 2 else 1
+        sub = int(parts[3]) if len(parts) > 3 else 1
+        seg_data.setdefault(seg_match.group(1), {}).setdefault(occurrence, {}).setdefault(field, {}).setdefault(comp, {})[sub] = str(value)
+    logger.debug(f"Segment data structure after parsing output_data: {seg_data}")
+
+    order = ["EVN", "PID", "PD1", "NK1", "PV1", "PV2", "IN1", "IN2", "IN3", "GT1", "AL1", "DG1", "PR1",
+             "ORC", "OBR", "OBX", "NTE", "RXO", "RXE", "RXR", "RXC", "FT1", "ZPD"]
+    have_set = ["PID", "NK1", "PV1", "IN1", "IN3", "GT1", "AL1", "DG1", "PR1", "OBR", "OBX", "NTE", "FT1"]
+
+    def seg_sort_key(seg_name):
+        try:
+            return order.index(seg_name)
+        except ValueError:
+            return len(order)
+
+    lines = [msh]
+    for seg_name in sorted(seg_data.keys(), key=seg_sort_key):
+        logger.info(f"segment {seg_name}")
+        for occ in sorted(seg_data[seg_name].keys()):
+            fields_map = seg_data[seg_name][occ]
+            field_strs = []
+            for f_idx in range(1, max(fields_map.keys()) + 1):
+                if f_idx not in fields_map:
+                    field_strs.append("")
+                    continue
+                comp_map = fields_map[f_idx]
+                max_comp = max(comp_map.keys())
+                logger.info(f"Processing field index {f_idx}")
+                comp_strs = []
+                for c_idx in range(1, max_comp + 1):
+                    if c_idx not in comp_map:
+                        comp_strs.append("")
+                        continue
+                    sub_map = comp_map[c_idx]
+                    max_sub = max(sub_map.keys())
+                    logger.info(f"Processing component index {c_idx}")
+                    comp_strs.append(sub_map[1] if max_sub == 1 else "&".join(sub_map.get(s, "") for s in range(1, max_sub + 1)))
+                field_strs.append("^".join(comp_strs) if max_comp > 1 else comp_strs[0])
+            if min(fields_map.keys()) > 1 and seg_name in have_set:
+                line = f"{seg_name}|" + str(occ) + "|".join(field_strs)
+            else:
+                line = f"{seg_name}|" + "|".join(field_strs)
+            logger.info(f"appending line {line}")
+            lines.append(line)
+    return "\r\n".join(lines)
+
+
+def run(args):
+    messages = [output_data(i, args.obx) for i in range(args.messages)]
+    template = HL7MessageTemplate("EHR", "LIS", "ORU^R01")
+    strip_msh = lambda msg: msg.split("\r\n", 1)[1]
+    for data in messages[:100]:
+        assert strip_msh(before(data, "EHR", "LIS", "ORU^R01")) == strip_msh(template.build(data))
+
+    print(f"{args.messages} messages, {len(messages[0])} output paths ({args.obx} OBX)")
+    timings = []
+    for label, build in (("before", lambda data: before(data, "EHR", "LIS", "ORU^R01")),
+                         ("HL7MessageTemplate", template.build)):
+        started = time.perf_counter()
+        for data in messages:
+            build(data)
+        timings.append((time.perf_counter() - started) / len(messages) * 1e6)
+        speedup = f"  {timings[0] / timings[-1]:5.1f}x" if len(timings) > 1 else ""
+        print(f"{label:<20} {timings[-1]:8.1f} us/message{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--obx", type=int, default=8)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+JSON cost per delivered FHIR message: before (req.json(), httpx json=, json.dumps for the log
+record) vs json_codec (decode the body, encode the message once, log its text).
+
+    cd InterfaceEngine && python -m benchmarks.json_codec [--messages 2000]
+    JSON_CODEC=stdlib python -m benchmarks.json_codec   # the codec without a fast backend
+
+The message is the Bundle of benchmarks/fhir_build.py (Patient, DiagnosticReport, 8 Observations).
+"""
+import argparse
+import json
+import time
+
+from httpx._content import encode_json
+
+import json_codec
+from benchmarks.fhir_build import DEST_PATH_TO_RESOURCE, output_data
+from validation.fhir_validation import FHIRMessageTemplate
+
+
+def run(args):
+    template = FHIRMessageTemplate(DEST_PATH_TO_RESOURCE)
+    messages = [template.build(output_data(i, 8)) for i in range(args.messages)]
+    bodies = [json.dumps(message).encode("utf-8") for message in messages]
+    assert json_codec.loads(json_codec.dumps(messages[0])) == messages[0]
+
+    def before():
+        for body in bodies:
+            message = json.loads(body) # Request.json()
+            encode_json(message) # client.post(json=message)
+            json.dumps(message) # "src_message"
+            json.dumps(message) # "dest_message"
+
+    def codec():
+        for body in bodies:
+            message = json_codec.loads(body)
+            encoded = json_codec.dumps(message) # sent with content=
+            encoded.decode("utf-8") # "dest_message"
+            json_codec.dumps_str(message) # "src_message"
+
+    print(f"{args.messages} messages of {len(bodies[0])} bytes, JSON_CODEC backend: {json_codec.BACKEND}")
+    timings = []
+    for label, fn in (("before", before), ("json_codec", codec)):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) / args.messages * 1e6)
+        speedup = f"  {timings[0] / timings[-1]:5.1f}x" if len(timings) > 1 else ""
+        print(f"{label:<12} {timings[-1]:8.1f} us/message{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
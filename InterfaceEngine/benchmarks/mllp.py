@@ -0,0 +1,85 @@
+"""
+HL7 delivery cost over loopback: an HTTP POST per message (httpx, as route workers send to
+HTTP destinations) vs MLLPClient on a pooled connection, each answered by a local receiver.
+
+    cd InterfaceEngine && python -m benchmarks.mllp [--messages 2000]
+
+The message is the ORU^R01 of benchmarks/hl7_build.py. The HTTP receiver is a bare asyncio
+server answering 200 (keep-alive), the MLLP one mllp's own listener answering AA, so the
+numbers are the transports' overhead rather than a web framework's.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+import mllp
+from benchmarks.hl7_build import output_data
+from validation.hl7_validation import HL7MessageTemplate
+
+HTTP_PORT = 18575
+MLLP_PORT = 12575
+
+
+async def _http_receiver(reader, writer):
+    while True:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            break
+        length = next(int(line.split(b":")[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length"))
+        await reader.readexactly(length)
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: 0\r\n\r\n")
+        await writer.drain()
+    writer.close()
+
+
+async def _accept(system_id, endpoint, message):
+    pass
+
+
+async def run(args):
+    template = HL7MessageTemplate("EHR", "LIS", "ORU^R01")
+    messages = [template.build(output_data(i, 8)) for i in range(args.messages)]
+    http_server = await asyncio.start_server(_http_receiver, "127.0.0.1", HTTP_PORT)
+    mllp.MLLP_HOST = "127.0.0.1"
+    mllp_servers = await mllp.start_listeners({MLLP_PORT: {"system_id": "LIS", "endpoint": "/results"}}, _accept)
+
+    async with httpx.AsyncClient() as client:
+        async def http_post():
+            for message in messages:
+                response = await client.post(f"http://127.0.0.1:{HTTP_PORT}/results", content=message,
+                                             headers={"Content-Type": "text/plain"})
+                assert response.status_code == 200
+
+        mllp_client = mllp.MLLPClient("127.0.0.1", MLLP_PORT)
+
+        async def mllp_send():
+            for message in messages:
+                assert (await mllp_client.send(message)).accepted
+
+        print(f"{args.messages} messages of {len(messages[0])} bytes, sent one after another")
+        timings = []
+        for label, send in (("HTTP POST", http_post), ("MLLP (pooled)", mllp_send)):
+            started = time.perf_counter()
+            await send()
+            timings.append((time.perf_counter() - started) / args.messages * 1e6)
+            speedup = f"  {timings[0] / timings[-1]:5.1f}x" if len(timings) > 1 else ""
+            print(f"{label:<14} {timings[-1]:8.1f} us/message{speedup}")
+        mllp_client.close()
+
+    http_server.close()
+    for server in mllp_servers:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
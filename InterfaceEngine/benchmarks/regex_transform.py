@@ -0,0 +1,63 @@
+"""
+Per-call cost of regex mapping rules: the old uncompiled path vs the LRU and per-worker compiled rules.
+
+    cd InterfaceEngine && python -m benchmarks.regex_transform [--rules 1000] [--calls 200000]
+
+`--rules` distinct (from, to) pairs are applied round-robin, like a busy engine with many
+regex rules. Above re's internal cache size (512) the uncompiled path recompiles constantly.
+"""
+import argparse
+import re
+import time
+
+from validation.transformation import compile_regex_rule, regex_replace_with_template
+
+_COMMON_PATTERNS = [r"\d+", r"\d", r"\w+", r"\w", r".*", r".+", r"[^/]+", r"[^\s]+"]
+
+
+def uncompiled_replace(value: str, pattern_from: str, pattern_to: str) -> str:
+    """regex_replace_with_template as it was before rules were compiled."""
+    captured_pattern = None
+    for regex_pattern in _COMMON_PATTERNS:
+        if regex_pattern in pattern_from:
+            captured_pattern = regex_pattern
+            break
+    if not captured_pattern:
+        return re.sub(pattern=pattern_from, repl=pattern_to, string=value)
+    pattern_from_captured = pattern_from.replace(captured_pattern, f"({captured_pattern})", 1)
+    replacement_template = pattern_to.replace(captured_pattern, r"\1", 1)
+    return re.sub(pattern=pattern_from_captured, repl=replacement_template, string=value)
+
+
+def _time(label: str, fn, calls: int, baseline: float | None = None) -> float:
+    started = time.perf_counter()
+    fn()
+    per_call = (time.perf_counter() - started) / calls * 1e6
+    speedup = f"  {baseline / per_call:5.1f}x" if baseline else ""
+    print(f"{label:<28} {per_call:8.3f} us/call{speedup}")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rules = [(f"patient{i}/\\d+", f"\\d+") for i in range(args.rules)]
+    values = [f"patient{i}/{i * 7}" for i in range(args.rules)]
+    work = [(values[i % args.rules], *rules[i % args.rules]) for i in range(args.calls)]
+    compiled = [compile_regex_rule(*rule) for rule in rules]
+    compiled_work = [(values[i % args.rules], compiled[i % args.rules]) for i in range(args.calls)]
+
+    for value, pattern_from, pattern_to in work[:args.rules]:
+        assert uncompiled_replace(value, pattern_from, pattern_to) == regex_replace_with_template(value, pattern_from, pattern_to)
+
+    print(f"{args.rules} rules, {args.calls} calls")
+    baseline = _time("uncompiled re.sub", lambda: [uncompiled_replace(*w) for w in work], args.calls)
+    _time("regex_replace_with_template", lambda: [regex_replace_with_template(*w) for w in work], args.calls, baseline)
+    _time("compiled rule (worker)", lambda: [p.sub(r, v) for v, (p, r) in compiled_work], args.calls, baseline)
+
+
+if __name__ == "__main__":
+    main()
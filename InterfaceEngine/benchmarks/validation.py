@@ -0,0 +1,71 @@
+"""
+Validation cost per message, by tier: full (fhir.resources models / hl7apy strict parse) vs
+structural (the compiled validators of validation/structural.py).
+
+    cd InterfaceEngine && python -m benchmarks.validation [--messages 200] [--observations 8]
+
+FHIR: a results Bundle (Patient, DiagnosticReport, --observations Observations). HL7: the
+ORU^R01 of benchmarks/hl7_build.py with OBX-11 set. Both messages are valid, so every tier does
+all of its checks; the first message of each tier, which compiles its validators, is not timed.
+"""
+import argparse
+import time
+
+from benchmarks import hl7_build
+from validation import structural
+from validation.hl7_validation import HL7MessageTemplate
+
+
+def fhir_message(i: int, observations: int) -> dict:
+    entry = [
+        {"fullUrl": "urn:uuid:patient", "resource": {
+            "resourceType": "Patient", "identifier": [{"system": "urn:mrn", "value": f"MRN{i}"}],
+            "name": [{"family": f"Family{i % 97}", "given": [f"Given{i}"]}], "gender": "female", "birthDate": "1951-01-01"}},
+        {"resource": {
+            "resourceType": "DiagnosticReport", "status": "final", "identifier": [{"value": f"ORD{i}"}],
+            "code": {"coding": [{"system": "http://loinc.org", "code": "58410-2"}], "text": "CBC"},
+            "subject": {"reference": "urn:uuid:patient"}, "issued": "2025-01-01T09:30:00Z"}},
+    ]
+    for n in range(1, observations + 1):
+        entry.append({"resource": {
+            "resourceType": "Observation", "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": f"TEST{n}"}], "text": f"Test {n}"},
+            "subject": {"reference": "urn:uuid:patient"}, "effectiveDateTime": "2025-01-01T09:30:00Z",
+            "valueQuantity": {"value": (i * n) % 200 / 10, "unit": "g/dL", "system": "http://unitsofmeasure.org"},
+            "interpretation": [{"coding": [{"code": "HLN"[(i + n) % 3]}]}],
+            "referenceRange": [{"low": {"value": 1.0}, "high": {"value": 9.0}}],
+        }})
+    return {"resourceType": "Bundle", "type": "collection", "entry": entry}
+
+
+def hl7_message(i: int, observations: int) -> str:
+    output_data = hl7_build.output_data(i, observations)
+    output_data.update({f"OBX[{n}]-11": "F" for n in range(1, observations + 1)})
+    return HL7MessageTemplate("EHR", "LIS", "ORU^R01").build(output_data)
+
+
+def run(args):
+    for protocol, build in (("FHIR", fhir_message), ("HL7", hl7_message)):
+        messages = [build(i, args.observations) for i in range(args.messages + 1)]
+        print(f"{protocol}: {args.messages} messages, {args.observations} observations each")
+        timings = []
+        for tier in ("full", "structural"):
+            assert structural.validation_errors(tier, protocol, messages[0]) == [], tier
+            started = time.perf_counter()
+            for message in messages[1:]:
+                structural.validation_errors(tier, protocol, message)
+            timings.append((time.perf_counter() - started) / args.messages * 1e6)
+            speedup = f"  {timings[0] / timings[-1]:6.1f}x" if len(timings) > 1 else ""
+            print(f"  {tier:<12} {timings[-1]:10.1f} us/message{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--observations", type=int, default=8)
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Named code-set tables for `map` rules that are too big for MappingRule.config (LOINC to local
+test codes, ICD-10 crosswalks, ...).
+
+A map rule uses one with `{"code_set": "<name>"}`. Inline entries next to it override the
+table, and a value found in neither is passed through unchanged, as with inline maps.
+
+Tables are imported from CSV (POST /code-set/{name}, or `python -m code_sets import <name>
+<file.csv>`) into CODE_SET_DIR/<name>@<version>.cset: keys lower-cased (map lookups use
+`str(value).lower()`), sorted, and laid out as two offset arrays, an open-addressing hash index
+(crc32, so it is the same in every process) and the key and value bytes. Workers memory-map the
+newest version on first use and look codes up in place, so a table costs no parse time and its
+pages are shared by every worker and process on the host. Each import is a
+new version file (Windows cannot replace a file another process has mapped); readers switch
+to it within CODE_SET_RELOAD_CHECK_SECS, without a restart, and older versions are removed
+once nothing maps them any more.
+"""
+from array import array
+import csv
+import io
+import logging
+from logging.handlers import RotatingFileHandler
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from zlib import crc32
+
+CODE_SET_DIR = os.getenv("CODE_SET_DIR", "code_sets")
+_RELOAD_CHECK_SECS = float(os.getenv("CODE_SET_RELOAD_CHECK_SECS", "5"))
+
+_MAGIC = b"CODESET1"
+# magic, entry count, hash buckets, key bytes, value bytes; then native uint32 arrays (read back
+# with memoryview.cast): key offsets, value offsets, buckets (entry index + 1, 0 = empty).
+_HEADER = struct.Struct("=8sIIII")
+_NAME = re.compile(r"^[A-Za-z0-9_-]{1,100}$")
+_SUFFIX = ".cset"
+
+logger = logging.getLogger("code_sets")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+if not logger.handlers:
+    os.makedirs("logs", exist_ok=True)
+    handler = RotatingFileHandler("logs/code_sets.log", maxBytes=20000, backupCount=1)
+    handler.setFormatter(logging.Formatter("%(asctime)s- %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"))
+    logger.addHandler(handler)
+
+
+def _check_name(name: str) -> str:
+    if not _NAME.match(name):
+        raise ValueError(f"invalid code set name {name!r}: use letters, digits, '_' and '-'")
+    return name
+
+
+def _versions(name: str) -> list[str]:
+    """Paths of every stored version of `name`, oldest first."""
+    prefix = f"{_check_name(name)}@"
+    try:
+        file_names = os.listdir(CODE_SET_DIR)
+    except FileNotFoundError:
+        return []
+    versions = sorted(int(f[len(prefix):-len(_SUFFIX)]) for f in file_names
+                      if f.startswith(prefix) and f.endswith(_SUFFIX) and f[len(prefix):-len(_SUFFIX)].isdigit())
+    return [os.path.join(CODE_SET_DIR, f"{prefix}{version}{_SUFFIX}") for version in versions]
+
+
+class CodeSet:
+    """One memory-mapped table."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, bucket_count, key_bytes, value_bytes = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a code set file")
+        view = memoryview(self._map)
+        offsets_size = 4 * (self.count + 1)
+        start = _HEADER.size
+        self._key_offsets = view[start:start + offsets_size].cast("I")
+        self._value_offsets = view[start + offsets_size:start + 2 * offsets_size].cast("I")
+        start += 2 * offsets_size
+        self._buckets = view[start:start + 4 * bucket_count].cast("I")
+        self._bucket_mask = bucket_count - 1
+        self._keys_start = start + 4 * bucket_count
+        self._values_start = self._keys_start + key_bytes
+
+    def get(self, key: str, default=None):
+        """The value for `key` (already lower-cased by the caller), or `default`."""
+        target = key.encode("utf-8")
+        bucket = crc32(target) & self._bucket_mask
+        while True:
+            entry = self._buckets[bucket]
+            if not entry:
+                return default
+            index = entry - 1
+            if self._map[self._keys_start + self._key_offsets[index]:self._keys_start + self._key_offsets[entry]] == target:
+                start = self._values_start + self._value_offsets[index]
+                return self._map[start:self._values_start + self._value_offsets[entry]].decode("utf-8")
+            bucket = (bucket + 1) & self._bucket_mask
+
+
+# name -> [CodeSet, path of the version it maps, monotonic time of the last check]
+_loaded: dict[str, list] = {}
+_load_lock = threading.Lock()
+
+
+def get_code_set(name: str) -> CodeSet:
+    """
+    The table called `name`, opened on first use and reopened when its file has been replaced.
+    Raises KeyError when no such table has been imported.
+    """
+    entry = _loaded.get(name)
+    now = time.monotonic()
+    if entry is not None and now - entry[2] < _RELOAD_CHECK_SECS:
+        return entry[0]
+    with _load_lock:
+        versions = _versions(name)
+        if not versions:
+            _loaded.pop(name, None)
+            raise KeyError(f"code set {name!r} does not exist")
+        entry = _loaded.get(name)
+        if entry is None or entry[1] != versions[-1]:
+            # The old map stays valid for lookups already holding it; it is closed once unreferenced.
+            entry = _loaded[name] = [CodeSet(versions[-1]), versions[-1], now]
+        entry[2] = now
+        return entry[0]
+
+
+def exists(name: str) -> bool:
+    try:
+        return bool(_versions(name))
+    except ValueError:
+        return False
+
+
+def _remove_old_versions(name: str, keep: int = 1) -> None:
+    versions = _versions(name)
+    for path in versions[:len(versions) - keep]:
+        try:
+            os.remove(path)
+        except OSError: # still mapped somewhere (Windows); the next import tries again
+            logger.info("code set version %s still in use, not removed yet", path)
+
+
+def import_rows(name: str, rows) -> int:
+    """
+    Write (code, mapped value) pairs as the table `name`, replacing any previous version
+    atomically. Codes are lower-cased; the last row wins for a repeated code. Returns the entry count.
+    """
+    _check_name(name)
+    entries: dict[bytes, bytes] = {}
+    for code, value in rows:
+        entries[str(code).strip().lower().encode("utf-8")] = str(value).encode("utf-8")
+    keys = sorted(entries)
+
+    key_offsets, value_offsets = array("I", [0]), array("I", [0])
+    for key in keys:
+        key_offsets.append(key_offsets[-1] + len(key))
+        value_offsets.append(value_offsets[-1] + len(entries[key]))
+    # At most half full, so probes stay short.
+    bucket_count = 1 << max(3, (2 * len(keys)).bit_length())
+    buckets = array("I", bytes(4 * bucket_count))
+    for index, key in enumerate(keys):
+        bucket = crc32(key) & (bucket_count - 1)
+        while buckets[bucket]:
+            bucket = (bucket + 1) & (bucket_count - 1)
+        buckets[bucket] = index + 1
+
+    os.makedirs(CODE_SET_DIR, exist_ok=True)
+    versions = _versions(name)
+    version = time.time_ns()
+    if versions: # keep versions increasing even if the clock steps back
+        version = max(version, int(versions[-1].rsplit("@", 1)[1][:-len(_SUFFIX)]) + 1)
+    path = os.path.join(CODE_SET_DIR, f"{name}@{version}{_SUFFIX}")
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, len(keys), bucket_count, key_offsets[-1], value_offsets[-1]))
+        file.write(key_offsets.tobytes())
+        file.write(value_offsets.tobytes())
+        file.write(buckets.tobytes())
+        file.write(b"".join(keys))
+        file.write(b"".join(entries[key] for key in keys))
+    os.replace(temporary, path) # readers only ever see complete files
+    with _load_lock:
+        _loaded.pop(name, None)
+    _remove_old_versions(name)
+    logger.info("imported code set %s: %s entries", name, len(keys))
+    return len(keys)
+
+
+def import_csv(name: str, text: str, code_column: str | None = None, value_column: str | None = None) -> int:
+    """
+    Import CSV text as the table `name`. With column names, the first row is the header and
+    those columns are used; without, the first two columns of every row are.
+    """
+    reader = csv.reader(io.StringIO(text))
+    if code_column is None and value_column is None:
+        rows = ((row[0], row[1]) for row in reader if len(row) >= 2)
+    else:
+        header = next(reader, [])
+        try:
+            code_index, value_index = header.index(code_column), header.index(value_column)
+        except ValueError:
+            raise ValueError(f"CSV header {header} has no column {code_column!r} or {value_column!r}") from None
+        rows = ((row[code_index], row[value_index]) for row in reader if len(row) > max(code_index, value_index))
+    return import_rows(name, rows)
+
+
+def list_code_sets() -> list[dict]:
+    """Name, entry count and file size of the current version of every table."""
+    if not os.path.isdir(CODE_SET_DIR):
+        return []
+    names = sorted({f.split("@", 1)[0] for f in os.listdir(CODE_SET_DIR) if f.endswith(_SUFFIX) and "@" in f})
+    tables = []
+    for name in names:
+        versions = _versions(name)
+        if not versions:
+            continue
+        with open(versions[-1], "rb") as file:
+            _, count, _, _, _ = _HEADER.unpack(file.read(_HEADER.size))
+        tables.append({"name": name, "entries": count, "size_bytes": os.path.getsize(versions[-1])})
+    return tables
+
+
+def delete_code_set(name: str) -> None:
+    """
+    Remove every version of the table `name`. Raises KeyError when it does not exist and
+    OSError when a version is still mapped by another process (Windows).
+    """
+    versions = _versions(name)
+    if not versions:
+        raise KeyError(f"code set {name!r} does not exist")
+    with _load_lock:
+        _loaded.pop(name, None)
+    for path in reversed(versions):
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    # python -m code_sets import <name> <file.csv> [code column] [value column]
+    if len(sys.argv) not in (4, 6) or sys.argv[1] != "import":
+        sys.exit("usage: python -m code_sets import <name> <file.csv> [<code column> <value column>]")
+    with open(sys.argv[3], encoding="utf-8-sig", newline="") as csv_file:
+        count = import_csv(sys.argv[2], csv_file.read(), *sys.argv[4:6])
+    print(f"imported {count} entries into code set {sys.argv[2]} ({CODE_SET_DIR})")
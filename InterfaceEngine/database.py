@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
 from dotenv import load_dotenv
 
@@ -6,17 +8,23 @@ from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker
 
+import json_codec
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL_ENGINE")
+POOL_SIZE = 25
+MAX_OVERFLOW = 50
 
 # engine = create_engine(DATABASE_URL)
 engine = create_engine(
     DATABASE_URL,
     poolclass=QueuePool,       # Use QueuePool for connection pooling important for handling concurrent requests.
-    pool_size=25,              # Base connections
-    max_overflow=50,           # Temp connections
+    pool_size=POOL_SIZE,       # Base connections
+    max_overflow=MAX_OVERFLOW, # Temp connections
     pool_pre_ping=True,        # Health check
     pool_recycle=3600,         # Recycle hourly
+    json_serializer=json_codec.dumps_str,   # JSON columns (held messages, configs) use the same codec
+    json_deserializer=json_codec.loads,
 )
 session_local = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
@@ -27,4 +35,26 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Sync SQLAlchemy work from async code runs here instead of on the event loop. Sized to the pool
+# so a burst queues in the executor rather than blocking threads on pool checkout.
+_db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DB_EXECUTOR_WORKERS", str(POOL_SIZE))),
+    thread_name_prefix="db",
+)
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Run `fn(db, *args, **kwargs)` with a fresh session on the DB executor and return its result.
+    Keep everything a request needs in one `fn` so it costs one thread hop; ORM objects come
+    back detached, so load any relationship the caller reads before returning.
+    """
+    def _call():
+        with session_local() as db:
+            return fn(db, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, _call)
+
+def db_executor_backlog() -> int:
+    """DB calls waiting for a free executor thread."""
+    return _db_executor._work_queue.qsize()
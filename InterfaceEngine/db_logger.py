@@ -1,38 +1,144 @@
+import atexit
+from collections import deque
 import logging
-from queue import Queue
-from threading import Thread
+import os
+from threading import Condition, Thread
 from datetime import datetime
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
 from database import session_local
+import log_retention
 from models import Logs
+import response_cache
+
+# The DB sink batches rows: one INSERT (executemany) per batch instead of one transaction per
+# delivery event. A batch is flushed when it reaches _BATCH_SIZE rows or after
+# _FLUSH_INTERVAL_SECS, whichever comes first.
+_BATCH_SIZE = int(os.getenv("DB_LOG_BATCH_SIZE", "200"))
+_FLUSH_INTERVAL_SECS = float(os.getenv("DB_LOG_FLUSH_SECS", "1.0"))
+_QUEUE_MAX = int(os.getenv("DB_LOG_QUEUE_MAX", "10000"))
+# What happens when the buffer is full:
+#   drop_success (default) — new Success rows are dropped; a new Fail row evicts the oldest
+#                            buffered Success row, so failures are never lost to overflow.
+#   drop_oldest            — the oldest buffered row (any status) makes room for the new one.
+_OVERFLOW_POLICY = os.getenv("DB_LOG_OVERFLOW_POLICY", "drop_success").lower()
+# Failures may grow the buffer past _QUEUE_MAX (never dropped), but not without limit.
+_HARD_QUEUE_MAX = _QUEUE_MAX * 2
+
+_buffer: deque[dict] = deque()
+_cond = Condition()
+_worker: Thread | None = None
+_stopping = False
+
+_stats = {
+    "queued": 0,    # rows accepted into the buffer
+    "written": 0,   # rows committed to the logs table
+    "dropped": 0,   # rows discarded by the overflow policy
+    "failed": 0,    # rows lost because their batch insert failed
+}
+
+
+def stats() -> dict:
+    """Counters for the DB log sink plus the current buffer depth."""
+    with _cond:
+        return {**_stats, "pending": len(_buffer)}
 
 
-_log_queue: Queue[dict] = Queue()
-_worker_started = False
+def _evict_oldest_success() -> bool:
+    for idx, row in enumerate(_buffer):
+        if row["status"] == "Success":
+            del _buffer[idx]
+            return True
+    return False
+
+
+def _enqueue(payload: dict) -> None:
+    with _cond:
+        if len(_buffer) >= _QUEUE_MAX:
+            if _OVERFLOW_POLICY == "drop_oldest":
+                _buffer.popleft()
+                _stats["dropped"] += 1
+            elif payload["status"] != "Fail":
+                _stats["dropped"] += 1
+                return
+            elif _evict_oldest_success():
+                _stats["dropped"] += 1
+            elif len(_buffer) >= _HARD_QUEUE_MAX:
+                _buffer.popleft()
+                _stats["dropped"] += 1
+
+        _buffer.append(payload)
+        _stats["queued"] += 1
+        if len(_buffer) >= _BATCH_SIZE:
+            _cond.notify()
+
+
+def _insert_batch(batch: list[dict]) -> None:
+    with session_local() as db:
+        rows = log_retention.prepare_rows(db, batch) # bodies -> log_payload, hashes on the rows
+        db.execute(insert(Logs.__table__), rows) # executemany
+        db.commit()
+    response_cache.bump(response_cache.LOGS) # executemany returns no ids; the batch is the version step
+
+
+def _write_batch(batch: list[dict]) -> None:
+    try:
+        try:
+            _insert_batch(batch)
+        except IntegrityError:
+            # Another engine process stored one of the same payloads first; the retry sees it.
+            _insert_batch(batch)
+        written, failed = len(batch), 0
+    except Exception as e:
+        print(f"Failed to log {len(batch)} rows to DB: {e}")
+        written, failed = 0, len(batch)
+    with _cond:
+        _stats["written"] += written
+        _stats["failed"] += failed
 
 
 def _db_log_worker():
     while True:
-        payload = _log_queue.get()
-        try:
-            db = session_local()
-            try:
-                db.add(Logs(**payload))
-                db.commit()
-            finally:
-                db.close()
-        except Exception as e:
-            print(f"Failed to log to DB: {e}")
-        finally:
-            _log_queue.task_done()
+        with _cond:
+            deadline = time.monotonic() + _FLUSH_INTERVAL_SECS
+            while len(_buffer) < _BATCH_SIZE and not _stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _cond.wait(remaining)
+
+            batch = [_buffer.popleft() for _ in range(min(_BATCH_SIZE, len(_buffer)))]
+            done = _stopping and not _buffer
+
+        if batch:
+            _write_batch(batch)
+        if done:
+            return
 
 
 def _ensure_worker_started():
-    global _worker_started
-    if _worker_started:
+    global _worker
+    if _worker is not None:
+        return
+    _worker = Thread(target=_db_log_worker, name="db-log-writer", daemon=True)
+    _worker.start()
+
+
+def shutdown(timeout: float = 10.0) -> None:
+    """Flush everything still buffered and stop the writer thread. Safe to call more than once."""
+    global _stopping
+    if _worker is None:
         return
-    worker = Thread(target=_db_log_worker, daemon=True)
-    worker.start()
-    _worker_started = True
+    with _cond:
+        _stopping = True
+        _cond.notify()
+    _worker.join(timeout)
+
+
+atexit.register(shutdown)
 
 
 class DBHandler(logging.Handler):
@@ -51,7 +157,7 @@ class DBHandler(logging.Handler):
             scr_systemid = getattr(record, "src_systemid", None)
             dest_system_name = getattr(record, "dest_system_name", None)
 
-            _log_queue.put({
+            _enqueue({
                 "datetime": datetime.now(),
                 "status": status,
                 "operation_heading": op_heading,
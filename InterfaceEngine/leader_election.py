@@ -0,0 +1,214 @@
+"""
+Lease-based leader election for the engine's singleton background loops.
+
+When more than one engine process runs against the same database, loops like
+`server_health` and `get_lis_payer` must only run in ONE of them — otherwise every process
+probes every server, races on `Server.status` writes and pushes the connected-systems list
+to the EHR N times.
+
+Two backends:
+    db   (default) — a row per loop in the `leader_lease` table. The holder renews
+                     `expires_at` every LEASE_RENEW_SECS; any other process may take the row
+                     over once `expires_at` has passed. Works across hosts.
+    file           — an OS-level exclusive lock on `locks/<name>.lock`. The OS releases the
+                     lock the moment the holder dies, so failover is immediate. Single host only.
+    none           — no election, every process runs every loop (old behaviour).
+"""
+import asyncio
+from datetime import datetime, timedelta
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import socket
+from typing import Awaitable, Callable
+from uuid import uuid4
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from database import session_local
+import models
+
+_LEADER_BACKEND = os.getenv("LEADER_ELECTION_BACKEND", "db").lower() # db | file | none
+_LEASE_TTL_SECS = int(os.getenv("LEASE_TTL_SECS", "15"))
+# Renew well inside the TTL so one slow DB round-trip does not cost us the lease. Followers poll
+# at the same interval, so worst-case failover after a crash is TTL + RENEW seconds.
+_LEASE_RENEW_SECS = int(os.getenv("LEASE_RENEW_SECS", "5"))
+_LOCK_DIR = os.getenv("LEADER_LOCK_DIR", "locks")
+
+# Unique per process: two workers on the same host must not think they hold each other's lease.
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+
+logger = logging.getLogger("leader_election")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+if not logger.handlers:
+    handler = RotatingFileHandler("logs/leader_election.log", maxBytes=20000, backupCount=1)
+    handler.setFormatter(logging.Formatter("%(asctime)s- %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"))
+    logger.addHandler(handler)
+
+
+class DBLease:
+    """
+    A named lease stored in the `leader_lease` table.
+
+    `try_acquire()` is a single conditional UPDATE (take the row if we already hold it or if it
+    expired), so two processes can never both win. The first ever acquire inserts the row;
+    a concurrent insert from another process fails on the primary key and simply loses.
+    """
+    def __init__(self, name: str, ttl_secs: int = _LEASE_TTL_SECS):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_secs)
+
+    def try_acquire(self) -> bool:
+        now = datetime.utcnow()
+        with session_local() as db:
+            result = db.execute(
+                update(models.LeaderLease)
+                .where(
+                    models.LeaderLease.name == self.name,
+                    (models.LeaderLease.holder == INSTANCE_ID) | (models.LeaderLease.expires_at < now),
+                )
+                .values(holder=INSTANCE_ID, expires_at=now + self.ttl, heartbeat_at=now)
+            )
+            db.commit()
+            if result.rowcount == 1:
+                return True
+
+            if db.get(models.LeaderLease, self.name) is not None:
+                return False # someone else holds a live lease
+
+            try:
+                db.add(models.LeaderLease(
+                    name=self.name,
+                    holder=INSTANCE_ID,
+                    expires_at=now + self.ttl,
+                    heartbeat_at=now,
+                ))
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+
+    def release(self) -> None:
+        # Expire the row instead of deleting it so the next leader takes over on its next poll.
+        with session_local() as db:
+            db.execute(
+                update(models.LeaderLease)
+                .where(models.LeaderLease.name == self.name, models.LeaderLease.holder == INSTANCE_ID)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.commit()
+
+
+class FileLease:
+    """
+    A named lease backed by an exclusive, non-blocking OS lock on `locks/<name>.lock`.
+    Renewal is a no-op: the lock is held for as long as the file handle stays open.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.path = os.path.join(_LOCK_DIR, f"{name}.lock")
+        self._fh = None
+
+    def try_acquire(self) -> bool:
+        if self._fh is not None:
+            return True
+
+        os.makedirs(_LOCK_DIR, exist_ok=True)
+        fh = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+
+        fh.seek(0)
+        fh.truncate()
+        fh.write(INSTANCE_ID)
+        fh.flush()
+        self._fh = fh
+        return True
+
+    def release(self) -> None:
+        if self._fh is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._fh.seek(0)
+                msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._fh.close()
+            self._fh = None
+
+
+def make_lease(name: str):
+    if _LEADER_BACKEND == "file":
+        return FileLease(name)
+    return DBLease(name)
+
+
+async def run_as_leader(name: str, loop_factory: Callable[[], Awaitable[None]]):
+    """
+    Run `loop_factory()` only while this process holds the `name` lease.
+
+    Followers retry every LEASE_RENEW_SECS. The leader renews at the same interval; if a renewal
+    fails (lease stolen after a long stall, DB unreachable) the loop is cancelled straight away so
+    two processes never run it at once. On cancellation the lease is released for a fast handover.
+
+    With LEADER_ELECTION_BACKEND=none the loop simply runs here unconditionally.
+    """
+    if _LEADER_BACKEND == "none":
+        await loop_factory()
+        return
+
+    lease = make_lease(name)
+    task: asyncio.Task | None = None
+    try:
+        while True:
+            try:
+                is_leader = await asyncio.to_thread(lease.try_acquire)
+            except Exception:
+                logger.exception("lease '%s': acquire/renew failed on %s", name, INSTANCE_ID)
+                is_leader = False
+
+            if is_leader and task is None:
+                logger.info("lease '%s' acquired by %s — starting loop", name, INSTANCE_ID)
+                task = asyncio.create_task(loop_factory())
+
+            elif not is_leader and task is not None:
+                logger.warning("lease '%s' lost by %s — stopping loop", name, INSTANCE_ID)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                task = None
+
+            if task is not None and task.done():
+                # The loop itself exited or crashed; log it and restart on the next tick while we lead.
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("lease '%s': loop crashed: %s", name, task.exception())
+                task = None
+
+            await asyncio.sleep(_LEASE_RENEW_SECS)
+
+    except asyncio.CancelledError:
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        try:
+            await asyncio.to_thread(lease.release)
+            logger.info("lease '%s' released by %s", name, INSTANCE_ID)
+        except Exception:
+            logger.exception("lease '%s': release failed on %s", name, INSTANCE_ID)
+        raise
@@ -0,0 +1,215 @@
+"""
+Log retention: compressed, deduplicated payload storage and day-based archiving of `logs`.
+
+Payloads
+    The src/dest message bodies are stored once per distinct text in `log_payload`, keyed by the
+    sha256 of the text and zlib-compressed. One source message fanned out to N routes is one row,
+    not N. `logs` rows only keep the hashes. Each payload remembers the newest day that referenced
+    it (`last_seen_day`), so expired payloads are removed with one range delete.
+
+Days
+    `logs` holds the last LOG_HOT_DAYS days. Older days are moved, one day per transaction, into
+    their own `logs_archive_<yyyymmdd>` table. Once a day falls out of LOG_RETENTION_DAYS its
+    archive table is dropped with DROP TABLE — no row-by-row deletes on the big table.
+
+`retention_loop` runs under leader election (see main.lifeSpan), so only one process archives.
+"""
+import asyncio
+from datetime import date, timedelta
+from hashlib import sha256
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import zlib
+
+from sqlalchemy import Column, MetaData, Table, delete, distinct, insert, inspect, select, update
+
+from database import engine, session_local
+import models
+import response_cache
+
+_PAYLOAD_STORE_ENABLED = os.getenv("LOG_PAYLOAD_STORE", "true").lower() in ("true", "1", "yes")
+_COMPRESSION_LEVEL = int(os.getenv("LOG_PAYLOAD_COMPRESSION_LEVEL", "6"))
+_HOT_DAYS = int(os.getenv("LOG_HOT_DAYS", "7"))
+_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "90")) # 0 = keep forever
+_RETENTION_INTERVAL_SECS = int(os.getenv("LOG_RETENTION_INTERVAL_SECS", "3600"))
+if _RETENTION_DAYS > 0:
+    # Payloads expire with the retention window; hot rows must not outlive their bodies.
+    _HOT_DAYS = min(_HOT_DAYS, _RETENTION_DAYS)
+
+_ARCHIVE_PREFIX = "logs_archive_"
+# MSSQL allows 2100 parameters per statement; stay well below it for IN (...) lists.
+_IN_CHUNK = 1000
+
+_BODY_COLUMNS = (("src_message", "src_payload_hash"), ("dest_message", "dest_payload_hash"))
+
+logger = logging.getLogger("log_retention")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+if not logger.handlers:
+    handler = RotatingFileHandler("logs/log_retention.log", maxBytes=20000, backupCount=1)
+    handler.setFormatter(logging.Formatter("%(asctime)s- %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"))
+    logger.addHandler(handler)
+
+
+def _chunks(items: list, size: int = _IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def prepare_rows(db, rows: list[dict]) -> list[dict]:
+    """
+    Return copies of the Logs rows ready for insert: `log_day` set and, with the payload store
+    enabled, bodies replaced by hashes. Payloads not stored yet are inserted in the same session;
+    ones already stored get their `last_seen_day` bumped. The caller commits.
+    """
+    prepared = []
+    new_payloads: dict[str, str] = {}
+    for row in rows:
+        row = dict(row, log_day=row["datetime"].date())
+        if _PAYLOAD_STORE_ENABLED:
+            for body_key, hash_key in _BODY_COLUMNS:
+                text = row.get(body_key)
+                if text is None:
+                    continue
+                digest = sha256(text.encode("utf-8")).hexdigest()
+                new_payloads.setdefault(digest, text)
+                row[hash_key] = digest
+                row[body_key] = None
+        prepared.append(row)
+
+    if not new_payloads:
+        return prepared
+
+    today = date.today()
+    existing = set()
+    for chunk in _chunks(list(new_payloads)):
+        existing.update(
+            h for (h,) in db.query(models.LogPayload.payload_hash).filter(models.LogPayload.payload_hash.in_(chunk))
+        )
+    for chunk in _chunks(list(existing)):
+        db.execute(
+            update(models.LogPayload)
+            .where(models.LogPayload.payload_hash.in_(chunk), models.LogPayload.last_seen_day < today)
+            .values(last_seen_day=today)
+        )
+    missing = [
+        {
+            "payload_hash": digest,
+            "body": zlib.compress(text.encode("utf-8"), _COMPRESSION_LEVEL),
+            "size": len(text),
+            "last_seen_day": today,
+        }
+        for digest, text in new_payloads.items() if digest not in existing
+    ]
+    if missing:
+        db.execute(insert(models.LogPayload.__table__), missing)
+    return prepared
+
+
+def load_payloads(db, hashes) -> dict[str, str]:
+    """hash -> decompressed text for every hash that is still stored."""
+    wanted = list({h for h in hashes if h})
+    found = {}
+    for chunk in _chunks(wanted):
+        for digest, body in db.query(models.LogPayload.payload_hash, models.LogPayload.body) \
+                .filter(models.LogPayload.payload_hash.in_(chunk)):
+            found[digest] = zlib.decompress(body).decode("utf-8")
+    return found
+
+
+def fill_bodies(db, items: list) -> None:
+    """
+    Resolve src/dest_message from the payload store for Logs ORM objects or row dicts in place.
+    Rows that still carry inline text (written before the store existed) are left as they are.
+    """
+    def _get(item, key):
+        return item.get(key) if isinstance(item, dict) else getattr(item, key, None)
+
+    def _set(item, key, value):
+        if isinstance(item, dict):
+            item[key] = value
+        else:
+            setattr(item, key, value)
+
+    pending = [(item, body_key, _get(item, hash_key))
+               for item in items for body_key, hash_key in _BODY_COLUMNS
+               if _get(item, body_key) is None and _get(item, hash_key)]
+    if not pending:
+        return
+    payloads = load_payloads(db, (digest for _, _, digest in pending))
+    for item, body_key, digest in pending:
+        _set(item, body_key, payloads.get(digest))
+
+
+def _archive_table(day: date) -> Table:
+    """A Logs-shaped table for one day, without identity, defaults or indexes."""
+    columns = [
+        Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False, nullable=c.nullable)
+        for c in models.Logs.__table__.columns
+    ]
+    return Table(f"{_ARCHIVE_PREFIX}{day:%Y%m%d}", MetaData(), *columns)
+
+
+def _archive_day(day: date) -> int:
+    archive = _archive_table(day)
+    archive.create(bind=engine, checkfirst=True)
+    logs = models.Logs.__table__
+    with session_local() as db:
+        # Same transaction: a crash leaves the day either fully in logs or fully archived.
+        moved = db.execute(
+            insert(archive).from_select([c.name for c in logs.columns], select(logs).where(logs.c.log_day == day))
+        ).rowcount
+        db.execute(delete(logs).where(logs.c.log_day == day))
+        db.commit()
+    response_cache.bump(response_cache.LOGS)
+    return moved
+
+
+def run_retention(today: date | None = None) -> dict:
+    """Archive days older than LOG_HOT_DAYS, drop archives and payloads older than LOG_RETENTION_DAYS."""
+    today = today or date.today()
+    hot_cutoff = today - timedelta(days=_HOT_DAYS)
+    summary = {"archived_days": 0, "archived_rows": 0, "dropped_days": 0, "payloads_deleted": 0}
+
+    with session_local() as db:
+        days = sorted(d for (d,) in db.query(distinct(models.Logs.log_day)).filter(models.Logs.log_day < hot_cutoff))
+    for day in days:
+        summary["archived_rows"] += _archive_day(day)
+        summary["archived_days"] += 1
+
+    if _RETENTION_DAYS <= 0:
+        return summary
+
+    retention_cutoff = today - timedelta(days=_RETENTION_DAYS)
+    for table_name in inspect(engine).get_table_names():
+        if not table_name.startswith(_ARCHIVE_PREFIX):
+            continue
+        try:
+            day = date(int(table_name[-8:-4]), int(table_name[-4:-2]), int(table_name[-2:]))
+        except ValueError:
+            continue
+        if day < retention_cutoff:
+            Table(table_name, MetaData()).drop(bind=engine)
+            summary["dropped_days"] += 1
+
+    with session_local() as db:
+        summary["payloads_deleted"] = db.execute(
+            delete(models.LogPayload).where(models.LogPayload.last_seen_day < retention_cutoff)
+        ).rowcount
+        db.commit()
+    return summary
+
+
+async def retention_loop():
+    while True:
+        try:
+            summary = await asyncio.to_thread(run_retention)
+            if any(summary.values()):
+                logger.info("retention: %s", summary)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("retention run failed")
+        await asyncio.sleep(_RETENTION_INTERVAL_SECS)
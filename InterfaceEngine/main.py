@@ -1,10 +1,13 @@
 import asyncio
+import atexit
 from collections import Counter
-from datetime import datetime
 import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 import os
+from queue import Full, Queue
+import random
+import re
 import ssl
 import time
 from uuid import uuid4
@@ -13,27 +16,37 @@ from contextlib import asynccontextmanager
 import httpx
 from fastapi import FastAPI, status, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.attributes import flag_modified
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.errors import RateLimitExceeded
 from sqlalchemy.exc import SAWarning
-from sqlalchemy.orm import joinedload
 import warnings
 
-from api import route, endpoint, server, logs, user
+from api import route, endpoint, server, logs, user, debug, code_set
 import db_logger as db_logging
-from database import engine, session_local, get_db
+import json_codec
+import log_retention
+import metrics
+import mllp
+import profiling
+import tracing
+from leader_election import run_as_leader
+from database import engine, get_db, run_db, db_executor_backlog
 import models
+import repositories
 from api.logs import _format_log_message
 from rate_limiting import limiter, rate_limit_exceeded_handler
-from validation.transformation import fill_duplicate_missing_values, regex_replace_with_template, increment_segment, set_null_if_not_available
-from validation.fhir_validation import validate_unknown_fhir_resource, get_fhir_value_by_path, fhir_extract_paths
-from validation.fhir_validation import build_fhir_message
+from validation.transformation import increment_segment, set_null_if_not_available
+from validation.transformation import compile_regex_rule
+from validation.date_format import DateFormatRule
+from validation.mapping_plan import MappingPlan
+from validation.fhir_validation import get_fhir_value_by_path, fhir_extract_paths
+from validation.fhir_validation import FHIRMessageTemplate
+from validation import fhir_stream, structural
 from validation.hl7_validation import get_hl7_value_by_path, hl7_extract_paths
-from validation.hl7_validation import build_hl7_message
+from validation.hl7_validation import HL7MessageTemplate
 
 warnings.filterwarnings("ignore", category=SAWarning)
 os.makedirs("logs", exist_ok=True)
@@ -70,6 +83,27 @@ class MidnightSingleFileHandler(TimedRotatingFileHandler):
         current_time = int(time.time())
         self.rolloverAt = self.computeRollover(current_time)
 
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hand records to a writer thread instead of writing files on the event loop.
+    The queue is bounded: when the writer falls behind, new records are dropped and counted
+    rather than blocking the loop or growing memory without limit.
+    """
+    def __init__(self, log_queue: Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener whose stop() waits for room for its sentinel, so a full queue is still drained."""
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
 
 logger = logging.getLogger("interface_engine.main")
 logger.setLevel(logging.INFO)
@@ -113,30 +147,74 @@ health_log_handler = MidnightSingleFileHandler(
 health_log_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"))
 health_log_handler.addFilter(HealthRequestFilter(only_health=True))
 
-logger.addHandler(main_log_handler)
-logger.addHandler(health_log_handler)
+# File handlers run on writer threads behind bounded queues; the loggers only enqueue.
+# QueueHandler.prepare() still renders the message on the emitting thread: route_worker keeps
+# mutating output_data & co. after logging them, so formatting later on the writer thread could
+# log a different payload than the one that was current. Payload-heavy records are kept cheap
+# with LazyPayload + sampling instead (see _payload_log_budget).
+_FILE_LOG_QUEUE_MAX = int(os.getenv("FILE_LOG_QUEUE_MAX", "10000"))
+
+_main_log_queue_handler = DroppingQueueHandler(Queue(maxsize=_FILE_LOG_QUEUE_MAX))
+_mapping_log_queue_handler = DroppingQueueHandler(Queue(maxsize=_FILE_LOG_QUEUE_MAX))
+_file_log_listeners = [
+    DrainingQueueListener(_main_log_queue_handler.queue, main_log_handler, health_log_handler, respect_handler_level=True),
+    DrainingQueueListener(_mapping_log_queue_handler.queue, main_log_handler_mapping, respect_handler_level=True),
+]
+for _listener in _file_log_listeners:
+    _listener.start()
+
+logger.addHandler(_main_log_queue_handler)
+logger_mapping.addHandler(_mapping_log_queue_handler)
+
 
-logger_mapping.addHandler(main_log_handler_mapping)
+def stop_file_logging() -> None:
+    """Flush the file log queues and stop their writer threads. Safe to call more than once."""
+    for listener in _file_log_listeners:
+        if listener._thread is not None:
+            listener.stop()
+
+atexit.register(stop_file_logging)
 
 @asynccontextmanager # handle lifespan events like startup or shutdown
 async def lifeSpan(app: FastAPI):
-    app.state.server_health_task = asyncio.create_task(server.server_health())
-    app.state.connected_systems_task = asyncio.create_task(server.get_lis_payer())
+    # server_health and get_lis_payer write shared state (Server.status, the EHR's connected
+    # systems list), so with several engine processes only the lease holder runs them.
+    # route_manager and redelivery_watcher stay per-process: they serve this process' own
+    # route_queue / pending_redelivery, which live in memory.
+    app.state.server_health_task = asyncio.create_task(run_as_leader("server_health", server.server_health))
+    app.state.connected_systems_task = asyncio.create_task(run_as_leader("connected_systems", server.get_lis_payer))
+    app.state.log_retention_task = asyncio.create_task(run_as_leader("log_retention", log_retention.retention_loop))
     app.state.route_manager_task = asyncio.create_task(route_manager())
+    profiling.install_slow_step_monitor()
+    app.state.loop_lag_task = asyncio.create_task(profiling.lag_sampler())
     # app.state.send_to_server = asyncio.create_task(send_to_server())
     app.state.redelivery_watcher_task = asyncio.create_task(redelivery_watcher())
+    app.state.mllp_servers = await mllp.start_listeners(_MLLP_LISTENERS, _ingest_mllp)
 
     yield
 
+    # Stop taking MLLP messages before the queues are drained.
+    for mllp_server in app.state.mllp_servers:
+        mllp_server.close()
+    # Stop the redelivery watcher first so parked messages stay in pending_redelivery (and get
+    # checkpointed) instead of being pushed back into queues we're about to drain.
+    app.state.redelivery_watcher_task.cancel()
+    await asyncio.gather(app.state.redelivery_watcher_task, return_exceptions=True)
+    await drain_and_checkpoint(app.state.route_manager_task, _DRAIN_DEADLINE_SECS)
+
     shutdown_tasks = [
         app.state.server_health_task,
         app.state.connected_systems_task,
+        app.state.log_retention_task,
+        app.state.loop_lag_task,
         app.state.route_manager_task,
-        app.state.redelivery_watcher_task,
     ]
     for task in shutdown_tasks:
         task.cancel()
     await asyncio.gather(*shutdown_tasks, return_exceptions=True)
+    mllp.close_clients()
+    # Last: the drain above still writes Logs rows; flush them before the process exits.
+    await asyncio.to_thread(db_logging.shutdown)
     return
 
 app = FastAPI(title="Interface Engine", lifespan=lifeSpan)
@@ -158,6 +236,8 @@ app.include_router(route.router, prefix="/route")
 app.include_router(endpoint.router, prefix="/endpoint")
 app.include_router(logs.router, prefix="/logs")
 app.include_router(user.router, prefix="/user")
+app.include_router(debug.router, prefix="/debug")
+app.include_router(code_set.router, prefix="/code-set")
 
 db_logger = logging.getLogger("interface_engine.db_logger")
 db_logger.setLevel(logging.INFO)
@@ -175,19 +255,91 @@ def check_health():
     """
     return {"message": "✔ Interface Engine running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Engine metrics in Prometheus text format.
+
+    Counters/histograms: ingest requests per endpoint, ingest stage latency (parse, extract) per
+    endpoint, route stage latency (transform, build, deliver) per route, destination response codes.
+    Gauges read at scrape time: route queue depth and oldest-item age, parked messages per
+    destination, SQLAlchemy pool usage, DB executor backlog, event-loop lag, DB log sink and
+    file log queue counters.
+    """
+    lines = metrics.render_registry()
+
+    queues = [(route_names.get(route_id, str(route_id)), queue) for route_id, queue in list(route_queue.items())]
+    lines += metrics.render_gauge(
+        "engine_route_queue_depth", "Messages waiting in each route queue.", ("route",),
+        [((name,), queue.qsize()) for name, queue in queues],
+    )
+    lines += metrics.render_gauge(
+        "engine_route_queue_oldest_age_seconds", "Age of the oldest message waiting in each route queue.", ("route",),
+        [((name,), round(queue.oldest_age(), 3)) for name, queue in queues if isinstance(queue, metrics.TimedQueue)],
+    )
+    lines += metrics.render_gauge(
+        "engine_parked_messages", "Messages parked for redelivery per destination.", ("destination",),
+        [((destination_names.get(dest_id, str(dest_id)),), len(parked)) for dest_id, parked in list(pending_redelivery.items())],
+    )
+    lines += metrics.render_gauge(
+        "engine_in_flight_messages", "Messages currently being processed by route workers.", (),
+        [((), len(in_flight_messages))],
+    )
+
+    pool = engine.pool
+    lines += metrics.render_gauge("engine_db_pool_size", "Configured SQLAlchemy pool size.", (), [((), pool.size())])
+    lines += metrics.render_gauge("engine_db_pool_checked_out", "Pool connections currently checked out.", (), [((), pool.checkedout())])
+    # QueuePool.overflow() starts at -pool_size; only the positive part is overflow in use.
+    lines += metrics.render_gauge("engine_db_pool_overflow", "Overflow connections currently open.", (), [((), max(0, pool.overflow()))])
+    lines += metrics.render_gauge("engine_db_executor_backlog", "DB calls waiting for a DB executor thread.", (), [((), db_executor_backlog())])
+
+    loop_lag = profiling.lag_stats()
+    lines += metrics.render_gauge(
+        "engine_event_loop_lag_seconds", "Event-loop lag over the last LOOP_LAG_WINDOW_SECS.", ("stat",),
+        [(("max",), round(loop_lag["max"], 6)), (("p99",), round(loop_lag["p99"], 6))],
+    )
+    lines += ["# HELP engine_slow_loop_steps_total Loop steps longer than SLOW_STEP_THRESHOLD_MS.",
+              "# TYPE engine_slow_loop_steps_total counter",
+              f"engine_slow_loop_steps_total {profiling.slow_step_count}"]
+
+    db_log_stats = db_logging.stats()
+    lines += metrics.render_gauge("engine_db_log_pending", "Log rows buffered for the DB writer.", (), [((), db_log_stats["pending"])])
+    for key in ("queued", "written", "dropped", "failed"):
+        lines += [f"# HELP engine_db_log_{key}_total DB log rows {key}.", f"# TYPE engine_db_log_{key}_total counter",
+                  f"engine_db_log_{key}_total {db_log_stats[key]}"]
+    lines += ["# HELP engine_file_log_dropped_total File log records dropped because the writer queue was full.",
+              "# TYPE engine_file_log_dropped_total counter",
+              f"engine_file_log_dropped_total {_main_log_queue_handler.dropped + _mapping_log_queue_handler.dropped}"]
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 active_route_listners = {} # consist of all the running routes|Channels lisning for a soruce endpoint
 route_queue = {} # consist of each route key with that route value that it gets from source endpoint
+# Label lookups for /metrics: route_id -> route name, dest_server_id -> server name.
+route_names: dict[int, str] = {}
+destination_names: dict[int, str] = {}
 destination_semaphores = {}
-# Park-and-resume buffer: dest_server_id -> list of (route_id, route_name, (src_paths, simple_paths, src_msg))
+# Park-and-resume buffer: dest_server_id -> list of (route_id, route_name, (src_paths, simple_paths, src_message, trace_id))
 # Messages that couldn't be delivered because the destination is Inactive are parked here
 # and re-enqueued by redelivery_watcher() once the destination becomes Active again.
 pending_redelivery: dict[int, list] = {}
+# (route_id, worker_number, slot) -> queue item a worker has taken off its queue and not finished;
+# slot is the item's position in the worker's current batch. Lets the shutdown drain see which
+# deliveries are still in flight, and checkpoint them if the deadline hits.
+in_flight_messages: dict[tuple[int, int, int], tuple] = {}
+# Set once the shutdown drain starts. uvicorn has closed its HTTP sockets by then (lifespan
+# shutdown runs after that), so only MLLP connections still open see it: they get AE.
+_draining = False
 
 _BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "25"))
 # Default 3 — matches DESTINATION_CONCURRENCY (the per-destination semaphore caps concurrent
 # POSTs at 3, so extra workers beyond that only help with the fast transformation step).
 _ROUTE_WORKER_CONCURRENCY = int(os.getenv("ROUTE_WORKER_CONCURRENCY", "3"))
 _DESTINATION_CONCURRENCY = int(os.getenv("DESTINATION_CONCURRENCY", "3"))
+# Items a route worker takes off its queue at once when a backlog has built up; the batch is
+# transformed column-wise (validation/mapping_plan.py), then built and delivered concurrently.
+# 1 turns batching off.
+_ROUTE_BATCH_SIZE = max(1, int(os.getenv("ROUTE_BATCH_SIZE", "32")))
 _HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
 _INGEST_AWAIT_TIMEOUT = float(os.getenv("INGEST_AWAIT_TIMEOUT", str(_HTTP_READ_TIMEOUT + 10)))
 _INACTIVE_DEST_MAX_RETRIES = int(os.getenv("INACTIVE_DEST_MAX_RETRIES", "3"))
@@ -196,6 +348,8 @@ _REDELIVERY_CHECK_INTERVAL = int(os.getenv("REDELIVERY_CHECK_INTERVAL", "15"))
 # When true (default), batch items are processed strictly in the order they appear in the
 # request body. Set BATCH_PRESERVE_ORDER=false to fan out in parallel (uses _BATCH_CONCURRENCY).
 _BATCH_PRESERVE_ORDER = os.getenv("BATCH_PRESERVE_ORDER", "true").lower() in ("true", "1", "yes")
+# How long shutdown waits for workers to empty their queues before checkpointing the rest.
+_DRAIN_DEADLINE_SECS = float(os.getenv("DRAIN_DEADLINE_SECS", "30"))
 
 # Shared SSL context for ALL httpx clients in this process. Building an SSL context loads the
 # entire Windows certificate store (~0.75s here); every httpx.AsyncClient() without `verify=`
@@ -203,13 +357,56 @@ _BATCH_PRESERVE_ORDER = os.getenv("BATCH_PRESERVE_ORDER", "true").lower() in ("t
 # One context built once at import = startup in seconds.
 _SHARED_SSL_CONTEXT = ssl.create_default_context()
 
+# Payload logging. Full messages, src_path_to_value and output_data are multi-KB, so info-level
+# payload lines are sampled per message and truncated. Per-route overrides, e.g.
+#   PAYLOAD_LOG_ROUTES='{"Lab-to-Payer": {"sample_rate": 0.1, "max_chars": 500}}'
+_PAYLOAD_LOG_SAMPLE_RATE = float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE", "1.0"))
+_PAYLOAD_LOG_MAX_CHARS = int(os.getenv("PAYLOAD_LOG_MAX_CHARS", "2000"))
+_PAYLOAD_LOG_ROUTES: dict = json.loads(os.getenv("PAYLOAD_LOG_ROUTES", "{}"))
+
+# HL7 over MLLP: port -> the source endpoint its messages arrive on (see mllp.py), e.g.
+#   MLLP_LISTENERS='{"2575": {"system_id": "LIS-1", "endpoint": "/lis/results"}}'
+_MLLP_LISTENERS: dict = json.loads(os.getenv("MLLP_LISTENERS", "{}"))
+
 def _payload_preview(data, max_len: int = 400) -> str:
     text = str(data)
-    compact = " ".join(text.split())
-    if len(compact) <= max_len:
+    # Only compact what can end up in the preview; whitespace runs rarely halve the length.
+    compact = " ".join(text[:max_len * 2].split())
+    if len(compact) <= max_len and len(text) <= max_len * 2:
         return compact
     return compact[:max_len] + "..."
 
+class LazyPayload:
+    """
+    Log argument that renders a truncated payload preview only when a handler formats the record,
+    i.e. never for records below the logger's level.
+    """
+    __slots__ = ("data", "max_len")
+
+    def __init__(self, data, max_len: int = _PAYLOAD_LOG_MAX_CHARS):
+        self.data = data
+        self.max_len = max_len
+
+    def __str__(self) -> str:
+        return _payload_preview(self.data, self.max_len)
+
+def _payload_log_max_chars(route_name: str | None = None) -> int:
+    return int(_PAYLOAD_LOG_ROUTES.get(route_name, {}).get("max_chars", _PAYLOAD_LOG_MAX_CHARS))
+
+def _payload_log_budget(route_name: str | None = None) -> int:
+    """
+    Decide once per message whether its info-level payload lines are logged.
+    Returns the max characters per payload, or 0 when the message was not sampled.
+    """
+    sample_rate = float(_PAYLOAD_LOG_ROUTES.get(route_name, {}).get("sample_rate", _PAYLOAD_LOG_SAMPLE_RATE))
+    if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+        return 0
+    return _payload_log_max_chars(route_name)
+
+
+def _uses_mllp(dest_server) -> bool:
+    """HL7 destinations registered with transport "mllp" get their messages over MLLP, not HTTP."""
+    return dest_server.protocol == "HL7" and (dest_server.profile or {}).get("transport") == "mllp"
 
 def _get_destination_semaphore(dest_server_id: int) -> asyncio.Semaphore:
     if dest_server_id not in destination_semaphores:
@@ -244,29 +441,42 @@ async def send_to_server(flag: int, db: Session = Depends(get_db)):
 
             for idx, msg in enumerate(single_data.get("data", [])):
                 src_msg = single_data.get("src_msg")[idx]
+                # The encoded text the route worker held; holds from before that have a FHIR message as a dict.
+                src_message = src_msg if isinstance(src_msg, str) else json_codec.dumps_str(src_msg)
 
                 request_headers = {}
                 if dest_server.system_id is not None:
                     request_headers["System-Id"] = str(dest_server.system_id)
                     request_headers["Src-System-Id"] = str(src_server.system_id)
                     request_headers["Src-System-Name"] = str(src_server.name)
-                if dest_server.protocol == "FHIR":
-                    response = await client.post(url=dest_endpoint_url, json=msg, headers=request_headers)
+                if _uses_mllp(dest_server):
+                    dest_message = json_codec.dumps_str(msg)
+                    ack = await mllp.get_client(dest_server.ip, dest_server.port).send(msg)
+                    delivered, outcome, detail = ack.accepted, ack.code or "no-ack", ack.text
+                elif dest_server.protocol == "FHIR":
+                    body = json_codec.dumps(msg) # encoded once: sent as is, and its text is what gets logged
+                    dest_message = body.decode("utf-8")
+                    request_headers["Content-Type"] = "application/json"
+                    response = await client.post(url=dest_endpoint_url, content=body, headers=request_headers)
                 else:
                 # HL7 is plain text — do NOT json= encode it or it arrives as a
                 # JSON string "MSH|..." instead of the raw HL7 text
+                    dest_message = json_codec.dumps_str(msg)
                     request_headers["Content-Type"] = "text/plain"
                     response = await client.post(
                         url=dest_endpoint_url,
                         content=msg,
                         headers=request_headers
                     )
+                if not _uses_mllp(dest_server):
+                    delivered = response.status_code in (200, 201, 202, 203, 204)
+                    outcome, detail = str(response.status_code), response.text
 
-                if response.status_code in (200, 201, 202, 203, 204):
+                if delivered:
                     db_logger.info(f"Data Sucessfully Send to : {dest_server.name}",
                                 extra= {
-                                        "src_message": json.dumps(src_msg),
-                                        "dest_message": json.dumps(msg),
+                                        "src_message": src_message,
+                                        "dest_message": dest_message,
                                         "op_heading": f"Channel: {route.name}",
                                         "dest_system_name": dest_server.name,
                                         "src_systemid": src_server.system_id
@@ -276,12 +486,12 @@ async def send_to_server(flag: int, db: Session = Depends(get_db)):
                     db.query(models.Config).filter(models.Config.hold_flag == flag).delete()
                     db.commit()
                 else:
-                    err = f"Destination {dest_endpoint_url} returned {response.status_code}: {response.text}"
+                    err = f"Destination {dest_endpoint_url} returned {outcome}: {detail}"
                     logger.error(err)
                     db_logger.error(f"Data Failed to Send to : {dest_server.name}",
                                 extra= {
-                                        "src_message": json.dumps(src_msg),
-                                        "dest_message": json.dumps(msg),
+                                        "src_message": src_message,
+                                        "dest_message": dest_message,
                                         "op_heading": f"Channel: {route.name}",
                                         "dest_system_name": dest_server.name,
                                         "src_systemid": src_server.system_id
@@ -301,8 +511,7 @@ async def route_manager():
         while True:
             try:
 
-                with session_local() as db:
-                    all_routes = db.query(models.Route).all()
+                all_routes = await run_db(repositories.list_routes)
 
                 current_route_ids = {r.route_id for r in all_routes}
 
@@ -313,11 +522,13 @@ async def route_manager():
                     for task in active_route_listners.pop(stale_id, []):
                         task.cancel()
                     route_queue.pop(stale_id, None)
+                    route_names.pop(stale_id, None)
 
                 for route in all_routes:
                     if route.route_id not in active_route_listners:
 
-                        route_queue[route.route_id] = asyncio.Queue() # make a async queue for a new route that is not listning
+                        route_queue[route.route_id] = metrics.TimedQueue() # make a async queue for a new route that is not listning
+                        route_names[route.route_id] = route.name
                         tasks = [
                             asyncio.create_task(route_worker(route, worker_number=worker_number))
                             for worker_number in range(1, _ROUTE_WORKER_CONCURRENCY + 1)
@@ -328,6 +539,7 @@ async def route_manager():
                             route.name,
                             _ROUTE_WORKER_CONCURRENCY,
                         )
+                        await replay_checkpoints(route.route_id, route.name)
                 await asyncio.sleep(5)
 
             except asyncio.CancelledError:
@@ -351,6 +563,158 @@ async def route_manager():
             return_exceptions=True,
         )
 
+def _span_outcome(fut: asyncio.Future) -> str:
+    if not fut.done():
+        return "unresolved"
+    if fut.cancelled():
+        return "cancelled" # ingest stopped waiting (INGEST_AWAIT_TIMEOUT)
+    if fut.exception() is not None:
+        return "failed"
+    result = fut.result()
+    if isinstance(result, dict) and result.get("status") == "queued_for_retry":
+        return "parked"
+    return "delivered"
+
+
+def _log_redelivery_outcome(route_name: str, fut: asyncio.Future):
+    if fut.cancelled():
+        logger.warning("redelivery for route '%s' was cancelled", route_name)
+        return
+    exp = fut.exception()
+    if exp is not None:
+        logger.error("redelivery for route '%s' failed: %s", route_name, exp)
+    else:
+        logger.info("redelivery for route '%s' succeeded", route_name)
+
+
+def _write_checkpoints(db, rows: list[dict]) -> None:
+    db.add_all(models.DeliveryCheckpoint(**row) for row in rows)
+    db.commit()
+
+
+def _claim_checkpoints(db, route_id: int) -> list[tuple]:
+    """
+    Load and delete the checkpoint rows of one route, returned as
+    (src_path_to_value, simple_paths, src_msg) tuples, src_msg being the source message's text. Each row is deleted individually and only
+    kept when this process' delete actually removed it, so two engine processes starting at
+    the same time never replay the same message twice.
+    """
+    claimed = []
+    rows = [
+        (row.checkpoint_id, row.src_path_to_value, row.simple_paths, row.src_msg)
+        for row in db.query(models.DeliveryCheckpoint)
+        .filter(models.DeliveryCheckpoint.route_id == route_id)
+        .order_by(models.DeliveryCheckpoint.checkpoint_id).all()
+    ]
+    for checkpoint_id, src_path_to_value, simple_paths, src_msg in rows:
+        deleted = db.query(models.DeliveryCheckpoint) \
+            .filter(models.DeliveryCheckpoint.checkpoint_id == checkpoint_id) \
+            .delete(synchronize_session=False)
+        db.commit()
+        if deleted == 1:
+            claimed.append((src_path_to_value, simple_paths, src_msg))
+    return claimed
+
+
+async def replay_checkpoints(route_id: int, route_name: str):
+    """
+    Re-enqueue the messages checkpointed for this route by a previous shutdown. Like
+    redelivery, replay is best-effort: nobody awaits the fresh futures, the outcome is logged.
+    """
+    try:
+        rows = await run_db(_claim_checkpoints, route_id)
+    except Exception:
+        logger.exception("failed to load checkpoints for route '%s'", route_name)
+        return
+    if not rows:
+        return
+
+    loop = asyncio.get_running_loop()
+    for src_path_to_value, simple_paths, src_message in rows:
+        if not isinstance(src_message, str): # an older checkpoint row holds a FHIR message as a dict
+            src_message = json_codec.dumps_str(src_message)
+        new_future = loop.create_future()
+        new_future.add_done_callback(lambda fut, name=route_name: _log_redelivery_outcome(name, fut))
+        span = tracing.RouteSpan(uuid4().hex[:12], route_name)
+        await route_queue[route_id].put((src_path_to_value, simple_paths, new_future, src_message, span))
+    logger.info("replayed %s checkpointed messages for route '%s'", len(rows), route_name)
+
+
+async def drain_and_checkpoint(route_manager_task: asyncio.Task, deadline_secs: float):
+    """
+    Shutdown drain. MLLP messages on connections still open are answered AE from here on (HTTP
+    ingest has already stopped: uvicorn closes its sockets and finishes the requests in progress
+    before the lifespan shutdown runs), then route workers get up to `deadline_secs` to finish what is queued and in flight. Whatever is still queued, in flight
+    (cancelled mid-delivery, so it may be delivered twice) or parked for an inactive destination
+    when the deadline hits is written to `delivery_checkpoint` and replayed on the next start.
+    Futures of checkpointed messages resolve as `queued_for_retry`, so any ingest still waiting
+    on them answers "parked" instead of timing out.
+    """
+    global _draining
+    _draining = True
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + deadline_secs
+    next_report = 0.0
+    while True:
+        queued = sum(q.qsize() for q in route_queue.values())
+        busy = len(in_flight_messages)
+        if queued == 0 and busy == 0:
+            logger.info("drain: all route queues empty, nothing in flight")
+            break
+        now = loop.time()
+        if now >= deadline:
+            logger.warning("drain: deadline of %ss reached with queued=%s in_flight=%s", deadline_secs, queued, busy)
+            break
+        if now >= next_report:
+            logger.info("drain: queued=%s in_flight=%s parked_destinations=%s remaining=%.1fs",
+                        queued, busy, len(pending_redelivery), deadline - now)
+            next_report = now + 1
+        await asyncio.sleep(0.2)
+
+    # Snapshot in-flight items BEFORE cancelling: route_manager cancels every worker.
+    in_flight = list(in_flight_messages.items())
+    route_manager_task.cancel()
+    await asyncio.gather(route_manager_task, return_exceptions=True)
+
+    pending: list[tuple[int, str, tuple]] = []
+    for (route_id, _, _), item in in_flight:
+        if not item[2].done():
+            pending.append((route_id, "in_flight", item))
+    for route_id, queue in route_queue.items():
+        while not queue.empty():
+            pending.append((route_id, "queued", queue.get_nowait()))
+    for dest_server_id in list(pending_redelivery.keys()):
+        for route_id, _, (src_path_to_value, simple_paths, src_message, _) in pending_redelivery.pop(dest_server_id):
+            pending.append((route_id, "parked", (src_path_to_value, simple_paths, None, src_message, None)))
+
+    if not pending:
+        logger.info("drain complete — nothing to checkpoint")
+        return
+
+    rows = [
+        {
+            "route_id": route_id,
+            "reason": reason,
+            "src_path_to_value": src_path_to_value,
+            "simple_paths": simple_paths,
+            "src_msg": src_message,
+        }
+        for route_id, reason, (src_path_to_value, simple_paths, _, src_message, _) in pending
+    ]
+    try:
+        await run_db(_write_checkpoints, rows)
+        logger.info("drain complete — checkpointed %s messages (%s)", len(rows),
+                    dict(Counter(reason for _, reason, _ in pending)))
+    except Exception:
+        logger.exception("drain: failed to checkpoint %s messages — they are lost", len(rows))
+        return
+
+    for _, _, (_, _, future, _, _) in pending:
+        if future is not None and not future.done():
+            future.set_result({"status": "queued_for_retry", "destination": None, "checkpointed": True})
+
+
 async def redelivery_watcher():
     """
     Background task that periodically checks the `pending_redelivery` buffer and re-enqueues
@@ -360,16 +724,6 @@ async def redelivery_watcher():
     past `_INACTIVE_DEST_MAX_RETRIES`. Each retried message gets a fresh future; we don't
     await it (best-effort redelivery) and log any failure via a done-callback.
     """
-    def _log_redelivery_outcome(route_name: str, fut: asyncio.Future):
-        if fut.cancelled():
-            logger.warning("redelivery for route '%s' was cancelled", route_name)
-            return
-        exp = fut.exception()
-        if exp is not None:
-            logger.error("redelivery for route '%s' failed: %s", route_name, exp)
-        else:
-            logger.info("redelivery for route '%s' succeeded", route_name)
-
     try:
         while True:
             await asyncio.sleep(_REDELIVERY_CHECK_INTERVAL)
@@ -378,39 +732,43 @@ async def redelivery_watcher():
 
             try:
                 loop = asyncio.get_running_loop()
-                with session_local() as db:
-                    for dest_server_id in list(pending_redelivery.keys()):
-                        dest_server = db.get(models.Server, dest_server_id)
-                        if dest_server is None:
-                            dropped = pending_redelivery.pop(dest_server_id, [])
-                            logger.error(
-                                "dropping %s parked messages — destination server id=%s no longer exists",
-                                len(dropped), dest_server_id,
+                # One lookup for every parked destination; no session is held across the puts below.
+                dest_server_ids = list(pending_redelivery.keys())
+                dest_servers = await run_db(repositories.get_servers, dest_server_ids)
+                for dest_server_id in dest_server_ids:
+                    dest_server = dest_servers.get(dest_server_id)
+                    if dest_server is None:
+                        dropped = pending_redelivery.pop(dest_server_id, [])
+                        logger.error(
+                            "dropping %s parked messages — destination server id=%s no longer exists",
+                            len(dropped), dest_server_id,
+                        )
+                        continue
+                    if dest_server.status != "Active":
+                        continue
+
+                    items = pending_redelivery.pop(dest_server_id, [])
+                    logger.info(
+                        "redelivering %s parked messages to %s (id=%s)",
+                        len(items), dest_server.name, dest_server_id,
+                    )
+                    for route_id, route_name, parked_payload in items:
+                        if route_id not in route_queue:
+                            logger.warning(
+                                "cannot redeliver to route '%s' (id=%s) — route_queue missing",
+                                route_name, route_id,
                             )
                             continue
-                        if dest_server.status != "Active":
-                            continue
-
-                        items = pending_redelivery.pop(dest_server_id, [])
-                        logger.info(
-                            "redelivering %s parked messages to %s (id=%s)",
-                            len(items), dest_server.name, dest_server_id,
+                        src_path_to_value, simple_paths, src_message, trace_id = parked_payload
+                        new_future = loop.create_future()
+                        new_future.add_done_callback(
+                            lambda fut, name=route_name: _log_redelivery_outcome(name, fut)
+                        )
+                        # Keep the original trace id so the redelivery shows up under the same trace.
+                        span = tracing.RouteSpan(trace_id, route_name)
+                        await route_queue[route_id].put(
+                            (src_path_to_value, simple_paths, new_future, src_message, span)
                         )
-                        for route_id, route_name, parked_payload in items:
-                            if route_id not in route_queue:
-                                logger.warning(
-                                    "cannot redeliver to route '%s' (id=%s) — route_queue missing",
-                                    route_name, route_id,
-                                )
-                                continue
-                            src_path_to_value, simple_paths, src_msg = parked_payload
-                            new_future = loop.create_future()
-                            new_future.add_done_callback(
-                                lambda fut, name=route_name: _log_redelivery_outcome(name, fut)
-                            )
-                            await route_queue[route_id].put(
-                                (src_path_to_value, simple_paths, new_future, src_msg)
-                            )
             except asyncio.CancelledError:
                 raise
             except Exception:
@@ -425,25 +783,16 @@ async def route_worker(route, worker_number: int = 1):
         use Route worker to listen incomming data using aysync queue, then it validates, sends data,
         parses data and converts data from fhir <--> hl7.
 
-        The queue items are (src_path_to_value, future) tuples. After delivery the worker
-        resolves the future so that ingest() can await the result and respond to the caller
-        with a real success/failure status.
+        The queue items are (src_path_to_value, simple_paths, future, src_message, span) tuples;
+        src_message is the source message's text, encoded once by _process_message for the logs.
+        After delivery the worker resolves the future so that ingest() can await the result and
+        respond to the caller with a real success/failure status. The span carries the ingest
+        trace id and collects the stage timings served by /logs/traces.
     """
     client = None
     try:
-        with session_local() as db:
-            dest_endpoint = db.get(models.Endpoints, route.dest_endpoint_id)
-            dest_server = db.get(models.Server, route.dest_server_id)
-            src_server = db.get(models.Server, route.src_server_id)
-
-            src_endpoint_fields = db.query(models.EndpointFields) \
-                .filter(models.EndpointFields.endpoint_id == route.src_endpoint_id).all()
-
-            dest_endpoint_fields = db.query(models.EndpointFields) \
-                .filter(models.EndpointFields.endpoint_id == route.dest_endpoint_id).all()
-
-            mapping_rules_for_specific_route = db.query(models.MappingRule) \
-                .filter(models.MappingRule.route_id == route.route_id).all()
+        (dest_endpoint, dest_server, src_server, src_endpoint_fields, dest_endpoint_fields,
+         mapping_rules_for_specific_route) = await run_db(repositories.load_route_context, route)
 
         if dest_endpoint is None or dest_server is None or src_server is None:
             logger.error(
@@ -459,189 +808,92 @@ async def route_worker(route, worker_number: int = 1):
             we then do some transformation if needed, and then we take the dest_path from the dest_id_to_path using the dest_field_id, 
             we know have the path, just take the src value and put it against the path and make the message.
         """
+        destination_names[route.dest_server_id] = dest_server.name
         src_id_to_path = {f.endpoint_field_id: f.path for f in src_endpoint_fields} # e.g. path = Patient-identifier[0].value
         dest_id_to_path = {f.endpoint_field_id: f.path for f in dest_endpoint_fields}
         dest_path_to_resource = {f.path: f.resource for f in dest_endpoint_fields} # use resource for making messages.
 
+        # Regex and format rules are compiled once per worker. Rules saved before routes were
+        # validated and that do not compile are left out here and fail per message as they always did.
+        compiled_regex_rules = {}
+        compiled_format_rules = {}
+        for rule in mapping_rules_for_specific_route:
+            try:
+                if rule.transform_type == "regex":
+                    compiled_regex_rules[rule.mapping_rule_id] = compile_regex_rule(rule.config["from"], rule.config["to"])
+                elif rule.transform_type == "format":
+                    compiled_format_rules[rule.mapping_rule_id] = DateFormatRule.from_config(rule.config)
+            except (re.error, ValueError, KeyError, TypeError) as exp:
+                logger.error("route '%s' %s rule %s does not compile: %s", route.name, rule.transform_type, rule.mapping_rule_id, exp)
+
         logger.info(f"route_worker {worker_number} started for route -> {route.name}")
 
         dest_endpoint_url = f"http://{dest_server.ip}:{dest_server.port}{dest_endpoint.url}"
+        if _uses_mllp(dest_server):
+            dest_endpoint_url = f"mllp://{dest_server.ip}:{dest_server.port}" # where logs say it went
         dest_system_id = dest_server.system_id
         client = httpx.AsyncClient(timeout=httpx.Timeout(_HTTP_READ_TIMEOUT, connect=5.0), verify=_SHARED_SSL_CONTEXT)
         destination_semaphore = _get_destination_semaphore(route.dest_server_id)
 
-        while True:
-            # Each queue item is a (data, future) tuple.
-            # The future lets ingest() know whether delivery succeeded or failed.
-            src_path_to_value, simple_paths, result_future, src_msg = await route_queue[route.route_id].get()
-            logger.info(f"route_worker {worker_number} for `route -> {route.name} received data: {src_path_to_value}")
-            normal_src_paths_counter = [] # this will contain data just the output_data dictionary, but with the src paths instead of dest paths, useful for multiple same segments/sources to extract data from.
-            split_src_paths_counter = []
-            concat_src_paths_counter = []
-
-            simple_path_counts = Counter(simple_paths) # this will convert list [PID-5.1, PID-5.2, PID-5.1] into Counter({'PID-5.1': 2, 'PID-5.2': 1}). instead of using list.count() that iterate list everytime, you take the counts once.
-
-            output_data = {} # contains the output fields with value
-            concat_data = {} # contains single dest field id, and multiple mapping rule that concate multiple src into a single destination.
-            split_data = {} # contain single src field id, and multiple mapping rule that split that single src into multiple destination.
-
-            # if dest_server.status == "Inactive" :
-            #         logger.error(f"Destination server {dest_server.name} is Inactive")
-            #         result_future.set_exception(Exception(err))
-            #         continue
-            try:
-                for rule in mapping_rules_for_specific_route: # rule for each src-to-dest field mapping in the route
-                    if rule.transform_type == 'concat': # for concat we should have multiple src and 1 dest
-                        # this takes a key and the value, if the key doesn't exists or exists with a different value
-                        # it will replace it with []
-                        concat_data.setdefault(rule.dest_field_id, []) 
-                        # this rule contains the src ids and other metadata that will be use for concatination.
-                        concat_data[rule.dest_field_id].append(rule)
-                    
-                    elif rule.transform_type == 'split': # for split we should have multiple dest and 1 src
-                        # here we have a singe src id, that will split into multiple destinations
-                        split_data.setdefault(rule.src_field_id, []).append(rule)
-                    
-                    else: # map | copy | format | regex
-                        src_path = src_id_to_path[rule.src_field_id]
-
-                        for _ in range(simple_path_counts[src_path]): # if there is multiple same src paths then we have to do the transformation for that many times, and also have to take care of the counter in the segment name.
-
-                            src_path = await increment_segment(segment_path=src_path, list_data=normal_src_paths_counter) # here PID-5.1 will become PID[1]-5.1, useful when multiple same segments.
-                            normal_src_paths_counter.append(src_path) # just to keep the count of the src paths that we have, and to increment the segment if there is multiple same segments.
-
-                            if src_path not in src_path_to_value:
-                                logger.warning(f"The src path {src_path} not found in src_path_to_value: {src_path_to_value}")
-                                continue
-                            value = src_path_to_value[src_path]
-
-                            if rule.transform_type == 'map':
-                                # here the first value will give me the map value, if the mapping value is not found then return the default value
-                                value = rule.config.get(str(value).lower(), value) 
-
-                            elif rule.transform_type == "regex":
-                                value = regex_replace_with_template(value=value, pattern_from=rule.config["from"], pattern_to=rule.config["to"])
-
-                            elif rule.transform_type == 'format':
-                                try: # 2004-10-06 → 20041006 vice versa
-                                    dt = datetime.strptime(str(value), rule.config["from"])
-                                    value = dt.strftime(rule.config["to"])
-                                except Exception as exp:
-                                    try:
-                                        dt = datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S")
-                                        value = dt.strftime(rule.config["to"])
-                                    except ValueError:
-                                        logger.error(f"Error while transformation: {str(exp)}")
-
-                            if rule.dest_field_id not in dest_id_to_path:
-                                logger.error(f"""The destination id in rule {rule.dest_field_id}
-                                            does not matches with the destination map id {dest_id_to_path}""")
-                                continue
-                                
-                            dest_path = dest_id_to_path[rule.dest_field_id]
-                            dest_path = await increment_segment(output_data=output_data, segment_path=dest_path) # here PID-5.1 will become PID[1]-5.1
-                            output_data[dest_path] = value
-                            logger_mapping.info(f"src_path: {src_path}, dest_path: {dest_path} value: {value}")
-
-                logger.info(f"output data dictionary before & without concat and split transformation for route {route.name} -> {output_data}")
-                logger.info(f"concat_data for route {route.name} -> {concat_data}")
-                logger.info(f"split_data for route {route.name} -> {split_data}")
-
-                ################################## Concat Data ##################################
-                for dest_id , concat_rules in concat_data.items(): 
-                    logger_mapping.info(f"Applying concat transformation for dest_id: {dest_id} with rules: {concat_rules}")
-                    multiple_src_paths_to_concat: dict[int, list[str]] = dict() # this will contain data like this: {1: [PID-5.1, PID[1]-5.1], 2: [PID-5.2, PID[1]-5.2]} this is useful when we have multiple same src paths to concatinate, and also to take care of the counter in the segment name.
-                    
-                    delimiter = " "
-                    for concat_rule in concat_rules:
-                        delimiter = concat_rule.config.get('delimiter', " ") # concat on delimiter or by default with space " "
-
-                        src_path = src_id_to_path[concat_rule.src_field_id]
-                        for i in range(simple_path_counts[src_path]): # if there is multiple same src paths then we have to do the transformation for that many times, and also have to take care of the counter in the segment name.
-                            
-                            current_src_path = await increment_segment(segment_path=src_path, list_data=concat_src_paths_counter)
-                            concat_src_paths_counter.append(current_src_path)
-
-                            if current_src_path in src_path_to_value:
-
-                                if i not in multiple_src_paths_to_concat:
-                                    multiple_src_paths_to_concat[i] = []
-                                multiple_src_paths_to_concat[i].append(str(src_path_to_value[current_src_path]))
-
-                            else:
-                                logger.warning(f"while Concatnation, The src_path '{current_src_path}' not found in path data: '{src_path_to_value}'")
-                                continue
-                                        
-                    for idx in multiple_src_paths_to_concat.keys(): # here we are taking the values of the same src paths with the same counter and concatinate them.
-                        concated_value = delimiter.join(multiple_src_paths_to_concat[idx])
-
-                        dest_path = dest_id_to_path[dest_id]
-                        dest_path = await increment_segment(output_data=output_data, segment_path=dest_path)
-                        output_data[dest_path] = concated_value
-                        logger.info(f"Concated value for dest_path {dest_path} is {concated_value}")
-                
-                #################################### Split Data ####################################
-                for src_id, split_rules in split_data.items():
-                    logger_mapping.info(f"Applying split transformation for src_id: {src_id} with split_rules: {split_rules}")
-
-                    for _ in range(simple_path_counts[src_id_to_path[src_id]]): # if there is multiple same src paths then we have to do the transformation for that many times, and also have to take care of the counter in the segment name.
-                        src_path = src_id_to_path[src_id]
-                        src_path = await increment_segment(segment_path=src_path, list_data=split_src_paths_counter)
-                        split_src_paths_counter.append(src_path)
-                        
-                        if src_path not in src_path_to_value:
-                            logger.warning(f"while Spliting, The src_path {src_path} not found in path data: {src_path_to_value}")
-                            continue
-                        
-                        # As split_rules 
-                        delimiter= split_rules[0].config.get('delimiter', ' ') # concat on delimiter or by default with space " " 
-                        parts = str(src_path_to_value[src_path]).split(delimiter)
-
-                        last_dest_path = None
-                        for i, split_rule in enumerate(split_rules):
-                            if i < len(parts):
-
-                                dest_path = dest_id_to_path[split_rule.dest_field_id]
-                                dest_path = await increment_segment(output_data=output_data, segment_path=dest_path)
-                                output_data[dest_path] = parts[i]
-                                last_dest_path = dest_path
-                        
-                        if len(parts) > len(split_rules) and last_dest_path: # here if the while spliting, if there is some data left concatenate it with the last path
-                            logger.info(f"destination path for remaining data ---> {last_dest_path}")
-                            output_data[last_dest_path] += " " + (' ').join(parts[len(split_rules):]) # join all the remaining parts with the remining data
-                        elif last_dest_path is None:
-                            logger.warning(f"while Splitting, last_dest_path is None: {last_dest_path}, means no split data is mapped to any destination")
-
-                output_data = fill_duplicate_missing_values(output_data)
-            except Exception as exp:
-                logger.exception(f"{exp} -> This came when processing data for route -> '{route.name}'")
+        payload_max_chars = _payload_log_max_chars(route.name) # warnings are never sampled, only truncated
+        transform_plan = MappingPlan(route.name, mapping_rules_for_specific_route, src_id_to_path, dest_id_to_path,
+                                     compiled_regex_rules, compiled_format_rules)
+        hl7_template = HL7MessageTemplate(src_server.name, dest_server.name, route.msg_type)
+        fhir_template = FHIRMessageTemplate(dest_path_to_resource)
+
+        async def build_and_deliver(queue_item, output_data, dest_server):
+            """Build the message of one transformed queue item, deliver it and resolve its future."""
+            src_path_to_value, simple_paths, result_future, src_message, span = queue_item
+            trace_id = span.trace_id
+            payload_budget = _payload_log_budget(route.name)
+            log_payloads = payload_budget > 0 and logger.isEnabledFor(logging.INFO)
+            log_mapping = payload_budget > 0 and logger_mapping.isEnabledFor(logging.INFO)
+            if log_payloads:
+                logger.info("trace=%s route_worker %s for `route -> %s received data: %s",
+                            trace_id, worker_number, route.name, LazyPayload(src_path_to_value, payload_budget))
+
+            if isinstance(output_data, Exception):
+                logger.error(f"trace={trace_id} {output_data} -> This came when processing data for route -> '{route.name}'",
+                             exc_info=output_data)
                 if not result_future.done():
-                    result_future.set_exception(exp)
-                # Skip the delivery block below and pick up the next queue item.
-                continue
+                    result_future.set_exception(output_data)
+                return
 
+            stage_started = time.perf_counter()
+            span.mark("build_start")
             try:
                 # BUILD MESSAGE
                 output_data = await set_null_if_not_available(output_data, dest_path_to_resource) # set the data to null if data if not available.
-                logger.info(f"Output for route -> {route.name}: {output_data}")
+                if log_payloads:
+                    logger.info("Output for route -> %s: %s", route.name, LazyPayload(output_data, payload_budget))
 
                 if dest_server.protocol == "FHIR":
-                    logger_mapping.info(f"Building FHIR message for route -> {route.name} with output_data: {output_data} and dest_path_to_resource: {dest_path_to_resource}")
-                    msg = await build_fhir_message(output_data, dest_path_to_resource) # make a fhir message with the data
+                    if log_mapping:
+                        logger_mapping.info("Building FHIR message for route -> %s with output_data: %s and dest_path_to_resource: %s",
+                                            route.name, LazyPayload(output_data, payload_budget),
+                                            LazyPayload(dest_path_to_resource, payload_budget))
+                    msg = fhir_template.build(output_data) # make a fhir message with the data
+                    body = json_codec.dumps(msg) # encoded once: sent as is, and its text is what gets logged
+                    dest_message = body.decode("utf-8")
 
                 else:
-                    logger_mapping.info(f"Building HL7 message for route -> {route.name} with output_data: {output_data}")
-                    msg = await build_hl7_message(output_data=output_data, src=src_server.name,
-                                                   dest=dest_server.name, msg_type=route.msg_type)
-                logger.info(f"Built message for route -> {route.name}:\n {msg}")
+                    if log_mapping:
+                        logger_mapping.info("Building HL7 message for route -> %s with output_data: %s",
+                                            route.name, LazyPayload(output_data, payload_budget))
+                    msg = hl7_template.build(output_data)
+                    body = msg
+                    dest_message = json_codec.dumps_str(msg)
+                metrics.ROUTE_STAGE_SECONDS.observe(time.perf_counter() - stage_started, "build", route.name)
+                span.mark("build_end")
+                if log_payloads:
+                    logger.info("Built message for route -> %s:\n %s", route.name, LazyPayload(msg, payload_budget))
             except Exception as exp:
-                logger.exception(f"Error while sending data: {str(exp)}")
+                logger.exception(f"trace={trace_id} Error while sending data: {str(exp)}")
 
             try:
                 # DELIVER — resolve the future so ingest() knows the result
                 if client:
-                    with session_local() as db:
-                        dest_server = db.get(models.Server, route.dest_server_id)
+                    dest_server = await run_db(repositories.get_server, route.dest_server_id)
 
                     retries = 0
                     while dest_server is not None and dest_server.status == "Inactive" and retries < _INACTIVE_DEST_MAX_RETRIES:
@@ -651,31 +903,30 @@ async def route_worker(route, worker_number: int = 1):
                         )
                         await asyncio.sleep(_INACTIVE_DEST_BACKOFF_SECS)
                         retries += 1
-                        with session_local() as db:
-                            dest_server = db.get(models.Server, route.dest_server_id)
+                        dest_server = await run_db(repositories.get_server, route.dest_server_id)
 
                     if dest_server is None: # if dest server is none.
                         err = f"Destination server (id={route.dest_server_id}) no longer exists in DB"
-                        logger.error(err)
+                        logger.error("trace=%s %s", trace_id, err)
                         if not result_future.done():
                             result_future.set_exception(Exception(err))
-                        continue
+                        return
 
                     if dest_server.status == "Inactive": # if its inactive.
                         # Park the message so redelivery_watcher() can replay it once the destination comes back.
-                        parked_payload = (src_path_to_value, simple_paths, src_msg)
+                        parked_payload = (src_path_to_value, simple_paths, src_message, trace_id)
                         pending_redelivery.setdefault(route.dest_server_id, []).append(
                             (route.route_id, route.name, parked_payload)
                         )
                         parked_count = len(pending_redelivery[route.dest_server_id])
                         logger.warning(
-                            "Parked message for route '%s' (dest=%s) — queued_for_retry=%s",
-                            route.name, dest_server.name, parked_count,
+                            "trace=%s Parked message for route '%s' (dest=%s) — queued_for_retry=%s",
+                            trace_id, route.name, dest_server.name, parked_count,
                         )
                         db_logger.warning(
                             f"Destination {dest_server.name} inactive — message parked for retry",
                             extra={
-                                "src_message": json.dumps(src_msg) if isinstance(src_msg, (dict, list)) else str(src_msg),
+                                "src_message": src_message,
                                 "dest_message": "(not built — parked before delivery)",
                                 "op_heading": f"Channel: {route.name}",
                             },
@@ -686,8 +937,8 @@ async def route_worker(route, worker_number: int = 1):
                                 "destination": dest_server.name,
                                 "parked_count": parked_count,
                             })
-                        continue
-                print(f"Toggle value: {user.toggle}")
+                        return
+                logger.debug("Toggle value: %s", user.toggle)
                 if user.toggle:
                     request_headers = {}
                     if dest_system_id is not None:
@@ -695,71 +946,10 @@ async def route_worker(route, worker_number: int = 1):
                         request_headers["Src-System-Id"] = str(src_server.system_id)
                         request_headers["Src-System-Name"] = str(src_server.name)
 
-                    db = session_local()
-
-                    hold_type = src_server.category + " - " + dest_server.category
-                    
-                    hold_flag=1
-                    if src_server.category == "EHR" and dest_server.category == "LIS":
-                        hold_flag=2
-
-                    elif src_server.category == "LIS" and dest_server.category == "EHR":
-                        hold_flag=3
-
-                    elif src_server.category == "EHR" and dest_server.category == "PHR":
-                        hold_flag=4
-
-                    elif src_server.category == "EHR" and dest_server.category == "Payer":
-                        hold_flag=5
-
-                    elif src_server.category == "Payer" and dest_server.category == "EHR":
-                        hold_flag=6
-                    
-
-                    is_config = db.query(models.Config).filter(models.Config.hold_type == hold_type).first()
-                    if not is_config:
-                        config = models.Config(
-                            data = [
-                                {
-                                    "route_id": route.route_id,
-                                    "endpoint_destination": dest_endpoint_url,
-                                    "src_server_id": src_server.server_id,
-                                    "dest_server_id": dest_server.server_id,
-                                    "src_msg": [src_msg],
-                                    "data": [msg] 
-                                }
-                            ],
-                            count=1,
-                            hold_type=hold_type,
-                            hold_flag=hold_flag
-                        )
-                        db.add(config)
-                    else:
-
-                        is_config.count +=1
-                        is_config.hold_flag=hold_flag
-                        
-                        for config_list in is_config.data:
-                            
-                            if config_list.get("route_id", "") == route.route_id:
-                                config_list["data"].append(msg)
-                                config_list["src_msg"].append(src_msg)
-                            
-                            else:
-                                is_config.data.append({
-                                    "route_id": route.route_id,
-                                    "endpoint_destination": dest_endpoint_url,
-                                    "src_server_id": src_server.server_id,
-                                    "dest_server_id": dest_server.server_id,
-                                    "src_msg": [src_msg],
-                                    "data": [msg]
-                                })
-                            flag_modified(is_config, "data")
-                        
-                        db.add(is_config)
-                    db.commit()
-                    logger.info(f"Data Holded Sucessfully for type: {hold_type} data= {msg}")
-                    db.close()
+                    hold_type = await run_db(
+                        repositories.hold_message, route, src_server, dest_server, dest_endpoint_url, src_message, msg,
+                    )
+                    logger.info("Data Holded Sucessfully for type: %s data= %s", hold_type, LazyPayload(msg, payload_max_chars))
 
                 else:
                     request_headers = {}
@@ -768,55 +958,73 @@ async def route_worker(route, worker_number: int = 1):
                         request_headers["Src-System-Id"] = str(src_server.system_id)
                         request_headers["Src-System-Name"] = str(src_server.name)
 
-                    db = session_local()
                     async with destination_semaphore:
                         logger.info(f"Sending data to url: {dest_endpoint_url}")
-                        if dest_server.protocol == "FHIR":
-                            response = await client.post(url=dest_endpoint_url, json=msg, headers=request_headers)
-                        else:
-                        # HL7 is plain text — do NOT json= encode it or it arrives as a
-                        # JSON string "MSH|..." instead of the raw HL7 text
-                            request_headers["Content-Type"] = "text/plain"
-                            response = await client.post(
-                                url=dest_endpoint_url,
-                                content=msg,
-                                headers=request_headers
-                            )
-
-                    if response.status_code in (200, 201, 202, 203, 204):
+                        stage_started = time.perf_counter()
+                        span.mark("deliver_start")
+                        try:
+                            if _uses_mllp(dest_server):
+                                ack = await mllp.get_client(dest_server.ip, dest_server.port).send(body)
+                                delivered, outcome, detail = ack.accepted, ack.code or "no-ack", ack.text
+                            else:
+                                if dest_server.protocol == "FHIR":
+                                    request_headers["Content-Type"] = "application/json"
+                                    response = await client.post(url=dest_endpoint_url, content=body, headers=request_headers)
+                                else:
+                                # HL7 is plain text — do NOT json= encode it or it arrives as a
+                                # JSON string "MSH|..." instead of the raw HL7 text
+                                    request_headers["Content-Type"] = "text/plain"
+                                    response = await client.post(
+                                        url=dest_endpoint_url,
+                                        content=body,
+                                        headers=request_headers
+                                    )
+                                delivered = response.status_code in (200, 201, 202, 203, 204)
+                                outcome, detail = str(response.status_code), response.text
+                        except (httpx.HTTPError, OSError, asyncio.TimeoutError): # MLLP: connect failures, ACK timeouts
+                            metrics.DESTINATION_RESPONSES.inc(dest_server.name, "error")
+                            raise
+                        finally:
+                            metrics.ROUTE_STAGE_SECONDS.observe(time.perf_counter() - stage_started, "deliver", route.name)
+                            span.mark("deliver_end")
+                    metrics.DESTINATION_RESPONSES.inc(dest_server.name, outcome)
+
+                    if delivered:
                         db_logger.info(f"Data Sucessfully Send to : {dest_server.name}",
                                     extra= {
-                                            "src_message": json.dumps(src_msg),
-                                            "dest_message": json.dumps(msg),
+                                            "src_message": src_message,
+                                            "dest_message": dest_message,
                                             "op_heading": f"Channel: {route.name}",
                                             "dest_system_name": dest_server.name,
                                             "src_systemid": src_server.system_id
                                         }
                         )
-                        logger.info(f"Successfully sent to url: {dest_endpoint_url}")
-                        result_future.set_result(True)
+                        logger.info(f"trace={trace_id} Successfully sent to url: {dest_endpoint_url}")
+                        if not result_future.done(): # ingest may have timed out and cancelled it
+                            result_future.set_result(True)
                     else:
-                        err = f"Destination {dest_endpoint_url} returned {response.status_code}: {response.text}"
-                        logger.error(err)
+                        err = f"Destination {dest_endpoint_url} returned {outcome}: {detail}"
+                        logger.error("trace=%s %s", trace_id, err)
                         db_logger.error(f"Data Failed to Send to : {dest_server.name}",
                                     extra= {
-                                            "src_message": json.dumps(src_msg),
-                                            "dest_message": json.dumps(msg),
+                                            "src_message": src_message,
+                                            "dest_message": dest_message,
                                             "op_heading": f"Channel: {route.name}",
                                             "dest_system_name": dest_server.name,
                                             "src_systemid": src_server.system_id
                                         }
                         )
-                        result_future.set_exception(Exception(err))
-                result_future.set_result(True)
+                        if not result_future.done():
+                            result_future.set_exception(Exception(err))
+                if not result_future.done():
+                    result_future.set_result(True)
 
             except Exception as exp:
-                db.close()
-                logger.exception(f"{exp} -> This came when sending data for route -> '{route.name}'")
+                logger.exception(f"trace={trace_id} {exp} -> This came when sending data for route -> '{route.name}'")
                 db_logger.error(f"Data Failed to Send to : {dest_server.name}",
                                 extra= {
-                                        "src_message": json.dumps(src_msg),
-                                        "dest_message": json.dumps(msg) if 'msg' in locals() else
+                                        "src_message": src_message,
+                                        "dest_message": dest_message if 'msg' in locals() else
                                         "msg not defined due to error in message building",
                                         "op_heading": f"Channel: {route.name}"
                                     }
@@ -824,7 +1032,56 @@ async def route_worker(route, worker_number: int = 1):
                 if not result_future.done():
                     result_future.set_exception(exp)
 
+        async def deliver_item(in_flight_key, queue_item, output_data):
+            await build_and_deliver(queue_item, output_data, dest_server)
+            # Not in a finally: a worker cancelled mid-delivery leaves the item in in_flight_messages
+            # for drain_and_checkpoint to checkpoint.
+            tracing.record(queue_item[4], _span_outcome(queue_item[2]))
+            in_flight_messages.pop(in_flight_key, None)
+
+        while True:
+            # Each queue item is a (data, simple_paths, future, src_message, span) tuple.
+            # The future lets ingest() know whether delivery succeeded or failed.
+            # Whatever else is already queued (a backlog) is taken along, up to _ROUTE_BATCH_SIZE.
+            queue_items = [await route_queue[route.route_id].get()]
+            while len(queue_items) < _ROUTE_BATCH_SIZE:
+                try:
+                    queue_items.append(route_queue[route.route_id].get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            in_flight_keys = [(route.route_id, worker_number, slot) for slot in range(len(queue_items))]
+            for key, queue_item in zip(in_flight_keys, queue_items):
+                in_flight_messages[key] = queue_item
+                queue_item[4].worker = worker_number
+                queue_item[4].mark("dequeue")
+                queue_item[4].mark("transform_start")
+
+            stage_started = time.perf_counter()
+            payload_budget = _payload_log_budget(route.name)
+            log_value = None
+            if payload_budget > 0 and logger_mapping.isEnabledFor(logging.INFO):
+                log_value = lambda value: LazyPayload(value, payload_budget)
+            outputs = await transform_plan.transform_batch([(item[0], item[1]) for item in queue_items], log_value)
+            transform_seconds = (time.perf_counter() - stage_started) / len(queue_items)
+            for queue_item, output_data in zip(queue_items, outputs):
+                if not isinstance(output_data, Exception):
+                    metrics.ROUTE_STAGE_SECONDS.observe(transform_seconds, "transform", route.name)
+                    queue_item[4].mark("transform_end")
+
+            # Only the transform is batched. The items are built and delivered concurrently, so a
+            # backlog still goes out up to DESTINATION_CONCURRENCY at a time (destination_semaphore)
+            # instead of one POST after another.
+            results = await asyncio.gather(
+                *(deliver_item(key, item, output) for key, item, output in zip(in_flight_keys, queue_items, outputs)),
+                return_exceptions=True,
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+
     except asyncio.CancelledError:
+        # Leave in_flight_messages as is: drain_and_checkpoint snapshots it to checkpoint
+        # the delivery this worker was cancelled in the middle of.
         logger.info(
             "route_worker %s cancelled for route '%s'",
             worker_number, getattr(route, 'name', route),
@@ -948,61 +1205,91 @@ def _build_single_response(result: dict) -> dict:
     return {"message": "Successfully sent data to all destinations"}
 
 
+async def _ingest_mllp(system_id: str, endpoint_url: str, message: str) -> None:
+    """
+    A message from an MLLP listener (mllp.py), processed like an HTTP `ingest` of the same endpoint
+    up to the route queues. It returns once the message is validated and queued, so the listener
+    acknowledges it then; delivery is left to the route workers (and parking/redelivery for
+    inactive destinations), as the sender is waiting for the ACK before its next message. Raises
+    the same HTTPExceptions up to that point, which the listener turns into AR/AE.
+    """
+    if _draining:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Interface Engine is shutting down; retry shortly")
+    trace_id = uuid4().hex[:12]
+    metrics.INGEST_REQUESTS.inc("/" + endpoint_url.lstrip("/"))
+    await _process_message(endpoint_url, message, trace_id, system_id=system_id, wait_for_delivery=False)
+
+
+def _log_unawaited_delivery(trace_id: str, route_name: str, future: asyncio.Future) -> None:
+    """Done callback of a delivery nobody waits for; the route worker has logged the failure itself."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("trace=%s delivery_failed_after_ack route=%s error=%s", trace_id, route_name, future.exception())
+
+
 # Shared processing for single or batch items.
-async def _process_message(full_path: str, payload, trace_id: str, system_id: str):
+async def _process_message(full_path: str, payload, trace_id: str, system_id: str, context: tuple | None = None,
+                           wait_for_delivery: bool = True):
     # Collapse any leading slashes ("/", "//", "///") to exactly one, and add one if missing.
     normalized_path = "/" + full_path.lstrip("/")
 
-    with session_local() as db:
-        server = db.query(models.Server).filter(models.Server.system_id == system_id).first()
-        if not server:
-            logger.warning("trace=%s invalid_system_id=%s for endpoint_url=%s", trace_id, system_id, normalized_path)
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"No server registered for System-Id '{system_id}'",
-            )
-
-        endpoint = db.query(models.Endpoints).filter(models.Endpoints.url == normalized_path, models.Endpoints.server_id == server.server_id).first()
-        if not endpoint:
-            logger.warning("trace=%s invalid_endpoint_url=%s", trace_id, normalized_path)
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'The endpoint url: {normalized_path} is not valid')
-
-        endpoint_fields = db.query(models.EndpointFields).filter(models.EndpointFields.endpoint_id == endpoint.endpoint_id).all()
-        routes = (
-            db.query(models.Route)
-            .options(joinedload(models.Route.dest_server))
-            .filter(models.Route.src_endpoint_id == endpoint.endpoint_id)
-            .all()
+    # `context` is the (server, endpoint, endpoint_fields, routes) the caller already loaded.
+    if context is None:
+        context = await run_db(repositories.load_ingest_context, system_id, normalized_path)
+    server, endpoint, endpoint_fields, routes = context
+    if not server:
+        logger.warning("trace=%s invalid_system_id=%s for endpoint_url=%s", trace_id, system_id, normalized_path)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No server registered for System-Id '{system_id}'",
         )
-
-    logger.info(f"server: {server}")
+    if not endpoint:
+        logger.warning("trace=%s invalid_endpoint_url=%s", trace_id, normalized_path)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'The endpoint url: {normalized_path} is not valid')
+
+    logger.info("server: %s", server)
+    payload_budget = _payload_log_budget()
+    # A streamed Bundle (validation/fhir_stream.py) no longer has its entries; logs and the
+    # route workers get the Bundle without them.
+    src_msg = payload.summary() if isinstance(payload, fhir_stream.StreamedBundle) else payload
     
     if server.protocol == "FHIR":
-        if not isinstance(payload, dict):
+        if not isinstance(payload, (dict, fhir_stream.StreamedBundle)):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="FHIR payload must be a JSON object")
 
-        logger.info("trace=%s ingest_payload_preview=%s", trace_id, payload)
-        # FHIR syntax validation temporarily disabled for testing.
-        # is_valid, message = await asyncio.to_thread(
-        #     validate_unknown_fhir_resource,
-        #     fhir_data=payload,
-        # )
-        # if not is_valid:
-        #     logger.exception("trace=%s FHIR validation failed: %s", trace_id, message)
-        #     db_logger.error(
-        #         f"FHIR validation failed for endpoint /{full_path}",
-        #         extra={
-        #             "src_message": json.dumps(payload),
-        #             "dest_message": "FHIR validation failed, so no dest message",
-        #             "op_heading": f"Endpoint: /{full_path}",
-        #         },
-        #     )
-        #     raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(message))
+        if payload_budget:
+            logger.info("trace=%s ingest_payload_preview=%s", trace_id, LazyPayload(src_msg, payload_budget))
 
     else:
         if not isinstance(payload, str):
             payload = str(payload)
-        logger.info("trace=%s ingest_payload_preview=%s", trace_id, _payload_preview(payload))
+        if payload_budget:
+            logger.info("trace=%s ingest_payload_preview=%s", trace_id, LazyPayload(payload, payload_budget))
+    # Encoded once here: every route's delivery logs (and parked/checkpointed copies) carry this text.
+    src_message = json_codec.dumps_str(src_msg)
+
+    # ─── Validation, at the endpoint's tier (validation/structural.py) ───
+    # "structural" takes microseconds and runs inline; "full" builds the whole fhir.resources /
+    # hl7apy object tree, so it runs in a worker thread.
+    validation_tier = endpoint.validation or "none"
+    if validation_tier != "none":
+        validate_started = time.perf_counter()
+        if validation_tier == "structural":
+            errors = structural.validation_errors(validation_tier, server.protocol, payload)
+        else:
+            errors = await asyncio.to_thread(structural.validation_errors, validation_tier, server.protocol, payload)
+        metrics.INGEST_STAGE_SECONDS.observe(time.perf_counter() - validate_started, "validate", normalized_path)
+        if errors:
+            message = structural.describe(errors)
+            logger.warning("trace=%s %s validation failed: %s", trace_id, validation_tier, message)
+            db_logger.error(
+                f"{server.protocol} {validation_tier} validation failed for endpoint /{full_path}",
+                extra={
+                    "src_message": src_message if isinstance(src_msg, (dict, list)) else str(src_msg),
+                    "dest_message": f"{server.protocol} validation failed, so no dest message: {message}",
+                    "op_heading": f"Endpoint: /{full_path}",
+                },
+            )
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{server.protocol} validation failed: {message}")
 
     # ─── Targeted-delivery filter (category-scoped, protocol-agnostic) ───
     # Source of the target system_id (e.g. "Payer-1"):
@@ -1016,7 +1303,7 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
     # If the target's category exists but no system_id matches, log to db_logger and continue
     # delivering to other categories. If NOTHING remains, raise 404.
     # Missing/blank target ⇒ skip the filter (legacy fan-out-to-all behavior).
-    target_system_id = _extract_target_system_id(payload, server.protocol)
+    target_system_id = _extract_target_system_id(src_msg, server.protocol)
     if target_system_id is not None:
         target_category = target_system_id.split('-', 1)[0].lower()
 
@@ -1053,7 +1340,7 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
             db_logger.error(
                 err_msg,
                 extra={
-                    "src_message": json.dumps(payload) if isinstance(payload, (dict, list)) else str(payload),
+                    "src_message": src_message if isinstance(src_msg, (dict, list)) else str(src_msg),
                     "dest_message": f"Skipped category '{target_category}' — no destination matched '{target_system_id}'",
                     "op_heading": f"Endpoint: /{full_path}",
                 },
@@ -1080,12 +1367,20 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
         routes = filtered_routes
 
     # Extract paths based on the protocol, mirroring how add_fhir/hl7_endpoint_fields
+    extract_started = time.perf_counter()
     simple_paths = []
     paths = []
-    if server.protocol == "FHIR":
+    if isinstance(payload, fhir_stream.StreamedBundle):
+        # Extracted entry by entry while the body was read, for the endpoint's fields only.
+        simple_paths = payload.simple_paths
+        paths = list(payload.src_path_to_value)
+    elif server.protocol == "FHIR":
         resource_type = payload.get("resourceType", "Unknown")
         bundle_path_to_resource = {}
         if resource_type == "Bundle":
+            # The n-th occurrence of a path is numbered [n], as increment_segment would number
+            # it against all paths so far — without rescanning them for every path.
+            occurrences = {}
             for entry in payload.get("entry", []):
                 resource = entry.get("resource", {})
                 res_type = resource.get("resourceType", "Unknown")
@@ -1095,7 +1390,8 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
                     full_path = f"{res_type}-{p}"
                     simple_paths.append(full_path)
 
-                    full_path = await increment_segment(segment_path=full_path, list_data=paths)
+                    occurrence = occurrences[full_path] = occurrences.get(full_path, 0) + 1
+                    full_path = f"{res_type}[{occurrence}]-{p}"
                     paths.append(full_path)
                     bundle_path_to_resource[full_path] = resource
         else:
@@ -1112,19 +1408,23 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
                 p = await increment_segment(segment_path=p, list_data=paths)
                 paths.append(p)
 
-    logger.info("trace=%s extracted_paths=%s", trace_id, paths)
+    if payload_budget:
+        logger.info("trace=%s extracted_paths=%s", trace_id, LazyPayload(paths, payload_budget))
     for field in endpoint_fields:
         if await increment_segment(segment_path=field.path, list_data=[]) not in paths:
             logger.warning("trace=%s missing_path=%s", trace_id, field.path)
 
     src_path_to_value = {}
-    if server.protocol == "FHIR":
+    if isinstance(payload, fhir_stream.StreamedBundle):
+        src_path_to_value = payload.src_path_to_value
+    elif server.protocol == "FHIR":
         for path in paths:
             resource = bundle_path_to_resource.get(path, payload) if resource_type == "Bundle" else payload
             value = get_fhir_value_by_path(obj=resource, path=path)
             src_path_to_value[path] = value
     else:
         src_path_to_value = get_hl7_value_by_path(hl7_message=payload, paths=paths)
+    metrics.INGEST_STAGE_SECONDS.observe(time.perf_counter() - extract_started, "extract", normalized_path)
 
     loop = asyncio.get_running_loop()
     delivery_futures = []
@@ -1132,7 +1432,8 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
     for route in routes:
         if route.route_id in route_queue:
             future = loop.create_future()
-            await route_queue[route.route_id].put((src_path_to_value, simple_paths, future, payload))
+            span = tracing.RouteSpan(trace_id, route.name)
+            await route_queue[route.route_id].put((src_path_to_value, simple_paths, future, src_message, span))
             delivery_futures.append((route.route_id, route.name, future))
         else:
             logger.warning("trace=%s route_queue_missing route_id=%s", trace_id, route.name)
@@ -1145,6 +1446,12 @@ async def _process_message(full_path: str, payload, trace_id: str, system_id: st
             detail=f"No route workers ready for routes: {', '.join(missing_routes)}. The engine may still be starting up.",
         )
 
+    if not wait_for_delivery: # MLLP: acknowledged once queued
+        for _, route_name, future in delivery_futures:
+            future.add_done_callback(lambda future, route_name=route_name: _log_unawaited_delivery(trace_id, route_name, future))
+        logger.info("trace=%s ingest_queued routes=%s", trace_id, len(delivery_futures))
+        return {"queued_routes": [route_name for _, route_name, _ in delivery_futures]}
+
     delivered_routes = []
     parked_routes = []
     errors = []
@@ -1338,9 +1645,20 @@ async def ingest(full_path: str, req: Request):
     **Response (200 OK):**
     - JSON object: `{ "message": "Successfully sent data to all destinations" }`
 
+    **Streaming:**
+    FHIR bodies of FHIR_STREAM_MIN_BYTES or more (or without a Content-Length) are parsed as
+    they arrive, one Bundle entry at a time, keeping only the endpoint's mapped fields; logs
+    record such a Bundle without its entries.
+
+    **Validation:**
+    Each endpoint validates its messages at its own tier (`validation`: `"none"`,
+    `"structural"` or `"full"`, see `/add-endpoint`); a streamed Bundle is validated entry by
+    entry as it is read.
+
     **Error Responses:**
     - `404 Not Found`: Incoming path is not a registered endpoint.
-    - `400 Bad Request`: Validation/parsing error.
+    - `400 Bad Request`: Validation/parsing error, or the message fails the endpoint's validation tier.
+    - `413 Content Too Large`: FHIR body over FHIR_MAX_PAYLOAD_BYTES.
     - `502 Bad Gateway`: One or more downstream deliveries failed.
     """
     trace_id = req.headers.get("X-Trace-Id") or uuid4().hex[:12]
@@ -1348,38 +1666,57 @@ async def ingest(full_path: str, req: Request):
     if system_id is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing System-Id header")
     try:
-        with session_local() as db:
-            logger.info("system_id=%s", system_id)
-            server = db.query(models.Server).filter(models.Server.system_id == system_id).first()
-            if server is None:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No server found for System-Id: {system_id}")
-            endpoint = db.query(models.Endpoints).filter(models.Endpoints.url == '/' + full_path, models.Endpoints.server_id == server.server_id).first()
-            if not endpoint:
-                logger.warning("trace=%s invalid_endpoint_url=/%s", trace_id, full_path)
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'The endpoint url: /{full_path} is not valid')
-
-            server_protocol = server.protocol
+        logger.info("system_id=%s", system_id)
+        # Everything the message needs from the DB, in one executor hop; reused by _process_message.
+        context = await run_db(repositories.load_ingest_context, system_id, '/' + full_path)
+        server, endpoint, _, _ = context
+        if server is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No server found for System-Id: {system_id}")
+        if not endpoint:
+            logger.warning("trace=%s invalid_endpoint_url=/%s", trace_id, full_path)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'The endpoint url: /{full_path} is not valid')
 
+        server_protocol = server.protocol
+
+        endpoint_label = "/" + full_path.lstrip("/")
+        metrics.INGEST_REQUESTS.inc(endpoint_label)
+        parse_started = time.perf_counter()
         if server_protocol == "FHIR":
-            payload = await req.json()
-            result = await _process_message(full_path, payload, trace_id, system_id=system_id)
+            content_length = req.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > fhir_stream.MAX_PAYLOAD_BYTES:
+                raise fhir_stream.PayloadTooLarge(f"FHIR payload is larger than {fhir_stream.MAX_PAYLOAD_BYTES} bytes")
+            if fhir_stream.should_stream(content_length):
+                _, _, endpoint_fields, _ = context
+                # Full-tier entry checks build fhir.resources models: off the event loop, like
+                # the full tier of a whole message in _process_message.
+                payload = await fhir_stream.read_bundle(req.stream(), {field.path for field in endpoint_fields},
+                                                        validate_entry=structural.entry_validator(endpoint.validation),
+                                                        validate_in_thread=endpoint.validation == "full")
+            else:
+                payload = json_codec.loads(await req.body())
+            metrics.INGEST_STAGE_SECONDS.observe(time.perf_counter() - parse_started, "parse", endpoint_label)
+            result = await _process_message(full_path, payload, trace_id, system_id=system_id, context=context)
             return _build_single_response(result)
 
         # HL7: try JSON first (single string), then raw text
+        raw = await req.body()
         try:
-            payload = await req.json()
+            payload = json_codec.loads(raw)
         except Exception:
             logger.info("trace=%s ingest_hl7_json_parse_failed_falling_back_to_text", trace_id)
-            raw = await req.body()
             payload = raw.decode("utf-8", errors="replace")
 
         if not isinstance(payload, str):
             payload = str(payload)
+        metrics.INGEST_STAGE_SECONDS.observe(time.perf_counter() - parse_started, "parse", endpoint_label)
         # process a single hl7 message
-        result = await _process_message(full_path, payload, trace_id, system_id=system_id)
+        result = await _process_message(full_path, payload, trace_id, system_id=system_id, context=context)
         return _build_single_response(result)
     except HTTPException:
         raise  # re-raise HTTP exceptions as-is
+    except fhir_stream.PayloadTooLarge as exp:
+        logger.warning("trace=%s ingest_payload_too_large=%s", trace_id, str(exp))
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exp))
     except Exception as exp:
         logger.exception("trace=%s ingest_unhandled_error=%s", trace_id, str(exp))
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exp))
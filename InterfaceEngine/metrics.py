@@ -0,0 +1,145 @@
+"""
+In-process metrics for the engine, exposed in Prometheus text format on GET /metrics.
+
+Counters and histograms are plain dicts keyed by label values, updated inline on the hot path
+(one dict lookup + a few additions per observation). Gauges such as queue depth or pool usage
+are not tracked continuously; main.py reads them from the live objects when /metrics is scraped.
+"""
+import asyncio
+from bisect import bisect_left
+from collections import deque
+from threading import Lock
+import time
+
+# Seconds. Covers sub-millisecond transforms up to deliveries that hit HTTP_READ_TIMEOUT (30s).
+_DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = _DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (non-cumulative, last slot is +Inf), sum, count]
+        self._series: dict[tuple, list] = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labelvalues) -> None:
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labelvalues, list(counts), total, count)
+                        for labelvalues, (counts, total, count) in sorted(self._series.items())]
+        for labelvalues, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, labelvalues, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}")
+        return lines
+
+
+def render_gauge(name: str, documentation: str, labelnames: tuple, samples) -> list[str]:
+    """Render a gauge from `(labelvalues, value)` pairs read at scrape time."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labelvalues, value in samples:
+        lines.append(f"{name}{_labels(labelnames, labelvalues)} {value}")
+    return lines
+
+
+def render_registry() -> list[str]:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return lines
+
+
+class TimedQueue(asyncio.Queue):
+    """
+    asyncio.Queue that remembers when each item was enqueued, so /metrics can report the age
+    of the oldest waiting item without changing the queue item tuple.
+    """
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._enqueued_at = deque()
+
+    def _put(self, item):
+        super()._put(item)
+        self._enqueued_at.append(time.monotonic())
+
+    def _get(self):
+        self._enqueued_at.popleft()
+        return super()._get()
+
+    def oldest_age(self) -> float:
+        return time.monotonic() - self._enqueued_at[0] if self._enqueued_at else 0.0
+
+
+INGEST_REQUESTS = Counter(
+    "engine_ingest_requests_total",
+    "Messages accepted for ingest, per source endpoint.",
+    ("endpoint",),
+)
+INGEST_STAGE_SECONDS = Histogram(
+    "engine_ingest_stage_seconds",
+    "Per-message ingest stages (parse, validate, extract); these run once per message, before routing.",
+    ("stage", "endpoint"),
+)
+ROUTE_STAGE_SECONDS = Histogram(
+    "engine_route_stage_seconds",
+    "Per-route delivery stages (transform, build, deliver).",
+    ("stage", "route"),
+)
+DESTINATION_RESPONSES = Counter(
+    "engine_destination_responses_total",
+    "Destination responses by HTTP status code (MLLP: ACK code); 'error' when no response was received.",
+    ("destination", "code"),
+)
@@ -0,0 +1,38 @@
+"""leader lease
+
+Revision ID: a3c9e1f7b2d4
+Revises: 1fe3e6379489
+Create Date: 2026-10-19 09:00:00.000000
+
+What this migration does (DATA-PRESERVING — no existing table is touched):
+- Creates the `leader_lease` table used by `leader_election.DBLease`. One row per singleton
+  background loop (`server_health`, `connected_systems`) records which engine process holds
+  the lease and when it expires.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e1f7b2d4'
+down_revision: Union[str, Sequence[str], None] = '1fe3e6379489'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('leader_lease',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('leader_lease')
@@ -0,0 +1,45 @@
+"""delivery checkpoint
+
+Revision ID: b8d2f4a6c1e3
+Revises: a3c9e1f7b2d4
+Create Date: 2026-10-19 10:00:00.000000
+
+What this migration does (DATA-PRESERVING — no existing table is touched):
+- Creates the `delivery_checkpoint` table. On shutdown the engine writes every message it could
+  not deliver before the drain deadline (still queued, cancelled mid-delivery, or parked for an
+  inactive destination) here; `route_manager` replays and deletes them on the next start.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d2f4a6c1e3'
+down_revision: Union[str, Sequence[str], None] = 'a3c9e1f7b2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('delivery_checkpoint',
+    sa.Column('checkpoint_id', sa.Integer(), nullable=False),
+    sa.Column('route_id', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(length=20), nullable=False),
+    sa.Column('src_path_to_value', sa.JSON(), nullable=False),
+    sa.Column('simple_paths', sa.JSON(), nullable=False),
+    sa.Column('src_msg', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('checkpoint_id')
+    )
+    op.create_index(op.f('ix_delivery_checkpoint_checkpoint_id'), 'delivery_checkpoint', ['checkpoint_id'], unique=False)
+    op.create_index(op.f('ix_delivery_checkpoint_route_id'), 'delivery_checkpoint', ['route_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_delivery_checkpoint_route_id'), table_name='delivery_checkpoint')
+    op.drop_index(op.f('ix_delivery_checkpoint_checkpoint_id'), table_name='delivery_checkpoint')
+    op.drop_table('delivery_checkpoint')
@@ -0,0 +1,39 @@
+"""logs query indexes
+
+Revision ID: c5f1a7e3d9b2
+Revises: b8d2f4a6c1e3
+Create Date: 2026-10-19 12:00:00.000000
+
+What this migration does (DATA-PRESERVING — only adds indexes):
+- Adds composite indexes on `logs` for the keyset-paginated /logs/query API: (datetime, log_id)
+  for unfiltered pages, plus (<filter column>, datetime, log_id) for the src_systemid,
+  dest_system_name, status and operation_heading (channel) filters.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5f1a7e3d9b2'
+down_revision: Union[str, Sequence[str], None] = 'b8d2f4a6c1e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_logs_datetime_log_id', 'logs', ['datetime', 'log_id'], unique=False)
+    op.create_index('ix_logs_src_systemid_datetime', 'logs', ['src_systemid', 'datetime', 'log_id'], unique=False)
+    op.create_index('ix_logs_dest_system_name_datetime', 'logs', ['dest_system_name', 'datetime', 'log_id'], unique=False)
+    op.create_index('ix_logs_status_datetime', 'logs', ['status', 'datetime', 'log_id'], unique=False)
+    op.create_index('ix_logs_operation_heading_datetime', 'logs', ['operation_heading', 'datetime', 'log_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_logs_operation_heading_datetime', table_name='logs')
+    op.drop_index('ix_logs_status_datetime', table_name='logs')
+    op.drop_index('ix_logs_dest_system_name_datetime', table_name='logs')
+    op.drop_index('ix_logs_src_systemid_datetime', table_name='logs')
+    op.drop_index('ix_logs_datetime_log_id', table_name='logs')
@@ -0,0 +1,52 @@
+"""log payload store
+
+Revision ID: d9a4c2e8f1b7
+Revises: c5f1a7e3d9b2
+Create Date: 2026-10-19 14:00:00.000000
+
+What this migration does (DATA-PRESERVING — existing rows keep their inline bodies):
+- Creates `log_payload`: zlib-compressed src/dest message bodies keyed by sha256, shared by
+  every `logs` row that carries the same text.
+- Adds `logs.src_payload_hash`, `logs.dest_payload_hash` and `logs.log_day`, and backfills
+  `log_day` from `datetime` so retention can archive existing rows by day.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a4c2e8f1b7'
+down_revision: Union[str, Sequence[str], None] = 'c5f1a7e3d9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('log_payload',
+    sa.Column('payload_hash', sa.String(length=64), nullable=False),
+    sa.Column('body', sa.LargeBinary(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('last_seen_day', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('payload_hash')
+    )
+    op.create_index(op.f('ix_log_payload_last_seen_day'), 'log_payload', ['last_seen_day'], unique=False)
+
+    op.add_column('logs', sa.Column('src_payload_hash', sa.String(length=64), nullable=True))
+    op.add_column('logs', sa.Column('dest_payload_hash', sa.String(length=64), nullable=True))
+    op.add_column('logs', sa.Column('log_day', sa.Date(), nullable=True))
+    logs = sa.table('logs', sa.column('datetime', sa.DateTime()), sa.column('log_day', sa.Date()))
+    op.execute(logs.update().values(log_day=sa.cast(logs.c.datetime, sa.Date())))
+    op.create_index(op.f('ix_logs_log_day'), 'logs', ['log_day'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_logs_log_day'), table_name='logs')
+    op.drop_column('logs', 'log_day')
+    op.drop_column('logs', 'dest_payload_hash')
+    op.drop_column('logs', 'src_payload_hash')
+    op.drop_index(op.f('ix_log_payload_last_seen_day'), table_name='log_payload')
+    op.drop_table('log_payload')
@@ -0,0 +1,31 @@
+"""endpoint validation tier
+
+Revision ID: e2b7c4f9a1d6
+Revises: d9a4c2e8f1b7
+Create Date: 2026-10-19 16:00:00.000000
+
+What this migration does (DATA-PRESERVING):
+- Adds `endpoints.validation`, the validation tier of the messages received on the endpoint
+  ("none", "structural" or "full"). Existing endpoints get "none", what they had so far.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7c4f9a1d6'
+down_revision: Union[str, Sequence[str], None] = 'd9a4c2e8f1b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('endpoints', sa.Column('validation', sa.String(length=20), nullable=False, server_default='none'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('endpoints', 'validation')
@@ -0,0 +1,242 @@
+"""
+HL7 over MLLP (Minimal Lower Layer Protocol): a listener for instruments and LIS systems that
+send HL7 over persistent TCP, and a pooled client for destinations that receive it that way.
+
+A message on the wire is framed as <VT> message <FS><CR> (0x0B ... 0x1C 0x0D), segments
+separated by <CR>. Every message is answered with an HL7 ACK on the same connection, before the
+sender sends the next one.
+
+Listener — MLLP_LISTENERS maps a port to the source endpoint its messages arrive on, the same
+System-Id and endpoint url an HTTP sender would use:
+
+    MLLP_LISTENERS='{"2575": {"system_id": "LIS-1", "endpoint": "/lis/results"}}'
+
+Each message goes through the same processing as `POST /<endpoint>`, with its segments
+separated by newlines as HTTP senders send them, up to the route queues. It is answered with
+MSA-1 `AA` as soon as it is validated and queued, `AR` when it is rejected (unknown system or
+endpoint, invalid message — the HTTP 4xx cases) and `AE` when it cannot be queued (5xx, e.g.
+shutting down; the sender may resend). Delivery is left to the route workers: waiting for it
+would hold up every later message on the connection and outlast the sender's ACK timeout.
+
+Client — an HL7 destination server whose profile has `"transport": "mllp"` gets its messages
+over MLLP at its ip:port instead of an HTTP POST. Connections are kept open and reused
+(MLLP_POOL_SIZE idle per destination); a reused connection the peer has closed meanwhile is
+replaced once, transparently.
+"""
+import asyncio
+from datetime import datetime
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+from typing import Awaitable, Callable, NamedTuple
+from uuid import uuid4
+
+MLLP_HOST = os.getenv("MLLP_HOST", "0.0.0.0")
+_ACK_TIMEOUT_SECS = float(os.getenv("MLLP_ACK_TIMEOUT_SECS", "30"))
+_POOL_SIZE = int(os.getenv("MLLP_POOL_SIZE", "3"))
+_MAX_MESSAGE_BYTES = int(os.getenv("MLLP_MAX_MESSAGE_BYTES", str(16 * 1024 * 1024)))
+
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\x0d"
+
+logger = logging.getLogger("mllp")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+if not logger.handlers:
+    os.makedirs("logs", exist_ok=True)
+    handler = RotatingFileHandler("logs/mllp.log", maxBytes=20000, backupCount=1)
+    handler.setFormatter(logging.Formatter("%(asctime)s- %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"))
+    logger.addHandler(handler)
+
+
+# ─── Framing ───
+
+def frame(message: str) -> bytes:
+    """`message` (segments separated by CR, LF or CRLF) as one MLLP block."""
+    segments = message.replace("\r\n", "\r").replace("\n", "\r")
+    return START_BLOCK + segments.encode("utf-8") + END_BLOCK
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    """The next block's content, or None when the peer closed the connection between blocks."""
+    try:
+        block = await reader.readuntil(END_BLOCK)
+    except asyncio.IncompleteReadError as exp:
+        if not exp.partial.strip():
+            return None
+        raise
+    start = block.find(START_BLOCK) # anything before <VT> is line noise
+    return block[start + 1 if start >= 0 else 0:-len(END_BLOCK)]
+
+
+# ─── Acknowledgements ───
+
+def _escape(text: str) -> str:
+    """HL7 escape sequences for the delimiters, so free text fits in one field."""
+    return (text.replace("\\", "\\E\\").replace("|", "\\F\\").replace("^", "\\S\\")
+            .replace("&", "\\T\\").replace("~", "\\R\\").replace("\r", " ").replace("\n", " "))
+
+
+def build_ack(message: str, code: str, text: str = "") -> str:
+    """
+    The ACK for `message`: MSH with sender and receiver swapped, MSA-1 `code` (AA, AE or AR),
+    MSA-2 the message's control id (MSH-10) and MSA-3 `text`.
+    """
+    msh = next((line for line in message.replace("\r", "\n").split("\n") if line.startswith("MSH")), "")
+    fields = msh.split("|")
+    field = lambda n: fields[n] if len(fields) > n else ""
+    trigger = field(8).split("^")[1] if "^" in field(8) else ""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return (
+        f"MSH|^~\\&|{field(4)}|{field(5)}|{field(2)}|{field(3)}|{timestamp}||ACK^{trigger}^ACK"
+        f"|ACK{uuid4().hex[:16]}|P|{field(11) or '2.5'}\r"
+        f"MSA|{code}|{field(9)}|{_escape(text)[:200]}"
+    )
+
+
+class Ack(NamedTuple):
+    code: str # MSA-1; "" when the reply has no MSA segment
+    control_id: str # MSA-2
+    text: str # MSA-3, or the whole reply when it is not an ACK
+
+    @property
+    def accepted(self) -> bool:
+        return self.code in ("AA", "CA")
+
+
+def parse_ack(reply: str) -> Ack:
+    for segment in reply.replace("\r", "\n").split("\n"):
+        if segment.startswith("MSA"):
+            fields = segment.split("|") + ["", "", ""]
+            return Ack(fields[1], fields[2], fields[3])
+    return Ack("", "", reply)
+
+
+# ─── Listener ───
+
+# (system_id, endpoint url, message with newline-separated segments) -> None, or raises an
+# exception carrying the HTTP status_code/detail `ingest` would have answered with.
+IngestHandler = Callable[[str, str, str], Awaitable[None]]
+
+
+async def _serve_connection(reader, writer, system_id: str, endpoint: str, handle: IngestHandler):
+    peer = writer.get_extra_info("peername")
+    logger.info("connection from %s for %s %s", peer, system_id, endpoint)
+    try:
+        while True:
+            block = await read_frame(reader)
+            if block is None:
+                break
+            message = block.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+            try:
+                await handle(system_id, endpoint, message)
+                ack = build_ack(message, "AA")
+            except Exception as exp:
+                status_code = getattr(exp, "status_code", 500)
+                detail = str(getattr(exp, "detail", exp))
+                logger.warning("message from %s not accepted (%s): %s", peer, status_code, detail)
+                ack = build_ack(message, "AR" if 400 <= status_code < 500 else "AE", detail)
+            writer.write(frame(ack))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as exp:
+        logger.warning("connection from %s dropped: %r", peer, exp)
+    except asyncio.CancelledError: # shutdown; nothing waits on this task
+        pass
+    finally:
+        writer.close()
+
+
+async def start_listeners(listeners: dict, handle: IngestHandler) -> list[asyncio.Server]:
+    """
+    Start one server per port of `listeners` ({port: {"system_id", "endpoint"}}). Connections
+    are served concurrently; messages on one connection in order.
+    """
+    servers = []
+    for port, config in listeners.items():
+        system_id, endpoint = config["system_id"], config["endpoint"]
+        server = await asyncio.start_server(
+            lambda r, w, s=system_id, e=endpoint: _serve_connection(r, w, s, e, handle),
+            MLLP_HOST, int(port), limit=_MAX_MESSAGE_BYTES,
+        )
+        logger.info("MLLP listener on %s:%s for %s %s", MLLP_HOST, port, system_id, endpoint)
+        servers.append(server)
+    return servers
+
+
+# ─── Client ───
+
+class MLLPClient:
+    """Persistent connections to one MLLP destination; `send` waits for the ACK."""
+
+    def __init__(self, host: str, port: int, pool_size: int = _POOL_SIZE, timeout: float = _ACK_TIMEOUT_SECS):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def _connect(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=_MAX_MESSAGE_BYTES), self.timeout)
+
+    async def send(self, message: str) -> Ack:
+        """
+        Deliver `message` and return its ACK. Raises OSError / asyncio.TimeoutError when the
+        destination cannot be reached or does not answer within MLLP_ACK_TIMEOUT_SECS.
+        """
+        data = frame(message)
+        while True:
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await self._connect()
+            try:
+                writer.write(data)
+                await writer.drain()
+                reply = await asyncio.wait_for(read_frame(reader), self.timeout)
+                if reply is None:
+                    raise ConnectionResetError("connection closed before the ACK")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused: # the peer closed it while idle; try a fresh one
+                    continue
+                raise
+            except BaseException: # timeout or cancellation: the connection's state is unknown
+                writer.close()
+                raise
+            if len(self._idle) < self.pool_size:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return parse_ack(reply.decode("utf-8", errors="replace"))
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+_clients: dict[tuple[str, int], MLLPClient] = {}
+
+
+def get_client(host: str, port: int) -> MLLPClient:
+    client = _clients.get((host, port))
+    if client is None:
+        client = _clients[(host, port)] = MLLPClient(host, port)
+    return client
+
+
+def close_clients() -> None:
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
+
+
+async def is_reachable(host: str, port: int, timeout: float = 10) -> tuple[bool, str]:
+    """Whether a TCP connection to host:port opens (MLLP has no health request), and why not."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except asyncio.TimeoutError:
+        return False, "connection timed out"
+    except OSError as exp:
+        return False, f"connection refused or host unreachable: {exp}"
+    writer.close()
+    return True, "ok"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, JSON, UniqueConstraint, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, JSON, UniqueConstraint, DateTime, Date, Text, Boolean, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base # Ensure your engine uses a shared or local Base
 from datetime import datetime
@@ -30,12 +30,17 @@ class Server(Base):
     src_route = relationship("Route", back_populates="src_server", foreign_keys="[Route.src_server_id]")
     dest_route = relationship("Route", back_populates="dest_server", foreign_keys="[Route.dest_server_id]")
 
+    @property
+    def transport(self) -> str:
+        return (self.profile or {}).get("transport", "http") # http or mllp, kept in the profile
+
 class Endpoints(Base):
     __tablename__ = "endpoints"
 
     endpoint_id = Column(Integer, primary_key=True, index=True)
     server_id = Column(Integer, ForeignKey("server.server_id"), nullable=False) # source(fk of server)
     url = Column(String(255), nullable=False) # endpoint url
+    validation = Column(String(20), nullable=False, default="none", server_default="none") # none, structural or full
 
     __table_args__ = (
         UniqueConstraint("server_id", "url", name="unique_server_endpoint"),
@@ -110,6 +115,29 @@ class Logs(Base):
     dest_message = Column(Text, nullable=True)
     dest_system_name = Column(String(50), nullable=True)  # e.g., IDC,IMR 
     src_systemid = Column(String(50), nullable=True)  # e.g., EHR-1, LIS-1, PHR-1, Payer-1
+    # Message bodies live in log_payload (compressed, deduplicated); src/dest_message stay for rows
+    # written before that, or when LOG_PAYLOAD_STORE=false.
+    src_payload_hash = Column(String(64), nullable=True)
+    dest_payload_hash = Column(String(64), nullable=True)
+    log_day = Column(Date, nullable=True, index=True) # retention moves whole days to logs_archive_<yyyymmdd>
+
+    # Keyset pagination in /logs/query walks (datetime, log_id) newest first, optionally
+    # narrowed by one equality filter; each index serves one of those filters.
+    __table_args__ = (
+        Index("ix_logs_datetime_log_id", "datetime", "log_id"),
+        Index("ix_logs_src_systemid_datetime", "src_systemid", "datetime", "log_id"),
+        Index("ix_logs_dest_system_name_datetime", "dest_system_name", "datetime", "log_id"),
+        Index("ix_logs_status_datetime", "status", "datetime", "log_id"),
+        Index("ix_logs_operation_heading_datetime", "operation_heading", "datetime", "log_id"),
+    )
+
+class LogPayload(Base):
+    __tablename__ = "log_payload"
+
+    payload_hash = Column(String(64), primary_key=True) # sha256 of the uncompressed text
+    body = Column(LargeBinary, nullable=False) # zlib-compressed UTF-8
+    size = Column(Integer, nullable=False) # uncompressed length
+    last_seen_day = Column(Date, nullable=False, index=True) # newest log_day referencing it
 
 class Config(Base):          # we can extract the operation heading, url, hospital name via endpooint, where we can define that which hospital belong to which endpoint. 
     __tablename__ = "config"
@@ -122,4 +150,23 @@ class Config(Base):          # we can extract the operation heading, url, hospit
     hold_type = Column(String(50), default=False)
     hold_flag = Column(Integer, default=False) # this is for the engine to know that this config is already sent to engine or not. if sent then it will not send again to engine.
 
-    # channel = relationship("Route", back_populates="config", foreign_keys=[route_id])
\ No newline at end of file
+    # channel = relationship("Route", back_populates="config", foreign_keys=[route_id])
+
+class LeaderLease(Base):
+    __tablename__ = "leader_lease"
+
+    name = Column(String(50), primary_key=True) # e.g. server_health, connected_systems -> one row per singleton loop
+    holder = Column(String(100), nullable=False) # instance id of the engine process that owns the lease (host-pid-random)
+    expires_at = Column(DateTime, nullable=False) # lease is free for takeover once this passes without a heartbeat
+    heartbeat_at = Column(DateTime, nullable=False)
+
+class DeliveryCheckpoint(Base):
+    __tablename__ = "delivery_checkpoint"
+
+    checkpoint_id = Column(Integer, primary_key=True, index=True)
+    route_id = Column(Integer, nullable=False, index=True) # no FK: a route deleted while engine was down just leaves its rows unreplayed
+    reason = Column(String(20), nullable=False) # queued | in_flight | parked -> where the message was when the engine shut down
+    src_path_to_value = Column(JSON, nullable=False) # same shape as the route_queue item, so replay is a plain put()
+    simple_paths = Column(JSON, nullable=False)
+    src_msg = Column(JSON, nullable=True) # the source message's text, as its delivery logs record it
+    created_at = Column(DateTime, default=lambda: datetime.now(), nullable=False)
@@ -0,0 +1,195 @@
+"""
+Runtime diagnostics for the engine process: event-loop lag, slow loop steps and an on-demand
+sampling profiler. Served (admin-only) by api/debug.py; lag is also exported on /metrics.
+
+Event-loop lag
+    `lag_sampler()` sleeps LOOP_LAG_INTERVAL_SECS at a time and records how late it wakes up.
+    Anything that holds the loop (sync SQLAlchemy in an async handler, file logging, a heavy
+    transform) shows up as lag. Max and p99 are reported over the last LOOP_LAG_WINDOW_SECS.
+
+Slow steps
+    `install_slow_step_monitor()` times every callback the loop runs (one task step each).
+    A watchdog thread grabs the loop thread's stack while a step is still running past
+    SLOW_STEP_THRESHOLD_MS, so the recorded stack shows what is blocking, not where it ended.
+    Works with the default asyncio loop; uvloop handles are not instrumented.
+
+Profiler
+    `sample_profile(seconds)` samples every thread's stack every PROFILE_INTERVAL_MS and returns
+    collapsed stacks (flamegraph.pl / speedscope input) or a pstats-style top-functions table.
+"""
+import asyncio
+from collections import Counter, deque
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import sys
+import threading
+import time
+import traceback
+
+_LAG_INTERVAL_SECS = float(os.getenv("LOOP_LAG_INTERVAL_SECS", "0.1"))
+_LAG_WINDOW_SECS = float(os.getenv("LOOP_LAG_WINDOW_SECS", "60"))
+_SLOW_STEP_THRESHOLD_MS = float(os.getenv("SLOW_STEP_THRESHOLD_MS", "100")) # 0 disables the monitor
+_SLOW_STEP_BUFFER_SIZE = int(os.getenv("SLOW_STEP_BUFFER_SIZE", "200"))
+_PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = 60
+
+logger = logging.getLogger("profiling")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+if not logger.handlers:
+    handler = RotatingFileHandler("logs/profiling.log", maxBytes=20000, backupCount=1)
+    handler.setFormatter(logging.Formatter("%(asctime)s- %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"))
+    logger.addHandler(handler)
+
+# ─── Event-loop lag ───
+_lag_samples: deque = deque(maxlen=max(1, int(_LAG_WINDOW_SECS / _LAG_INTERVAL_SECS)))
+
+
+async def lag_sampler():
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + _LAG_INTERVAL_SECS
+        await asyncio.sleep(_LAG_INTERVAL_SECS)
+        _lag_samples.append(max(0.0, loop.time() - expected))
+
+
+def lag_stats() -> dict:
+    """Max and p99 loop lag (seconds) over the sampling window."""
+    samples = sorted(_lag_samples)
+    if not samples:
+        return {"max": 0.0, "p99": 0.0, "samples": 0}
+    return {
+        "max": samples[-1],
+        "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "samples": len(samples),
+    }
+
+
+# ─── Slow loop steps ───
+_slow_steps: deque = deque(maxlen=_SLOW_STEP_BUFFER_SIZE)
+slow_step_count = 0
+# thread id -> [step number, start (perf_counter), captured stack or None] of the running step
+_running_steps: dict[int, list] = {}
+_step_seq = 0
+_installed = False
+
+
+def _format_handle(handle) -> str:
+    callback = getattr(handle, "_callback", None)
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        return f"{task.get_name()}: {task.get_coro()!r}"
+    return repr(callback)
+
+
+def _watchdog():
+    threshold = _SLOW_STEP_THRESHOLD_MS / 1000
+    while True:
+        time.sleep(threshold / 2)
+        now = time.perf_counter()
+        frames = None
+        for thread_id, step in list(_running_steps.items()):
+            if step[2] is None and now - step[1] > threshold:
+                frames = frames or sys._current_frames()
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    step[2] = "".join(traceback.format_stack(frame))
+
+
+def install_slow_step_monitor() -> None:
+    """Wrap asyncio.Handle._run to time each loop step. Idempotent; no-op when the threshold is 0."""
+    global _installed
+    if _installed or _SLOW_STEP_THRESHOLD_MS <= 0:
+        return
+    _installed = True
+    threshold = _SLOW_STEP_THRESHOLD_MS / 1000
+    original_run = asyncio.events.Handle._run
+
+    def _timed_run(handle):
+        global _step_seq, slow_step_count
+        _step_seq += 1
+        step = [_step_seq, time.perf_counter(), None]
+        thread_id = threading.get_ident()
+        _running_steps[thread_id] = step
+        try:
+            return original_run(handle)
+        finally:
+            _running_steps.pop(thread_id, None)
+            duration = time.perf_counter() - step[1]
+            if duration > threshold:
+                slow_step_count += 1
+                _slow_steps.append({
+                    "at": time.time(),
+                    "duration_ms": round(duration * 1000, 3),
+                    "step": _format_handle(handle),
+                    # Stack while the step was still running, when the watchdog caught it in time.
+                    "stack": step[2],
+                })
+                logger.warning("slow loop step %.1fms: %s", duration * 1000, _format_handle(handle))
+
+    asyncio.events.Handle._run = _timed_run
+    threading.Thread(target=_watchdog, name="slow-step-watchdog", daemon=True).start()
+
+
+def slow_steps(limit: int = 50) -> list[dict]:
+    """Most recent slow steps, newest first."""
+    return list(_slow_steps)[-limit:][::-1]
+
+
+# ─── Sampling profiler ───
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_profile(seconds: float, output: str = "collapsed") -> str:
+    """
+    Sample all threads for `seconds` and return collapsed stacks or a top-functions summary.
+    Raises RuntimeError when a profile is already running. Blocking; run it in a thread.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks: Counter = Counter()
+        interval = _PROFILE_INTERVAL_MS / 1000
+        deadline = time.perf_counter() + seconds
+        samples = 0
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+    if output == "collapsed":
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()) + "\n"
+
+    own: Counter = Counter()
+    cumulative: Counter = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for label in set(stack[1:]):
+            cumulative[label] += count
+    lines = [
+        f"{samples} samples over {seconds}s, every {_PROFILE_INTERVAL_MS}ms, all threads",
+        "",
+        f"{'own':>8} {'cumulative':>11}  function",
+    ]
+    for label, count in cumulative.most_common(50):
+        lines.append(f"{own[label]:>8} {count:>11}  {label}")
+    return "\n".join(lines) + "\n"
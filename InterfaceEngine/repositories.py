@@ -0,0 +1,127 @@
+"""
+Data access for the message path (ingest, route workers, redelivery).
+
+Every function takes an open session as its first argument and does all the queries one caller
+needs, so async code runs it in a single `database.run_db(...)` hop instead of touching the
+session on the event loop. Returned ORM objects are detached; relationships the callers read
+(Route.dest_server) are eager-loaded here.
+"""
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import flag_modified
+
+import models
+
+# (src category, dest category) -> Config.hold_flag used by POST /send-to-server/{flag}.
+_HOLD_FLAGS = {
+    ("EHR", "LIS"): 2,
+    ("LIS", "EHR"): 3,
+    ("EHR", "PHR"): 4,
+    ("EHR", "Payer"): 5,
+    ("Payer", "EHR"): 6,
+}
+
+
+def load_ingest_context(db, system_id: str, endpoint_url: str):
+    """
+    (server, endpoint, endpoint_fields, routes) for a message arriving from `system_id` on
+    `endpoint_url`. `endpoint` is None when the server is unknown; the lists are empty when
+    the endpoint is.
+    """
+    server = db.query(models.Server).filter(models.Server.system_id == system_id).first()
+    if server is None:
+        return None, None, [], []
+    endpoint = db.query(models.Endpoints) \
+        .filter(models.Endpoints.url == endpoint_url, models.Endpoints.server_id == server.server_id).first()
+    if endpoint is None:
+        return server, None, [], []
+    endpoint_fields = db.query(models.EndpointFields) \
+        .filter(models.EndpointFields.endpoint_id == endpoint.endpoint_id).all()
+    routes = (
+        db.query(models.Route)
+        .options(joinedload(models.Route.dest_server))
+        .filter(models.Route.src_endpoint_id == endpoint.endpoint_id)
+        .all()
+    )
+    return server, endpoint, endpoint_fields, routes
+
+
+def load_route_context(db, route):
+    """(dest_endpoint, dest_server, src_server, src_fields, dest_fields, mapping_rules) of a route."""
+    return (
+        db.get(models.Endpoints, route.dest_endpoint_id),
+        db.get(models.Server, route.dest_server_id),
+        db.get(models.Server, route.src_server_id),
+        db.query(models.EndpointFields).filter(models.EndpointFields.endpoint_id == route.src_endpoint_id).all(),
+        db.query(models.EndpointFields).filter(models.EndpointFields.endpoint_id == route.dest_endpoint_id).all(),
+        db.query(models.MappingRule).filter(models.MappingRule.route_id == route.route_id).all(),
+    )
+
+
+def get_server(db, server_id: int):
+    return db.get(models.Server, server_id)
+
+
+def get_servers(db, server_ids) -> dict:
+    """server_id -> Server for the ids that still exist, in one query."""
+    ids = list(server_ids)
+    if not ids:
+        return {}
+    return {s.server_id: s for s in db.query(models.Server).filter(models.Server.server_id.in_(ids))}
+
+
+def list_routes(db) -> list:
+    return db.query(models.Route).all()
+
+
+def hold_message(db, route, src_server, dest_server, dest_endpoint_url: str, src_message: str, msg) -> str:
+    """
+    Append a built message and its source message's text to the hold Config of its src/dest
+    category pair (created on first use) instead of delivering it; POST /send-to-server/{flag}
+    releases it later. Returns the hold type.
+    """
+    hold_type = src_server.category + " - " + dest_server.category
+    hold_flag = _HOLD_FLAGS.get((src_server.category, dest_server.category), 1)
+
+    is_config = db.query(models.Config).filter(models.Config.hold_type == hold_type).first()
+    if not is_config:
+        config = models.Config(
+            data = [
+                {
+                    "route_id": route.route_id,
+                    "endpoint_destination": dest_endpoint_url,
+                    "src_server_id": src_server.server_id,
+                    "dest_server_id": dest_server.server_id,
+                    "src_msg": [src_message],
+                    "data": [msg]
+                }
+            ],
+            count=1,
+            hold_type=hold_type,
+            hold_flag=hold_flag
+        )
+        db.add(config)
+    else:
+
+        is_config.count +=1
+        is_config.hold_flag=hold_flag
+
+        for config_list in is_config.data:
+
+            if config_list.get("route_id", "") == route.route_id:
+                config_list["data"].append(msg)
+                config_list["src_msg"].append(src_message)
+
+            else:
+                is_config.data.append({
+                    "route_id": route.route_id,
+                    "endpoint_destination": dest_endpoint_url,
+                    "src_server_id": src_server.server_id,
+                    "dest_server_id": dest_server.server_id,
+                    "src_msg": [src_message],
+                    "data": [msg]
+                })
+            flag_modified(is_config, "data")
+
+        db.add(is_config)
+    db.commit()
+    return hold_type
@@ -0,0 +1,87 @@
+"""
+Cached JSON responses with strong ETags for the read endpoints the management UI polls
+(/server/all-servers, /route/all-routes, /route/mapping_rules/{id},
+/endpoint/server-endpoint/{id}, /logs/show-logs).
+
+Each response is built once and kept with the version of the data it was built from:
+CONFIG for servers, endpoints and routes, bumped by every change to them (the CRUD endpoints
+and the health checker's status updates), and LOGS for the log table, bumped when the log
+writer stores a batch or retention archives a day. While that version is unchanged, the kept
+body is sent as it is, and a request whose If-None-Match carries its ETag gets 304 — neither
+touches the database or serializes anything.
+
+The versions are counted in this process, so changes made by another engine process (see
+leader_election.py) are not seen here. An entry is therefore also rebuilt once it is
+RESPONSE_CACHE_TTL_SECS old (0 = rely on the versions alone, for a single process). The ETag
+is a hash of the body, so a rebuilt response that did not change keeps its ETag and still
+answers 304.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, NamedTuple
+
+from fastapi import Request, Response
+
+_TTL_SECS = float(os.getenv("RESPONSE_CACHE_TTL_SECS", "5"))
+_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+CONFIG = "config"
+LOGS = "logs"
+
+_lock = threading.Lock() # sync endpoints run in the threadpool
+_versions = {CONFIG: 0, LOGS: 0}
+_entries: OrderedDict = OrderedDict() # key -> _Entry, least recently used first
+
+
+class _Entry(NamedTuple):
+    version: int
+    built_at: float # time.monotonic()
+    body: bytes
+    etag: str
+
+
+def bump(kind: str) -> None:
+    """The data behind `kind` (CONFIG or LOGS) changed: its cached responses are rebuilt on next use."""
+    with _lock:
+        _versions[kind] += 1
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/"x" matches "x"."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def respond(request: Request, kind: str, key: str, build: Callable[[], bytes]) -> Response:
+    """
+    The JSON response cached under `key`, rebuilt with `build()` (the body) when `kind`'s
+    version moved on or the entry is over RESPONSE_CACHE_TTL_SECS old. 304 without a body when
+    the request's If-None-Match has its ETag. Exceptions from `build` (e.g. HTTPException 404)
+    propagate and nothing is cached.
+    """
+    version = _versions[kind] # read before building: a change made meanwhile leaves the entry stale
+    now = time.monotonic()
+    entry = _entries.get(key)
+    if entry is None or entry.version != version or (_TTL_SECS > 0 and now - entry.built_at > _TTL_SECS):
+        body = build()
+        entry = _Entry(version, now, body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        with _lock:
+            _entries[key] = entry
+            _entries.move_to_end(key)
+            while len(_entries) > _MAX_ENTRIES:
+                _entries.popitem(last=False)
+    else:
+        with _lock:
+            if key in _entries:
+                _entries.move_to_end(key)
+
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"} # clients revalidate on every poll
+    if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
@@ -6,4 +6,9 @@ class AddEndpoint(BaseModel):
     server_id: int
     server_protocol: Literal["FHIR", "HL7"]
     url: str
-    sample_msg: Dict[str, Any] | str # Changed from Json to Dict for easier handling
\ No newline at end of file
+    sample_msg: Dict[str, Any] | str # Changed from Json to Dict for easier handling
+    validation: Literal["none", "structural", "full"] = "none" # how messages received on it are validated
+
+class UpdateEndpointValidation(BaseModel):
+
+    validation: Literal["none", "structural", "full"]
@@ -21,6 +21,15 @@ class LogMsg(BaseModel):
 
     model_config = {"from_attributes": True}
 
+class TraceEntry(BaseModel):
+    trace_id: str
+    route: str
+    worker: Optional[int] = None
+    started_at: datetime
+    outcome: Optional[str] = None
+    total_ms: float
+    stages_ms: dict[str, float]
+
 class LogResponse(BaseModel):
     log_id: int
     datetime: datetime
@@ -34,3 +43,7 @@ class LogResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class LogPage(BaseModel):
+    items: list[LogResponse]
+    next_cursor: Optional[str] = None
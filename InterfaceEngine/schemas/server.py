@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, model_validator
 from typing import Literal
 
 class AddUpdateServer(BaseModel):
@@ -9,6 +9,7 @@ class AddUpdateServer(BaseModel):
     port: int
     protocol: Literal["FHIR", "HL7"]
     category: Literal["EHR", "PHR", "LIS", "Payer"]
+    transport: Literal["http", "mllp"] | None = None # how messages are delivered to the server; mllp is HL7 only. None: http on add, unchanged on update
 
     @field_validator("name", "ip", mode="before")
     @classmethod
@@ -27,6 +28,12 @@ class AddUpdateServer(BaseModel):
             raise ValueError("port must be between 1 and 65535")
         return value
 
+    @model_validator(mode="after")
+    def validate_transport(self):
+        if self.transport == "mllp" and self.protocol != "HL7":
+            raise ValueError("mllp transport is only available for HL7 servers")
+        return self
+
 class GetServer(BaseModel):
     
     server_id: int
@@ -37,5 +44,6 @@ class GetServer(BaseModel):
     protocol: str
     category: str | None
     status: str
+    transport: str
 
     model_config = {"from_attributes": True}
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Per-message stage timings for route deliveries, keyed by the ingest trace id.
+
+`_process_message` opens one RouteSpan per route it enqueues to and puts it in the queue tuple;
+`route_worker` marks the stages as it goes and records the span when it moves on to the next
+message. Recorded spans live in a bounded ring buffer (TRACE_BUFFER_SIZE), served by
+GET /logs/traces. Everything runs on the event loop thread, so no locking is needed.
+"""
+from collections import deque
+from datetime import datetime
+import heapq
+import os
+import time
+
+_TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
+
+# (stage, start mark, end mark) — reported in this order.
+_STAGES = (
+    ("queue_wait", "enqueue", "dequeue"),
+    ("transform", "transform_start", "transform_end"),
+    ("build", "build_start", "build_end"),
+    ("deliver", "deliver_start", "deliver_end"),
+)
+
+_recent: deque = deque(maxlen=_TRACE_BUFFER_SIZE)
+
+
+class RouteSpan:
+    """Timestamps (time.perf_counter) of one message's trip through one route."""
+    __slots__ = ("trace_id", "route", "worker", "started_at", "marks", "outcome")
+
+    def __init__(self, trace_id: str, route: str):
+        self.trace_id = trace_id
+        self.route = route
+        self.worker = None
+        self.started_at = datetime.now()
+        self.marks = {"enqueue": time.perf_counter()}
+        self.outcome = None
+
+    def mark(self, name: str) -> None:
+        self.marks[name] = time.perf_counter()
+
+    def total_secs(self) -> float:
+        return self.marks.get("done", time.perf_counter()) - self.marks["enqueue"]
+
+    def to_dict(self) -> dict:
+        stages = {}
+        for stage, start, end in _STAGES:
+            if start in self.marks and end in self.marks:
+                stages[stage] = round((self.marks[end] - self.marks[start]) * 1000, 3)
+        total_ms = round(self.total_secs() * 1000, 3)
+        # Inactive-destination retries, semaphore waits and logging between the stages.
+        stages["other"] = round(max(0.0, total_ms - sum(stages.values())), 3)
+        return {
+            "trace_id": self.trace_id,
+            "route": self.route,
+            "worker": self.worker,
+            "started_at": self.started_at,
+            "outcome": self.outcome,
+            "total_ms": total_ms,
+            "stages_ms": stages,
+        }
+
+
+def record(span: RouteSpan, outcome: str) -> None:
+    span.outcome = outcome
+    span.mark("done")
+    _recent.append(span)
+
+
+def slowest(limit: int = 20, route: str | None = None) -> list[dict]:
+    """The `limit` slowest recorded messages (enqueue to done), optionally for one route only."""
+    spans = [s for s in list(_recent) if route is None or s.route == route]
+    return [s.to_dict() for s in heapq.nlargest(limit, spans, key=RouteSpan.total_secs)]
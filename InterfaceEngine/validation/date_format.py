@@ -0,0 +1,174 @@
+"""
+Date/time `format` transforms, compiled once per rule.
+
+A rule config is `{"from": <strptime format>, "to": <strftime format>}` plus an optional
+`"fallbacks": [<strptime format>, ...]` tried in order when `from` does not match. Without
+`fallbacks` the chain is `%Y-%m-%d %H:%M:%S`, which is what the engine always fell back to.
+
+Formats built only from %Y %m %d %H %M %S %z and literals get a compiled parser and formatter
+instead of strptime/strftime. That covers the HL7 (`%Y%m%d`, `%Y%m%d%H%M%S`) and FHIR
+(`%Y-%m-%d`, `%Y-%m-%dT%H:%M:%S%z`) formats routes use. The parser matches with the same
+regular expressions strptime builds, so it accepts and rejects exactly what strptime does,
+without strptime's per-call overhead or a raised exception per failed format in the chain.
+Other formats use strptime/strftime. Results per distinct input are cached.
+"""
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import os
+import re
+
+_DATE_FORMAT_CACHE_SIZE = int(os.getenv("DATE_FORMAT_CACHE_SIZE", "4096"))
+_DEFAULT_FALLBACKS = ("%Y-%m-%d %H:%M:%S",)
+
+# The same sub-patterns CPython's _strptime uses, so a value these reject strptime rejects too.
+_DIRECTIVE_PATTERNS = {
+    "Y": r"(\d\d\d\d)",
+    "m": r"(1[0-2]|0[1-9]|[1-9])",
+    "d": r"(3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    "H": r"(2[0-3]|[0-1]\d|\d)",
+    "M": r"([0-5]\d|\d)",
+    "S": r"(6[0-1]|[0-5]\d|\d)",
+    "z": r"([+-]\d\d:?[0-5]\d(?::?[0-5]\d(?:\.\d{1,6})?)?|(?-i:Z))",
+}
+_FIELD_ORDER = ("Y", "m", "d", "H", "M", "S")
+_FORMAT_FIELDS = {"Y": "{0.year:04d}", "m": "{0.month:02d}", "d": "{0.day:02d}",
+                  "H": "{0.hour:02d}", "M": "{0.minute:02d}", "S": "{0.second:02d}"}
+
+
+def _tokenize(fmt: str):
+    """Split a strftime format into literal strings and one-letter directives, or None if it has
+    a directive the fast paths do not handle."""
+    tokens = []
+    literal = ""
+    i = 0
+    while i < len(fmt):
+        char = fmt[i]
+        if char != "%":
+            literal += char
+            i += 1
+            continue
+        if i + 1 >= len(fmt):
+            return None
+        directive = fmt[i + 1]
+        i += 2
+        if directive == "%":
+            literal += "%"
+            continue
+        if directive not in _DIRECTIVE_PATTERNS:
+            return None
+        if literal:
+            tokens.append(literal)
+            literal = ""
+        tokens.append((directive,))
+    if literal:
+        tokens.append(literal)
+    return tokens
+
+
+@lru_cache(maxsize=256)
+def _offset(text: str) -> timezone:
+    if text == "Z":
+        return timezone.utc
+    sign, hours, minutes = text[0], text[1:3], text[-2:]
+    delta = timedelta(hours=int(hours), minutes=int(minutes))
+    return timezone(-delta if sign == "-" else delta)
+
+
+def _compile_parser(fmt: str):
+    """
+    A function value -> datetime | None for `fmt` (None: strptime would reject the value too),
+    or None when `fmt` needs strptime itself.
+    """
+    tokens = _tokenize(fmt)
+    directives = [t[0] for t in tokens or () if isinstance(t, tuple)]
+    # Y/m/d must be present (strptime defaults them otherwise), each directive at most once.
+    if tokens is None or not {"Y", "m", "d"} <= set(directives) or len(directives) != len(set(directives)):
+        return None
+
+    parts = []
+    for token in tokens:
+        if isinstance(token, tuple):
+            parts.append(_DIRECTIVE_PATTERNS[token[0]])
+        else: # strptime turns any run of whitespace in the format into \s+
+            parts.extend(r"\s+" if piece.isspace() else re.escape(piece) for piece in re.split(r"(\s+)", token) if piece)
+    pattern = re.compile("".join(parts), re.IGNORECASE)
+    group_of = {directive: index + 1 for index, directive in enumerate(directives)}
+    field_groups = [group_of.get(directive) for directive in _FIELD_ORDER]
+    offset_group = group_of.get("z")
+
+    def parse(value: str):
+        match = pattern.match(value)
+        if match is None or match.end() != len(value): # strptime: "unconverted data remains"
+            return None
+        fields = [int(match.group(group)) if group else 0 for group in field_groups]
+        tzinfo = None
+        try:
+            if offset_group:
+                offset = match.group(offset_group)
+                if len(offset) > 6: # offsets with seconds; rare enough to leave to strptime
+                    return datetime.strptime(value, fmt)
+                tzinfo = _offset(offset)
+            return datetime(*fields, tzinfo=tzinfo)
+        except ValueError:
+            return None # e.g. 31 February or a +99:00 offset, which strptime rejects as well
+    return parse
+
+
+def _compile_formatter(fmt: str):
+    """A function datetime -> str for `fmt`, or None to use strftime."""
+    tokens = _tokenize(fmt)
+    if tokens is None or ("z",) in tokens:
+        return None
+    template = "".join(
+        _FORMAT_FIELDS[t[0]] if isinstance(t, tuple) else t.replace("{", "{{").replace("}", "}}") for t in tokens
+    ).format
+
+    def format_(dt: datetime) -> str:
+        if dt.year < 1000: # strftime does not zero-pad %Y on every platform
+            return dt.strftime(fmt)
+        return template(dt)
+    return format_
+
+
+class DateFormatRule:
+    """A compiled `format` rule; call it with a value to get the reformatted string."""
+    __slots__ = ("to_format", "chain", "_format", "_convert_cached")
+
+    def __init__(self, from_format: str, to_format: str, fallbacks=None):
+        self.to_format = to_format
+        formats = [from_format, *(_DEFAULT_FALLBACKS if fallbacks is None else fallbacks)]
+        self.chain = tuple((fmt, _compile_parser(fmt)) for fmt in dict.fromkeys(formats))
+        self._format = _compile_formatter(to_format) or (lambda dt: dt.strftime(to_format))
+        self._convert_cached = lru_cache(maxsize=_DATE_FORMAT_CACHE_SIZE)(self._convert)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "DateFormatRule":
+        """Build from a rule config; raises ValueError when from/to/fallbacks are malformed."""
+        from_format, to_format = config.get("from"), config.get("to")
+        fallbacks = config.get("fallbacks")
+        if not isinstance(from_format, str) or not isinstance(to_format, str):
+            raise ValueError("format rule needs string 'from' and 'to'")
+        if fallbacks is not None and (not isinstance(fallbacks, list) or not all(isinstance(f, str) for f in fallbacks)):
+            raise ValueError("format rule 'fallbacks' must be a list of format strings")
+        return cls(from_format, to_format, fallbacks)
+
+    def _convert(self, value: str):
+        for fmt, fast_parse in self.chain:
+            if fast_parse is not None:
+                dt = fast_parse(value)
+                if dt is None:
+                    continue
+            else:
+                try:
+                    dt = datetime.strptime(value, fmt)
+                except ValueError:
+                    continue
+            return self._format(dt)
+        return None # cached too, so a value that never parses is only tried once
+
+    def __call__(self, value) -> str:
+        """Reformat `value`; raises ValueError when no format in the chain matches it."""
+        result = self._convert_cached(str(value))
+        if result is None:
+            raise ValueError(f"{value!r} does not match {' or '.join(repr(fmt) for fmt, _ in self.chain)}")
+        return result
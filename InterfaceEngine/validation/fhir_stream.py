@@ -0,0 +1,235 @@
+"""
+Incremental parsing of large FHIR Bundles straight from the request stream.
+
+`await req.json()` holds the whole Bundle as Python objects (several times its size on the
+wire) and parses it in one go on the event loop; the path extraction then keeps every path and
+value of every entry on top of that. read_bundle instead reads the body chunk by chunk and
+decodes one `entry[]` element at a time. From each entry it keeps only the values of the
+source endpoint's fields (the only ones a route's mapping rules can use), then drops the entry.
+Only the text of the entry being decoded is kept (up to twice its size while a large entry is
+still arriving) plus the values extracted so far, and a body is cut off once it is over
+FHIR_MAX_PAYLOAD_BYTES. Entries are decoded with the standard library's C decoder, which also
+finds where each one ends.
+
+The result, a StreamedBundle, carries what _process_message would have extracted from the
+whole Bundle: the same `Observation[3]-code.text` style paths and their values, restricted to
+the mapped ones. The Bundle's other top-level fields (resourceType, identifier, ...) are kept
+as they are. A body that turns out not to be a Bundle is returned whole, as a dict. When the
+endpoint validates its messages (validation/structural.py), each entry is validated while it
+is decoded and its errors are kept on the StreamedBundle. The structural checks run inline;
+the full tier's fhir.resources models take milliseconds per entry, so each entry is validated
+in a worker thread while the next one is read (validate_in_thread), keeping the event loop free.
+
+FHIR_STREAM_MIN_BYTES is the Content-Length from which ingest streams a FHIR body; bodies
+without a Content-Length are always streamed. Below it the body is read and decoded whole.
+"""
+import asyncio
+import codecs
+import json
+import os
+import re
+
+from validation.fhir_validation import fhir_extract_paths, get_fhir_value_by_path
+
+STREAM_MIN_BYTES = int(os.getenv("FHIR_STREAM_MIN_BYTES", str(1024 * 1024))) # 0 = never stream
+MAX_PAYLOAD_BYTES = int(os.getenv("FHIR_MAX_PAYLOAD_BYTES", str(64 * 1024 * 1024)))
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_NUMBER_START = "-0123456789"
+_NUMBER_END = re.compile(r"[,\]}\s]")
+_MAX_VALIDATION_ERRORS = 100 # an invalid Bundle is rejected; no need to check all of it
+
+
+class PayloadTooLarge(ValueError):
+    """The body is over FHIR_MAX_PAYLOAD_BYTES."""
+
+
+def should_stream(content_length: str | None) -> bool:
+    """Whether a FHIR body with this Content-Length header is read with read_bundle."""
+    if STREAM_MIN_BYTES <= 0:
+        return False
+    if content_length is None:
+        return True
+    try:
+        return int(content_length) >= STREAM_MIN_BYTES
+    except ValueError:
+        return True
+
+
+class StreamedBundle:
+    """A Bundle read by read_bundle: its top-level fields besides `entry`, and its mapped values."""
+
+    def __init__(self, wanted_paths: set, validate_entry=None):
+        self.wanted_paths = wanted_paths
+        self.validate_entry = validate_entry # (entry, path) -> errors; see structural.entry_validator
+        self.validation_errors = [] # of the entries, when validate_entry is set
+        self._wanted_types = {path.split("-", 1)[0] for path in wanted_paths}
+        self.head = {} # top-level fields other than entry
+        self.entry_count = 0
+        self.simple_paths = [] # "Observation-code.text", once per occurrence
+        self.src_path_to_value = {} # "Observation[3]-code.text" -> value
+        self._occurrences = {} # simple path -> occurrences so far
+
+    def add_entry(self, entry) -> None:
+        """Extract the mapped values of one `entry[]` element, numbered as the whole-Bundle path does."""
+        if not isinstance(entry, dict):
+            raise ValueError("Bundle.entry items must be JSON objects")
+        if self.validate_entry is not None and len(self.validation_errors) < _MAX_VALIDATION_ERRORS:
+            self.validation_errors.extend(self.validate_entry(entry, f"Bundle.entry[{self.entry_count}]"))
+        self.entry_count += 1
+        resource = entry.get("resource", {})
+        res_type = resource.get("resourceType", "Unknown")
+        if res_type not in self._wanted_types: # no mapped field in this kind of resource
+            return
+        for p in fhir_extract_paths(resource):
+            simple_path = f"{res_type}-{p}"
+            if simple_path not in self.wanted_paths:
+                continue
+            occurrence = self._occurrences[simple_path] = self._occurrences.get(simple_path, 0) + 1
+            path = f"{res_type}[{occurrence}]-{p}"
+            self.simple_paths.append(simple_path)
+            self.src_path_to_value[path] = get_fhir_value_by_path(obj=resource, path=path)
+
+    def get(self, key, default=None):
+        """Top-level field lookup, as on the Bundle dict (resourceType, identifier, ...)."""
+        return self.head.get(key, default)
+
+    def summary(self) -> dict:
+        """What is logged as the source message: the Bundle without its entries."""
+        return dict(self.head, entry=f"<{self.entry_count} entries, streamed>")
+
+
+class _BodyReader:
+    """A window over the request body, as text: from the current value onwards."""
+
+    def __init__(self, chunks, max_bytes: int):
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")() # a character may be split across chunks
+        self._max_bytes = max_bytes
+        self._received = 0
+        self._eof = False
+        self.buf = ""
+        self.pos = 0
+
+    async def _fill(self) -> bool:
+        """Append the next chunk; False at the end of the body."""
+        if self._eof:
+            return False
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            self.buf = self.buf[self.pos:] + self._utf8.decode(b"", final=True)
+            self.pos = 0
+            return False
+        self._received += len(chunk)
+        if self._received > self._max_bytes:
+            raise PayloadTooLarge(f"FHIR payload is larger than {self._max_bytes} bytes")
+        self.buf = self.buf[self.pos:] + self._utf8.decode(chunk) # drop what was consumed
+        self.pos = 0
+        return True
+
+    async def peek(self) -> str | None:
+        """The next non-whitespace character (not consumed), or None at the end of the body."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not await self._fill():
+                return None
+
+    async def consume(self, char: str) -> bool:
+        if await self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    async def expect(self, char: str) -> None:
+        if not await self.consume(char):
+            found = await self.peek()
+            raise ValueError(f"Invalid JSON: expected {char!r}, found {'end of body' if found is None else repr(found)}")
+
+    async def value(self):
+        """
+        Decode and consume the next JSON value. When the window ends inside it, the window is
+        doubled and the value decoded again, so a value spanning many chunks costs about twice
+        its size rather than once per chunk.
+        """
+        first = await self.peek()
+        if first is None:
+            raise ValueError("Invalid JSON: unexpected end of body")
+        if first in _NUMBER_START: # a number at the end of the window may go on in the next chunk
+            while _NUMBER_END.search(self.buf, self.pos) is None and await self._fill():
+                pass
+        while True:
+            try:
+                value, self.pos = _DECODER.raw_decode(self.buf, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            wanted = 2 * (len(self.buf) - self.pos)
+            while len(self.buf) - self.pos < wanted and await self._fill():
+                pass
+
+
+async def read_bundle(chunks, wanted_paths: set, max_bytes: int | None = None, validate_entry=None,
+                      validate_in_thread: bool = False):
+    """
+    Read a FHIR body from `chunks` (an async iterator of bytes, e.g. `req.stream()`).
+
+    Returns a StreamedBundle holding the values of `wanted_paths` (simple paths such as
+    "Patient-name[0].family") when the body is a Bundle, otherwise the decoded resource. Raises
+    PayloadTooLarge past `max_bytes` (FHIR_MAX_PAYLOAD_BYTES by default) and ValueError when
+    the body is not a JSON object. With `validate_entry`, each entry is validated before it is
+    dropped and the errors kept in `validation_errors`; with `validate_in_thread`, in a worker
+    thread while the next entry is read, so at most two entries are held at a time.
+    """
+    reader = _BodyReader(chunks, MAX_PAYLOAD_BYTES if max_bytes is None else max_bytes)
+    if await reader.peek() != "{":
+        raise ValueError("FHIR payload must be a JSON object")
+    reader.pos += 1
+    bundle = StreamedBundle(wanted_paths, None if validate_in_thread else validate_entry)
+    validating = None # the previous entry's validation, running in a worker thread
+    if not await reader.consume("}"):
+        while True:
+            key = await reader.value()
+            if not isinstance(key, str):
+                raise ValueError("Invalid JSON: object keys must be strings")
+            await reader.expect(":")
+            if key == "entry" and await reader.peek() == "[":
+                reader.pos += 1
+                if not await reader.consume("]"):
+                    while True:
+                        entry = await reader.value()
+                        index = bundle.entry_count
+                        bundle.add_entry(entry)
+                        if validate_in_thread and validate_entry is not None:
+                            if validating is not None:
+                                bundle.validation_errors.extend(await validating)
+                            validating = None
+                            if len(bundle.validation_errors) < _MAX_VALIDATION_ERRORS:
+                                validating = asyncio.ensure_future(
+                                    asyncio.to_thread(validate_entry, entry, f"Bundle.entry[{index}]"))
+                        if await reader.consume("]"):
+                            break
+                        await reader.expect(",")
+                    if validating is not None:
+                        bundle.validation_errors.extend(await validating)
+            else:
+                bundle.head[key] = await reader.value()
+            if await reader.consume("}"):
+                break
+            await reader.expect(",")
+    if await reader.peek() is not None:
+        raise ValueError("Invalid JSON: extra data after the payload")
+
+    if bundle.head.get("resourceType") == "Bundle":
+        if "entry" in bundle.head:
+            raise ValueError("Bundle.entry must be an array")
+        return bundle
+    if bundle.entry_count:
+        raise ValueError("Only a Bundle can have entry[]")
+    return bundle.head
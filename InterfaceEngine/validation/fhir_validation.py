@@ -1,10 +1,15 @@
+from collections import OrderedDict
+from functools import lru_cache
 import json
+import os
 import re
 from uuid import uuid4  
 
 from fhir.resources.R4B import get_fhir_model_class
 from pydantic import ValidationError
 
+_LAYOUT_CACHE_SIZE = int(os.getenv("ROUTE_LAYOUT_CACHE_SIZE", "256"))
+
 def validate_unknown_fhir_resource(fhir_data: dict): # validation of any fhir message
     # 1. Identify the resource type
     
@@ -162,31 +167,13 @@ def _set_nested(obj: dict, keys: list, value) -> None:
         _set_nested(obj[key], keys[1:], value)
 
 
-async def build_fhir_message(output_data: dict[str, str],
-                       dest_path_to_resource: dict[str, str]) -> dict:
-    """
-    Reconstruct a proper FHIR JSON object (or Bundle) from a flat
-    {dest_path: value} mapping produced by the route worker.
-
-    Each dest_path has the form "ResourceType-dot.bracket[0].path".
-    Repeated resources are supported using an indexed resource prefix,
-    e.g. "Observation[1]-status" and "Observation[2]-status".
-    If multiple resource types are present a FHIR Bundle is returned;
-    otherwise a single resource object is returned.
-
-    Args:
-        output_data          : {full_prefixed_path: value}
-        dest_path_to_resource: {full_prefixed_path: resource_type}
-
-    Returns:
-        FHIR-compliant dict (single resource or Bundle).
-    """
+def _build_resources(items, dest_path_to_resource: dict) -> list[dict]:
+    """The resources, in first-seen order, that the (dest_path, value) pairs of `items` make up."""
     # Group paths by resource type + occurrence index.
     # Key shape: ("Patient", 1), ("Patient", 2), ("Coverage", 1), ...
     resources: dict[tuple[str, int], dict] = {}
-    resource_order: list[tuple[str, int]] = []
 
-    for path, value in output_data.items():
+    for path, value in items:
 
         if "-" in path:
             prefix, suffix = path.split("-", 1)
@@ -205,7 +192,6 @@ async def build_fhir_message(output_data: dict[str, str],
         resource_key = (resource_type, occurrence)
         if resource_key not in resources: # if this resource occurrence is not present then create it.
             resources[resource_key] = {"resourceType": resource_type}
-            resource_order.append(resource_key)
 
         # Strip "ResourceType-" prefix, then tokenise.
         # Works for both "Patient-name[0].text" and "Patient[2]-name[0].text".
@@ -216,24 +202,125 @@ async def build_fhir_message(output_data: dict[str, str],
         keys = [k for k in re.split(r"\[|\]|\.", suffix) if k]
         _set_nested(resources[resource_key], keys, value)
 
+    return list(resources.values())
+
+
+def _bundle(resources: list[dict]) -> dict:
     # Single resource — return it directly
     if len(resources) == 1:
-        return next(iter(resources.values()))
+        return resources[0]
 
     # Multiple resources — wrap in a Bundle
     return {
         "resourceType": "Bundle",
         "id": str(uuid4()), 
         "type": "message",
-        "entry": [
-            {
-                "resource": res,
-            }
-            for key in resource_order
-            for res in [resources[key]]
-        ],
+        "entry": [{"resource": res} for res in resources],
     }
 
+
+class _Slot:
+    """Stands for the value of output_data key number `index` while a skeleton is laid out."""
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+
+def _literal(node) -> str:
+    """Python source that rebuilds the skeleton `node`, with v[i] where the values go."""
+    if isinstance(node, _Slot):
+        return f"v[{node.index}]"
+    if isinstance(node, dict):
+        return "{" + ", ".join(f"{key!r}: {_literal(item)}" for key, item in node.items()) + "}"
+    if isinstance(node, list):
+        return "[" + ", ".join(_literal(item) for item in node) + "]"
+    return repr(node)
+
+
+@lru_cache(maxsize=512)
+def _code(source: str):
+    return compile(source, "<fhir skeleton>", "exec")
+
+
+class FHIRMessageTemplate:
+    """
+    Builds the FHIR messages of one route (fixed destination paths), created once per route
+    worker.
+
+    What a message looks like — which resources, which keys, lists and nested objects, where each
+    value sits — depends only on its output_data keys, so it is laid out once per set of keys (the
+    path parsing and _set_nested walk of build_fhir_message, run over placeholders) and turned into
+    a function that returns the whole resource, or Bundle, as one nested literal:
+
+        def build(v):
+            return {'resourceType': 'Patient', 'name': [{'given': v[0]}], 'gender': v[1]}
+
+    Building a message is then a single call with the values in key order. A message with a list
+    or dict among its values is built the step-by-step way, since _set_nested treats those as
+    containers it may extend.
+    """
+
+    def __init__(self, dest_path_to_resource: dict[str, str]):
+        self.dest_path_to_resource = dest_path_to_resource
+        self._builders: OrderedDict = OrderedDict()
+
+    def _builder(self, paths: tuple):
+        builder = self._builders.get(paths)
+        if builder is None:
+            skeleton = _build_resources(((path, _Slot(n)) for n, path in enumerate(paths)), self.dest_path_to_resource)
+            resources = ", ".join(_literal(resource) for resource in skeleton)
+            if len(skeleton) == 1:
+                source = f"def build(v):\n    return {resources}\n"
+            else:
+                entries = ", ".join(f"{{'resource': {_literal(resource)}}}" for resource in skeleton)
+                source = ("def build(v):\n"
+                          f"    return {{'resourceType': 'Bundle', 'id': str(uuid4()), 'type': 'message', 'entry': [{entries}]}}\n")
+            namespace = {"uuid4": uuid4}
+            exec(_code(source), namespace)
+            builder = self._builders[paths] = namespace["build"]
+            if len(self._builders) > _LAYOUT_CACHE_SIZE:
+                self._builders.popitem(last=False)
+        else:
+            self._builders.move_to_end(paths)
+        return builder
+
+    def build(self, output_data: dict[str, str]) -> dict:
+        """The FHIR resource, or Bundle of resources, for `output_data`."""
+        values = list(output_data.values())
+        for value in values:
+            if isinstance(value, (list, dict)):
+                return _bundle(_build_resources(output_data.items(), self.dest_path_to_resource))
+        return self._builder(tuple(output_data))(values)
+
+
+@lru_cache(maxsize=256)
+def _message_template(dest_paths: frozenset) -> FHIRMessageTemplate:
+    return FHIRMessageTemplate(dict(dest_paths))
+
+
+async def build_fhir_message(output_data: dict[str, str],
+                       dest_path_to_resource: dict[str, str]) -> dict:
+    """
+    Reconstruct a proper FHIR JSON object (or Bundle) from a flat
+    {dest_path: value} mapping produced by the route worker.
+
+    Each dest_path has the form "ResourceType-dot.bracket[0].path".
+    Repeated resources are supported using an indexed resource prefix,
+    e.g. "Observation[1]-status" and "Observation[2]-status".
+    If multiple resource types are present a FHIR Bundle is returned;
+    otherwise a single resource object is returned.
+    Route workers keep a FHIRMessageTemplate of their own; this shares one per destination path set.
+
+    Args:
+        output_data          : {full_prefixed_path: value}
+        dest_path_to_resource: {full_prefixed_path: resource_type}
+
+    Returns:
+        FHIR-compliant dict (single resource or Bundle).
+    """
+    return _message_template(frozenset(dest_path_to_resource.items())).build(output_data)
+
 if __name__ == "__main__":
     # Usage Example:
 
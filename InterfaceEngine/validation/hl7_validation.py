@@ -1,9 +1,16 @@
-from datetime import datetime
+from collections import OrderedDict
+from functools import lru_cache
 import logging
 from logging.handlers import RotatingFileHandler
+import os
 import re
+import time
 from uuid import uuid4
 
+from hl7apy.consts import VALIDATION_LEVEL
+from hl7apy.exceptions import HL7apyException
+from hl7apy.parser import parse_message
+
 logger = logging.getLogger("hl7_validation")
 logger.setLevel(logging.DEBUG)
 logger.propagate = False # means a logger only writes to its own handler, else it will write to its parent handler as well.
@@ -18,6 +25,25 @@ if not logger.handlers:
     logger.addHandler(handler)
 
 
+def validate_hl7_message(hl7_message: str): # full validation of any HL7 v2 message
+    """
+    Parse `hl7_message` with hl7apy in strict mode, against the definitions of its version
+    (MSH-12) and message structure (MSH-9), and validate the result.
+
+    Returns:
+        tuple: (is_valid: bool, message: str)
+    """
+    segments = hl7_message.replace("\r\n", "\r").replace("\n", "\r").strip("\r")
+    try:
+        parsed = parse_message(segments, validation_level=VALIDATION_LEVEL.STRICT, find_groups=True)
+        parsed.validate()
+        return True, f"Success: {parsed.name} is valid."
+    except HL7apyException as e:
+        return False, f"Validation Failed: {str(e)}"
+    except Exception as e:
+        return False, f"Unexpected Error: {str(e)}"
+
+
 def hl7_extract_paths(segment) -> list:
     """
     Parse a single HL7 segment string and return all field/component/subcomponent paths.
@@ -120,175 +146,194 @@ def get_hl7_value_by_path(hl7_message, paths):
     logger.info(f"Extracted values for paths: {paths} -> {path_to_value}\n\n")
     return path_to_value
 
-# this output_data contains all the data of the entire hl7 message of every segment,
-# with fields and values in a flat structure e.g. {"PID-5.1": "Smith", "PID-3": "12345", "PID-3.4.1": "X"}
-async def build_hl7_message(output_data: dict[str, str], 
-                      src: str,
-                      dest: str,
-                      msg_type: str) -> str:
+# HL7 segment order: MSH first, then these; unknown segments go last, in output_data order.
+SEGMENT_ORDER = [
+    "EVN", "PID", "PD1", "NK1", "PV1", "PV2",
+    "IN1", "IN2", "IN3", "GT1",
+    "AL1", "DG1", "PR1",
+    "ORC", "OBR", "OBX", "NTE",
+    "RXO", "RXE", "RXR", "RXC",
+    "FT1", "ZPD",
+]
+# Segments whose field 1 is a set id, filled with the occurrence when the route does not map it.
+SEGMENT_HAVE_SET = frozenset([
+    "PID", "NK1", "PV1", "IN1", "IN3", "GT1", "AL1",
+    "DG1", "PR1", "OBR", "OBX", "NTE", "FT1"
+])
+_SEGMENT_RANK = {seg_name: rank for rank, seg_name in enumerate(SEGMENT_ORDER)}
+_SEGMENT_TOKEN = re.compile(r"([A-Z0-9]{2,})(?:\[(\d+)\])?")
+_PATH_SPLIT = re.compile(r"-|\.")
+_LAYOUT_CACHE_SIZE = int(os.getenv("ROUTE_LAYOUT_CACHE_SIZE", "256"))
+
+
+@lru_cache(maxsize=4096)
+def _coordinates(path: str):
     """
-    Reconstruct a valid HL7 v2.x message string from a flat
-    {dest_path: value} mapping produced by the route worker.
-
-        Handles:
-      - Simple fields        PID-3   → PID field 3
-      - Component fields     PID-5.1 → PID field 5, component 1 (^ delimiter)
-      - Subcomponent fields  PID-3.4.1 → component 4, subcomponent 1 (& delimiter)
-            - Repeated segments    OBX[1]-3 and OBX[2]-3 → two OBX lines
-
-    Returns a full HL7 string with MSH prepended and segments separated by \\r\\n.
-
-    Args:
-        output_data : {full_prefixed_path: value}  e.g. {"PID-5.1": "Smith"}
-        src         : Sending application / facility name
-        dest        : Receiving application / facility name
-        msg_type    : HL7 message type, e.g. "ADT^A01" or "ORU^R01"
-
-    Returns:
-        Complete HL7 message string.
+    (segment, occurrence, field, component, subcomponent) of a destination path such as
+    `PID[2]-3.4.1`, or None for a path that names no HL7 field.
     """
-    logger.info(f"Building HL7 message with src: {src}, dest: {dest}, msg_type: {msg_type}, output_data keys: {list(output_data.keys())}")
-    dt = datetime.now().strftime("%Y%m%d%H%M%S")
-    control_id = f"MSG{uuid4()}"
-
-    msh = (
-        f"MSH|^~\\&|{src}||{dest}||{dt}||{msg_type}"
-        f"|{control_id}|P|2.5"
-    )
-    
-    # ── Build segment buffers ─────────────────────────────────────────────────
-    # Structure:
-    # {
-    #   segment_type: {
-    #     occurrence_index: {
-    #       field_idx: { comp_idx: { sub_idx: value } }
-    #     }
-    #   }
-    # }
+    # Parse path — strip resource prefix if present (HL7 paths have no "-")
+    # resource prefix, but be defensive in case one is passed)
+    if path.count("-") >= 1:
+        # if the PID part in PID-5.1 is not uppercase then it means there is a resource prefix e.g. Patient-PID-5.1,
+        # so we need to remove the resource prefix and keep PID-5.1 as the path, but if the PID part is uppercase
+        # then it means there is no resource prefix and we can keep the path as it is.
+        path_core = path.split("-", 1)[1] if not path.split("-")[0].isupper() \
+                    else path           # keep "PID-5.1" as-is
+    else:
+        path_core = path
+
+    # parts[0] = segment, parts[1] = field, parts[2]? = component, parts[3]? = subcomponent
+    parts = _PATH_SPLIT.split(path_core)
+    if len(parts) < 2: # must have at least segment and field
+        return None
+
+    # segment token can be: PID or PID[2]
+    seg_match = _SEGMENT_TOKEN.fullmatch(parts[0].upper())
+    if not seg_match:
+        return None
+    occurrence = int(seg_match.group(2)) if seg_match.group(2) else 1
+    try:
+        field = int(parts[1])
+    except ValueError:
+        return None
+    comp  = int(parts[2]) if len(parts) > 2 else 1
+    sub   = int(parts[3]) if len(parts) > 3 else 1
+    return seg_match.group(1), occurrence, field, comp, sub
+
+
+def _segment_template(paths: tuple) -> str:
+    """
+    The segment lines of every message whose non-null output_data keys are `paths` (in that
+    order), as a str.format template: `{n}` is the value of paths[n], everything else (segment
+    order, set ids, empty fields, ^ and & delimiters) is already in place.
+    """
+    # this converts PID-3 (slot 0) into {'PID': {1: {3: {1: {1: '{0}'}}}}}
     seg_data: dict[str, dict[int, dict[int, dict[int, dict[int, str]]]]] = {}
-
-    for path, value in output_data.items(): # {"PID-5.1": "Smith", "PID-3": "12345", "PID-3.4.1": "X"}
-        if value is None:
-            continue
-        str_value = str(value)
-
-        # Parse path — strip resource prefix if present (HL7 paths have no "-")
-        # resource prefix, but be defensive in case one is passed)
-        if path.count("-") >= 1:
-            # if the PID part in PID-5.1 is not uppercase then it means there is a resource prefix e.g. Patient-PID-5.1,
-            # so we need to remove the resource prefix and keep PID-5.1 as the path, but if the PID part is uppercase
-            # then it means there is no resource prefix and we can keep the path as it is.
-            path_core = path.split("-", 1)[1] if not path.split("-")[0].isupper() \
-                        else path           # keep "PID-5.1" as-is
-        else:
-            path_core = path
-
-        # Split on "-" then "."
-        parts = re.split(r"-|\.", path_core)
-        # parts[0] = segment, parts[1] = field, parts[2]? = component, parts[3]? = subcomponent
-        if len(parts) < 2: # must have at least segment and field
+    for slot, path in enumerate(paths):
+        coordinates = _coordinates(path)
+        if coordinates is None:
             continue
+        seg, occurrence, field, comp, sub = coordinates
+        seg_data.setdefault(seg, {}).setdefault(occurrence, {}).setdefault(field, {}).setdefault(comp, {})[sub] = f"{{{slot}}}"
 
-        # segment token can be: PID or PID[2]
-        seg_token = parts[0].upper()
-        seg_match = re.fullmatch(r"([A-Z0-9]{2,})(?:\[(\d+)\])?", seg_token)
-        if not seg_match:
-            continue
-        seg = seg_match.group(1)
-        occurrence = int(seg_match.group(2)) if seg_match.group(2) else 1
-
-        try:
-            field = int(parts[1])
-        except ValueError:
-            continue
-        comp  = int(parts[2]) if len(parts) > 2 else 1
-        sub   = int(parts[3]) if len(parts) > 3 else 1
-
-        # this converts PID-3 into {'PID': {1: {3: {1: {1: '12345'}}}}}
-        seg_data.setdefault(seg, {})
-        seg_data[seg].setdefault(occurrence, {})
-        seg_data[seg][occurrence].setdefault(field, {})
-        seg_data[seg][occurrence][field].setdefault(comp, {})
-        seg_data[seg][occurrence][field][comp][sub] = str_value
-
-    logger.debug(f"Segment data structure after parsing output_data: {seg_data}")
-    # ── Serialise each segment ────────────────────────────────────────────────
-    # HL7 segment order: MSH first, then alphabetical (reasonable default)
-    SEGMENT_ORDER = [
-        "EVN", "PID", "PD1", "NK1", "PV1", "PV2",
-        "IN1", "IN2", "IN3", "GT1",
-        "AL1", "DG1", "PR1",
-        "ORC", "OBR", "OBX", "NTE",
-        "RXO", "RXE", "RXR", "RXC",
-        "FT1", "ZPD",
-    ]
-    SEGMENT_HAVE_SET = [
-        "PID", "NK1", "PV1", "IN1", "IN3", "GT1", "AL1",
-        "DG1", "PR1", "OBR", "OBX", "NTE", "FT1"
-    ]
-
-    def seg_sort_key(seg_name: str) -> int: # return a segment rank/index.
-        try:
-            return SEGMENT_ORDER.index(seg_name)
-        except ValueError:
-            return len(SEGMENT_ORDER)  # unknown segments go last
-
-    lines = [msh]
-    segment_counter : dict[str, int] = {} # to track occurrences of each segment type
-
-    # here the seg_data will have all the data of the entire hl7 message
-    # the sorted, takes the a list, we have to sort, and the a function that tells how to sort. 
-    for seg_name in sorted(seg_data.keys(), key=seg_sort_key): # the lower rank comes first.
-        occurrence_map = seg_data[seg_name] # occurance map = {PID: {1: {3: {1: {1: '12345'}}}}, {2: {3: {1: {1: '12345'}}}}}
-
-        # {"PID": 1, "OBX": 2} means the generated message have 1 pid semgnet and 2 obx segments.
-        segment_counter[seg_name] = 1 if segment_counter.get(seg_name) is None else segment_counter[seg_name] + 1
-        logger.info(f"segment {seg_name} occurrence count: {segment_counter[seg_name]}")
-
+    lines = []
+    # the lower rank comes first; sorted is stable, so unknown segments keep their output_data order.
+    for seg_name in sorted(seg_data.keys(), key=lambda name: _SEGMENT_RANK.get(name, len(SEGMENT_ORDER))):
+        occurrence_map = seg_data[seg_name]
         for occ in sorted(occurrence_map.keys()):
             fields_map = occurrence_map[occ] # contain all the fields of one segment
-            max_field = max(fields_map.keys()) # max field index for this segment, e.g. 5 for PID
+            max_field = max(fields_map.keys())
             field_strs: list[str] = []
-
             for f_idx in range(1, max_field + 1): # include the last field index
                 if f_idx not in fields_map:
                     field_strs.append("")
                     continue
-
                 comp_map = fields_map[f_idx]
                 max_comp = max(comp_map.keys())
-                logger.info(f"Processing field index {f_idx}")
                 comp_strs: list[str] = []
-
                 for c_idx in range(1, max_comp + 1):
                     if c_idx not in comp_map:
                         comp_strs.append("")
                         continue
-
                     sub_map = comp_map[c_idx]
                     max_sub = max(sub_map.keys())
-                    logger.info(f"Processing component index {c_idx}")
-
                     if max_sub == 1:
                         comp_strs.append(sub_map[1])
                     else:
-                        sub_strs = [sub_map.get(s, "") for s in range(1, max_sub + 1)]
-                        comp_strs.append("&".join(sub_strs))
-
+                        comp_strs.append("&".join(sub_map.get(s, "") for s in range(1, max_sub + 1)))
                 field_strs.append("^".join(comp_strs) if max_comp > 1 else comp_strs[0])
 
             if min(fields_map.keys()) > 1 and seg_name in SEGMENT_HAVE_SET:
                 # this will allow those fields whose first field is was not present, and they have were allow to have a set id.
-                line =  f"{seg_name}|" + str(occ) + "|".join(field_strs)
-                logger.info(f"appending line {line}")
-                lines.append(line)
+                lines.append(f"{seg_name}|" + str(occ) + "|".join(field_strs))
             else:
-                line = f"{seg_name}|" + "|".join(field_strs)
-                logger.info(f"appending line {line}")
-                lines.append(line)
-
+                lines.append(f"{seg_name}|" + "|".join(field_strs))
     return "\r\n".join(lines)
 
+
+class HL7MessageTemplate:
+    """
+    Builds the HL7 messages of one route (fixed src, dest and msg_type), created once per route
+    worker.
+
+    Where a value goes depends only on its output_data key, so the layout of a message — which
+    segment lines there are, in what order, and which key fills which field, component and
+    subcomponent — is worked out once per set of keys and kept as a str.format template. Building
+    a message is then one pass to collect its values into slots and one format call, plus the
+    MSH line, whose fixed part is prepared here.
+    """
+
+    def __init__(self, src: str, dest: str, msg_type: str):
+        self._msh_head = f"MSH|^~\\&|{src}||{dest}||"
+        self._msh_tail = f"||{msg_type}"
+        self._templates: OrderedDict = OrderedDict()
+        self._second = None
+        self._timestamp = ""
+
+    def _template(self, paths: tuple) -> str:
+        template = self._templates.get(paths)
+        if template is None:
+            template = self._templates[paths] = _segment_template(paths)
+            if len(self._templates) > _LAYOUT_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        else:
+            self._templates.move_to_end(paths)
+        return template
+
+    def build(self, output_data: dict[str, str]) -> str:
+        """The complete HL7 message (MSH first, segments separated by \\r\\n) for `output_data`."""
+        paths = []
+        values = []
+        for path, value in output_data.items():
+            if value is not None:
+                paths.append(path)
+                values.append(str(value))
+        template = self._template(tuple(paths))
+
+        second = int(time.time())
+        if second != self._second: # datetime.now() to the second, formatted once per second
+            self._second, self._timestamp = second, time.strftime("%Y%m%d%H%M%S", time.localtime(second))
+        msh = f"{self._msh_head}{self._timestamp}{self._msh_tail}|MSG{uuid4()}|P|2.5"
+        return f"{msh}\r\n{template.format(*values)}" if template else msh
+
+
+@lru_cache(maxsize=256)
+def _message_template(src: str, dest: str, msg_type: str) -> HL7MessageTemplate:
+    return HL7MessageTemplate(src, dest, msg_type)
+
+
+# this output_data contains all the data of the entire hl7 message of every segment,
+# with fields and values in a flat structure e.g. {"PID-5.1": "Smith", "PID-3": "12345", "PID-3.4.1": "X"}
+async def build_hl7_message(output_data: dict[str, str], 
+                      src: str,
+                      dest: str,
+                      msg_type: str) -> str:
+    """
+    Reconstruct a valid HL7 v2.x message string from a flat
+    {dest_path: value} mapping produced by the route worker.
+
+        Handles:
+      - Simple fields        PID-3   → PID field 3
+      - Component fields     PID-5.1 → PID field 5, component 1 (^ delimiter)
+      - Subcomponent fields  PID-3.4.1 → component 4, subcomponent 1 (& delimiter)
+            - Repeated segments    OBX[1]-3 and OBX[2]-3 → two OBX lines
+
+    Returns a full HL7 string with MSH prepended and segments separated by \\r\\n.
+    Route workers keep an HL7MessageTemplate of their own; this shares one per (src, dest, msg_type).
+
+    Args:
+        output_data : {full_prefixed_path: value}  e.g. {"PID-5.1": "Smith"}
+        src         : Sending application / facility name
+        dest        : Receiving application / facility name
+        msg_type    : HL7 message type, e.g. "ADT^A01" or "ORU^R01"
+
+    Returns:
+        Complete HL7 message string.
+    """
+    logger.debug("Building HL7 message with src: %s, dest: %s, msg_type: %s", src, dest, msg_type)
+    return _message_template(src, dest, msg_type).build(output_data)
+
 if __name__ == "__main__":
 
     final_output = build_hl7_message(
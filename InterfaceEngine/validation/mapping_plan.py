@@ -0,0 +1,291 @@
+"""
+A route's mapping rules compiled into a plan that transforms a batch of messages column-wise.
+
+Where each value goes (the `PID[2]-5.1` style source and destination paths) depends only on
+the message's shape: its simple paths and which source paths are present. The per-message loop
+works that out again for every message with increment_segment; the plan works it out once per
+shape and caches it as a layout. A batch is grouped by shape, and each rule then runs over a
+whole column of values — one map lookup / regex sub / date conversion per value, without the
+per-message rule dispatch. Split targets also depend on how many parts each value splits into,
+so those are laid out per (shape, part counts).
+
+If a rule raises for some value in a column (e.g. a regex on a non-string), that group is
+redone one message at a time, so only the messages that fail get the exception, exactly as the
+per-message loop would raise it.
+
+With ROUTE_TRANSFORM_BACKEND=compiled (the default) each layout is also turned into generated
+straight-line Python (validation/transform_compiler.py) on first use; layouts the compiler does
+not handle use the interpreter below. The per-field mapping log is written from the output data
+afterwards, so it does not decide which of the two runs.
+"""
+from collections import Counter, OrderedDict
+import logging
+import os
+
+import code_sets
+from validation.transform_compiler import compile_layout
+from validation.transformation import fill_duplicate_missing_values, increment_segment, regex_replace_with_template
+
+_LAYOUT_CACHE_SIZE = int(os.getenv("ROUTE_LAYOUT_CACHE_SIZE", "256"))
+_COMPILE_TRANSFORMS = os.getenv("ROUTE_TRANSFORM_BACKEND", "compiled").lower() == "compiled" # or "interpreted"
+
+# Same loggers as main.py's route workers; their handlers are attached there.
+logger = logging.getLogger("interface_engine.main")
+logger_mapping = logging.getLogger("interface_engine.mapping")
+
+
+class _Layout:
+    """Where the values of messages of one shape go, up to (not including) split."""
+    __slots__ = ("assignments", "concats", "splits", "keys", "split_layouts", "compiled")
+
+    def __init__(self):
+        self.assignments = [] # (rule, src_path, dest_path | None), in rule order
+        self.concats = [] # (dest_path, delimiter, [src_path, ...])
+        self.splits = [] # (src_path, split_rules, delimiter)
+        self.keys = () # output keys after assignments and concats, in insertion order
+        self.split_layouts = {} # part counts per split -> [[dest_path, ...] per split]
+        self.compiled = None # generated function for assignments and concats; False if not compilable
+
+
+class MappingPlan:
+    """The transform stage of one route, compiled once per route worker."""
+
+    def __init__(self, route_name: str, mapping_rules, src_id_to_path: dict, dest_id_to_path: dict,
+                 compiled_regex_rules: dict, compiled_format_rules: dict, compile_transforms: bool | None = None):
+        self.route_name = route_name
+        self.compile_transforms = _COMPILE_TRANSFORMS if compile_transforms is None else compile_transforms
+        self.src_id_to_path = src_id_to_path
+        self.dest_id_to_path = dest_id_to_path
+        self.compiled_regex_rules = compiled_regex_rules
+        self.compiled_format_rules = compiled_format_rules
+        self.simple_rules = [] # map | copy | format | regex
+        self.concat_data = {} # dest field id -> concat rules
+        self.split_data = {} # src field id -> split rules
+        for rule in mapping_rules:
+            if rule.transform_type == "concat":
+                self.concat_data.setdefault(rule.dest_field_id, []).append(rule)
+            elif rule.transform_type == "split":
+                self.split_data.setdefault(rule.src_field_id, []).append(rule)
+            else:
+                self.simple_rules.append(rule)
+        self._layouts: OrderedDict = OrderedDict()
+
+    # ─── Layouts ───
+
+    async def _build_layout(self, simple_paths, present) -> _Layout:
+        layout = _Layout()
+        simple_path_counts = Counter(simple_paths)
+        output_keys = {}
+        missing = []
+
+        normal_src_paths_counter = []
+        for rule in self.simple_rules:
+            src_path = self.src_id_to_path[rule.src_field_id]
+            for _ in range(simple_path_counts[src_path]):
+                src_path = await increment_segment(segment_path=src_path, list_data=normal_src_paths_counter)
+                normal_src_paths_counter.append(src_path)
+                if src_path not in present:
+                    missing.append(src_path)
+                    continue
+                dest_path = None
+                if rule.dest_field_id in self.dest_id_to_path:
+                    dest_path = await increment_segment(output_data=output_keys, segment_path=self.dest_id_to_path[rule.dest_field_id])
+                    output_keys[dest_path] = None
+                else:
+                    logger.error("The destination id in rule %s does not matches with the destination map id %s",
+                                 rule.dest_field_id, self.dest_id_to_path)
+                layout.assignments.append((rule, src_path, dest_path))
+
+        concat_src_paths_counter = []
+        for dest_id, concat_rules in self.concat_data.items():
+            multiple_src_paths_to_concat: dict[int, list[str]] = {}
+            delimiter = " "
+            for concat_rule in concat_rules:
+                delimiter = concat_rule.config.get("delimiter", " ")
+                src_path = self.src_id_to_path[concat_rule.src_field_id]
+                for i in range(simple_path_counts[src_path]):
+                    current_src_path = await increment_segment(segment_path=src_path, list_data=concat_src_paths_counter)
+                    concat_src_paths_counter.append(current_src_path)
+                    if current_src_path in present:
+                        multiple_src_paths_to_concat.setdefault(i, []).append(current_src_path)
+                    else:
+                        missing.append(current_src_path)
+            for src_paths in multiple_src_paths_to_concat.values():
+                dest_path = await increment_segment(output_data=output_keys, segment_path=self.dest_id_to_path[dest_id])
+                output_keys[dest_path] = None
+                layout.concats.append((dest_path, delimiter, src_paths))
+
+        split_src_paths_counter = []
+        for src_id, split_rules in self.split_data.items():
+            src_path = self.src_id_to_path[src_id]
+            for _ in range(simple_path_counts[src_path]):
+                src_path = await increment_segment(segment_path=src_path, list_data=split_src_paths_counter)
+                split_src_paths_counter.append(src_path)
+                if src_path not in present:
+                    missing.append(src_path)
+                    continue
+                layout.splits.append((src_path, split_rules, split_rules[0].config.get("delimiter", " ")))
+
+        if missing:
+            logger.warning("route '%s': src paths %s not found in messages with paths %s",
+                           self.route_name, missing, sorted(present))
+        layout.keys = tuple(output_keys)
+        return layout
+
+    async def _layout(self, simple_paths, present: frozenset) -> _Layout:
+        key = (tuple(simple_paths), present)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = self._layouts[key] = await self._build_layout(simple_paths, present)
+            if len(self._layouts) > _LAYOUT_CACHE_SIZE:
+                self._layouts.popitem(last=False)
+        else:
+            self._layouts.move_to_end(key)
+        return layout
+
+    async def _split_layout(self, layout: _Layout, part_counts: tuple) -> list:
+        """Destination paths of each split, given how many parts (capped at the rule count) each yields."""
+        dest_paths = layout.split_layouts.get(part_counts)
+        if dest_paths is None:
+            output_keys = dict.fromkeys(layout.keys)
+            dest_paths = []
+            for (_, split_rules, _), count in zip(layout.splits, part_counts):
+                paths = []
+                for split_rule in split_rules[:count]:
+                    dest_path = await increment_segment(output_data=output_keys, segment_path=self.dest_id_to_path[split_rule.dest_field_id])
+                    output_keys[dest_path] = None
+                    paths.append(dest_path)
+                dest_paths.append(paths)
+            layout.split_layouts[part_counts] = dest_paths
+        return dest_paths
+
+    # ─── Values ───
+
+    def _value_transform(self, rule):
+        """The per-value function of a simple rule, or None for copy."""
+        if rule.transform_type == "map":
+            config = rule.config
+            if "code_set" not in config:
+                return lambda value: config.get(str(value).lower(), value)
+            # A named table (see code_sets.py), resolved once per column; inline entries override it.
+            table = code_sets.get_code_set(config["code_set"])
+            overrides = {key: mapped for key, mapped in config.items() if key != "code_set"}
+
+            def lookup(value):
+                key = str(value).lower()
+                return overrides[key] if key in overrides else table.get(key, value)
+            return lookup
+        if rule.transform_type == "regex":
+            compiled_rule = self.compiled_regex_rules.get(rule.mapping_rule_id)
+            if compiled_rule is not None:
+                pattern, replacement = compiled_rule
+                return lambda value: pattern.sub(replacement, value)
+            return lambda value: regex_replace_with_template(value=value, pattern_from=rule.config["from"], pattern_to=rule.config["to"])
+        if rule.transform_type == "format":
+            date_rule = self.compiled_format_rules.get(rule.mapping_rule_id)
+
+            def convert(value):
+                try: # 2004-10-06 → 20041006 vice versa; see validation/date_format.py
+                    if date_rule is None:
+                        raise ValueError(f"format rule {rule.mapping_rule_id} has an invalid config")
+                    return date_rule(value)
+                except ValueError as exp:
+                    logger.error(f"Error while transformation: {str(exp)}")
+                    return value
+            return convert
+        return None
+
+    def _compiled(self, layout: _Layout):
+        if layout.compiled is None:
+            try:
+                layout.compiled = compile_layout(layout, self._value_transform, self.compiled_regex_rules) or False
+            except Exception:
+                logger.exception("route '%s': transform compilation failed, interpreting instead", self.route_name)
+                layout.compiled = False
+        return layout.compiled
+
+    def _interpret(self, layout: _Layout, rows: list) -> list[dict]:
+        """Assignments and concats of `layout`, one rule at a time over whole columns."""
+        outputs = [{} for _ in rows]
+        columns = {} # src_path -> values, shared by every rule reading that path
+        for rule, src_path, dest_path in layout.assignments:
+            column = columns.get(src_path)
+            if column is None:
+                column = columns[src_path] = [row[src_path] for row in rows]
+            transform = self._value_transform(rule)
+            values = column if transform is None else [transform(value) for value in column]
+            if dest_path is None:
+                continue
+            for output_data, value in zip(outputs, values):
+                output_data[dest_path] = value
+
+        for dest_path, delimiter, src_paths in layout.concats:
+            for output_data, row in zip(outputs, rows):
+                output_data[dest_path] = delimiter.join([str(row[src_path]) for src_path in src_paths])
+        return outputs
+
+    @staticmethod
+    def _log_mapping(layout: _Layout, outputs: list, log_value) -> None:
+        """The per-field mapping log of a transformed group, from its output data."""
+        for _, src_path, dest_path in layout.assignments:
+            if dest_path is None:
+                continue
+            for output_data in outputs:
+                logger_mapping.info("src_path: %s, dest_path: %s value: %s", src_path, dest_path, log_value(output_data.get(dest_path)))
+        for dest_path, _, _ in layout.concats:
+            for output_data in outputs:
+                logger_mapping.info("Concated value for dest_path %s is %s", dest_path, log_value(output_data.get(dest_path)))
+
+    async def _transform_group(self, layout: _Layout, rows: list, log_value) -> list[dict]:
+        """Output data of rows that share `layout`; raises if any rule raises for any of them."""
+        compiled = self.compile_transforms and self._compiled(layout)
+        outputs = [compiled(row) for row in rows] if compiled else self._interpret(layout, rows)
+        if log_value is not None:
+            self._log_mapping(layout, outputs, log_value)
+
+        if layout.splits:
+            parts_per_row = [[str(row[src_path]).split(delimiter) for src_path, _, delimiter in layout.splits] for row in rows]
+            for output_data, row_parts in zip(outputs, parts_per_row):
+                part_counts = tuple(min(len(parts), len(split_rules)) for parts, (_, split_rules, _) in zip(row_parts, layout.splits))
+                for parts, (_, split_rules, _), dest_paths in zip(row_parts, layout.splits, await self._split_layout(layout, part_counts)):
+                    for dest_path, part in zip(dest_paths, parts):
+                        output_data[dest_path] = part
+                    if len(parts) > len(split_rules) and dest_paths: # what is left over goes on the last destination
+                        output_data[dest_paths[-1]] += " " + (" ").join(parts[len(split_rules):])
+                    elif not dest_paths:
+                        logger.warning("while Splitting, no split data is mapped to any destination")
+
+        return [fill_duplicate_missing_values(output_data) for output_data in outputs]
+
+    async def transform_batch(self, rows: list, log_value=None) -> list:
+        """
+        Transform (src_path_to_value, simple_paths) pairs. Returns, in the same order, each
+        message's output data, or the exception that message's transform raised. `log_value`,
+        when given, wraps values for the per-field mapping log (which is skipped otherwise).
+        """
+        results: list = [None] * len(rows)
+        groups: dict = {}
+        for index, (src_path_to_value, simple_paths) in enumerate(rows):
+            groups.setdefault((tuple(simple_paths), frozenset(src_path_to_value)), []).append(index)
+
+        for (simple_paths, present), indexes in groups.items():
+            try:
+                layout = await self._layout(simple_paths, present)
+            except Exception as exp:
+                for index in indexes:
+                    results[index] = exp
+                continue
+            group_rows = [rows[index][0] for index in indexes]
+            try:
+                outputs = await self._transform_group(layout, group_rows, log_value)
+            except Exception:
+                # Some value made a rule raise: redo the group one message at a time.
+                outputs = []
+                for row in group_rows:
+                    try:
+                        outputs.append((await self._transform_group(layout, [row], log_value))[0])
+                    except Exception as exp:
+                        outputs.append(exp)
+            for index, output in zip(indexes, outputs):
+                results[index] = output
+        return results
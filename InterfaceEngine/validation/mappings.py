@@ -26,6 +26,12 @@ Three exports:
     FHIR_PATTERN_CANONICAL  — suffix-pattern fallback for any/future resources
     HL7_EXACT_CANONICAL     — segment/field exact path → canonical name
 
+and the hashed lookups compiled from them at import (see COMPILED LOOKUPS at the end):
+    CANONICAL_BY_PATH       — FHIR and HL7 exact paths together
+    PATTERN_BY_SUFFIX       — FHIR_PATTERN_CANONICAL keyed by its suffix
+
+resolved through canonical_name (memoized per path) and canonical_names (a whole path list).
+
 Collision rules enforced throughout:
     # - "ResourceType-id"                  → "{resource}_fhir_id"  (internal server ID)
     - "ResourceType-identifier[x].value" → clinically meaningful name where known:
@@ -40,6 +46,8 @@ Collision rules enforced throughout:
     - All {resource} templates produce unique names per resource — no two paths
       in the same resource ever resolve to the same canonical name.
 """
+from functools import lru_cache
+import os
 
 
 # =============================================================================
@@ -1800,3 +1808,58 @@ HL7_EXACT_CANONICAL: dict[str, str] = {
     "RXO-Z921": "rx_supply_days",
     "RXO-Z922": "rx_timing_code",
 }
+
+
+# =============================================================================
+# COMPILED LOOKUPS
+# =============================================================================
+# Built once at import from the tables above, for canonical_name(s) below (used by
+# api/endpoint.py resolve_canonical_name(s)).
+#
+# CANONICAL_BY_PATH    : exact path → canonical name, FHIR and HL7 together (their keys never
+#                        collide; FHIR wins if they ever do, as it is checked first).
+# PATTERN_BY_SUFFIX    : path after the "ResourceType-" prefix → name template; the first
+#                        pattern listed wins, as in a scan of FHIR_PATTERN_CANONICAL.
+
+CANONICAL_BY_PATH: dict[str, str] = {**HL7_EXACT_CANONICAL, **FHIR_EXACT_CANONICAL}
+
+PATTERN_BY_SUFFIX: dict[str, str] = {}
+for _pattern, _name_template in FHIR_PATTERN_CANONICAL:
+    PATTERN_BY_SUFFIX.setdefault(_pattern, _name_template)
+del _pattern, _name_template
+
+
+@lru_cache(maxsize=int(os.getenv("CANONICAL_NAME_CACHE_SIZE", "8192"))) # distinct paths memoized
+def canonical_name(full_path: str) -> str | None:
+    """
+    Canonical name of a full prefixed path ("Patient-name[0].family", "PID-5.1"), or None.
+
+    Layer 1 — exact match in CANONICAL_BY_PATH.
+    Layer 2 — suffix pattern match in PATTERN_BY_SUFFIX (FHIR only).
+    """
+    name = CANONICAL_BY_PATH.get(full_path)
+    if name is not None:
+        return name
+    if "-" in full_path:
+        resource_type, suffix = full_path.split("-", 1)
+        name_template = PATTERN_BY_SUFFIX.get(suffix)
+        if name_template is not None:
+            return name_template.replace("{resource}", resource_type.lower())
+    return None
+
+
+def canonical_names(paths) -> tuple[dict[str, str], list[str]]:
+    """
+    canonical_name over a whole path list, each distinct path once.
+
+    Returns (path → canonical name for the mapped paths, the unmapped paths), both in
+    first-seen order.
+    """
+    names, unmapped = {}, []
+    for path in dict.fromkeys(paths):
+        name = canonical_name(path)
+        if name is None:
+            unmapped.append(path)
+        else:
+            names[path] = name
+    return names, unmapped
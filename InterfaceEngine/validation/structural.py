@@ -0,0 +1,507 @@
+"""
+Validation tiers for incoming messages, and the compiled validators of the `structural` tier.
+
+Each endpoint picks a tier (Endpoints.validation):
+
+- "none": messages are not validated (the default);
+- "structural": the checks below, against validators compiled once per FHIR type or HL7
+  message structure and reused for every message — microseconds per message;
+- "full": the fhir.resources model of every resource is built (validate_unknown_fhir_resource),
+  or the HL7 message parsed by hl7apy in strict mode (validate_hl7_message) — milliseconds.
+
+FHIR, from the R4B definitions in fhir.resources: unknown elements, required elements (1..1
+elements and required primitives, which may come as just their `_element` extension), arrays
+vs single values, choice elements (value[x]: at most one, exactly one when required), required
+code bindings, and the format of each primitive (the R4B regexes for date, dateTime, instant,
+time, code, id, oid, uuid, base64Binary; types and ranges for boolean, integer, positiveInt,
+unsignedInt and decimal, which may also be written as text). Complex types, contained resources and Bundle entries are
+checked recursively; the `resourceType` of each resource must be a known one.
+
+HL7 v2, from hl7apy's definitions of the message's version (MSH-12, 2.5 when absent): the
+segments of the message structure (MSH-9.3, or code_event from MSH-9) in order, with their
+groups and cardinality; required fields; repetitions of non-repeating fields; and the format
+of NM, SI, DT, TM, DTM and TS values, in fields, components and subcomponents. Z-segments
+are allowed anywhere. A structure hl7apy does not define is checked segment by segment.
+
+Neither checks invariants, terminology, references or value lengths; the full tier does some
+of that.
+"""
+from functools import lru_cache
+import re
+import types
+import typing
+
+from fhir.resources.R4B import get_fhir_model_class
+import hl7apy
+
+from validation import fhir_stream
+from validation.fhir_validation import validate_unknown_fhir_resource
+from validation.hl7_validation import validate_hl7_message
+
+TIERS = ("none", "structural", "full")
+_MAX_ERRORS_REPORTED = 10
+
+
+def validation_errors(tier: str, protocol: str, message) -> list[str]:
+    """
+    Why `message` fails the `tier` of validation; empty when it passes (or for "none").
+    `message` is a FHIR resource dict, a fhir_stream.StreamedBundle whose entries were checked
+    as they were read (see entry_validator), or an HL7 message string.
+    """
+    if tier == "none":
+        return []
+    if protocol == "FHIR":
+        if isinstance(message, fhir_stream.StreamedBundle):
+            return message.validation_errors + _fhir_errors(tier, message.head)
+        return _fhir_errors(tier, message)
+    if not isinstance(message, str):
+        return ["HL7 message must be a string"]
+    if tier == "structural":
+        return hl7_structure_errors(message)
+    is_valid, reason = validate_hl7_message(message)
+    return [] if is_valid else [reason]
+
+
+def describe(errors: list[str]) -> str:
+    """The errors as one line, for an HTTP error detail or an MLLP ACK."""
+    more = len(errors) - _MAX_ERRORS_REPORTED
+    return "; ".join(errors[:_MAX_ERRORS_REPORTED]) + (f"; and {more} more" if more > 0 else "")
+
+
+def _fhir_errors(tier: str, resource) -> list[str]:
+    if not isinstance(resource, dict):
+        return ["FHIR payload must be a JSON object"]
+    if tier == "structural":
+        return fhir_structure_errors(resource)
+    is_valid, reason = validate_unknown_fhir_resource(resource)
+    return [] if is_valid else [reason]
+
+
+def entry_validator(tier: str):
+    """
+    For fhir_stream.read_bundle: a function checking one Bundle `entry[]` element against
+    `tier` (entry, path) -> errors, or None for "none". The "full" one builds fhir.resources
+    models, so it is passed with validate_in_thread.
+    """
+    if tier == "structural":
+        entry_spec = _fhir_spec(get_fhir_model_class("BundleEntry"))
+        def validate_entry(entry, path):
+            errors = []
+            _check_object(entry, entry_spec, path, errors)
+            return errors
+        return validate_entry
+    if tier == "full":
+        entry_model = get_fhir_model_class("BundleEntry")
+        def validate_entry(entry, path):
+            try:
+                entry_model(**entry)
+            except Exception as exp:
+                return [f"{path}: {exp}"]
+            return []
+        return validate_entry
+    return None
+
+
+# ─── FHIR ───
+
+_FHIR_YEAR = r"([0-9]([0-9]([0-9][1-9]|[1-9]0)|[1-9]00)|[1-9]000)"
+_FHIR_TIME = r"([01][0-9]|2[0-3]):[0-5][0-9]:([0-5][0-9]|60)(\.[0-9]+)?"
+_FHIR_ZONE = r"(Z|(\+|-)((0[0-9]|1[0-3]):[0-5][0-9]|14:00))"
+_FHIR_FORMATS = { # the R4B regexes, https://hl7.org/fhir/R4B/datatypes.html
+    "string": r"[ \r\n\t\S]+",
+    "code": r"[^\s]+(\s[^\s]+)*",
+    "id": r"[A-Za-z0-9\-\.]{1,64}",
+    "oid": r"urn:oid:[0-2](\.(0|[1-9][0-9]*))+",
+    "uuid": r"urn:uuid:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}",
+    "uri": r"\S*",
+    "url": r"\S*",
+    "canonical": r"\S*",
+    "base64Binary": r"(\s*([0-9a-zA-Z\+\=]){4}\s*)+",
+    "date": _FHIR_YEAR + r"(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1]))?)?",
+    "dateTime": _FHIR_YEAR + r"(-(0[1-9]|1[0-2])(-(0[1-9]|[1-2][0-9]|3[0-1])(T" + _FHIR_TIME + _FHIR_ZONE + r")?)?)?",
+    "instant": _FHIR_YEAR + r"-(0[1-9]|1[0-2])-(0[1-9]|[1-2][0-9]|3[0-1])T" + _FHIR_TIME + _FHIR_ZONE,
+    "time": _FHIR_TIME,
+}
+_FHIR_INTEGER = re.compile(r"[0]|[-+]?[1-9][0-9]*").fullmatch
+_FHIR_DECIMAL = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?").fullmatch
+_FHIR_INTEGER_RANGES = {"integer": (-2**31, 2**31 - 1), "positiveInt": (1, 2**31 - 1), "unsignedInt": (0, 2**31 - 1)}
+
+_RESOURCE_BASE = get_fhir_model_class("Resource")
+# element kinds
+_PRIMITIVE, _COMPLEX, _RESOURCE, _ANY = range(4)
+
+
+class _Element(typing.NamedTuple):
+    kind: int
+    is_list: bool
+    target: typing.Any # _PRIMITIVE: check(value) -> error | None; _COMPLEX: the model class
+    enum: frozenset | None # the codes of a required binding
+    choice: str | None # the choice group (value[x] -> "value")
+
+
+class _TypeSpec(typing.NamedTuple):
+    elements: dict # JSON name -> _Element
+    required: tuple # (name, "_name" or None): present when either is
+    choices: dict # choice group -> whether one of its elements is required
+    resource_type: str | None
+
+
+def _primitive_check(name: str):
+    # Numbers and booleans may also come as their text ("0.1", "true"), as fhir.resources
+    # accepts them and as mapped values are written.
+    if name == "boolean":
+        return lambda value: None if value is True or value is False or value in ("true", "false") else "must be a boolean"
+    if name in _FHIR_INTEGER_RANGES:
+        low, high = _FHIR_INTEGER_RANGES[name]
+        def check(value):
+            if isinstance(value, str) and _FHIR_INTEGER(value):
+                value = int(value)
+            if not isinstance(value, int) or isinstance(value, bool):
+                return f"must be an {name}" if name == "integer" else f"must be a {name}"
+            return None if low <= value <= high else f"{value} is out of range for {name}"
+        return check
+    if name == "decimal":
+        def check(value):
+            if isinstance(value, str):
+                return None if _FHIR_DECIMAL(value) else f"{value!r} is not a valid decimal"
+            return "must be a number" if not isinstance(value, (int, float)) or isinstance(value, bool) else None
+        return check
+    pattern = re.compile(_FHIR_FORMATS[name]).fullmatch if name in _FHIR_FORMATS else None
+    def check(value):
+        if not isinstance(value, str):
+            return "must be a string"
+        if pattern is not None and pattern(value) is None:
+            return f"{value!r} is not a valid {name}"
+        return None
+    return check
+
+
+_PRIMITIVE_CHECKS = {}
+
+
+def _primitive(annotation):
+    """The check of a primitive element's annotation, or None when it is not a primitive."""
+    if annotation is bool:
+        name = "boolean"
+    else:
+        names = [getattr(meta, "__visit_name__", None) for meta in getattr(annotation, "__metadata__", ())]
+        name = next((name for name in names if name), None)
+        if name is None:
+            return None
+    if name not in _PRIMITIVE_CHECKS:
+        _PRIMITIVE_CHECKS[name] = _primitive_check(name)
+    return _PRIMITIVE_CHECKS[name]
+
+
+def _element(field) -> _Element:
+    annotation, is_list = field.annotation, False
+    while True: # unwrap Optional[...] and List[...]
+        origin = typing.get_origin(annotation)
+        if origin is list:
+            is_list = True
+        elif origin not in (typing.Union, types.UnionType):
+            break
+        annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+    extra = field.json_schema_extra or {}
+    enum = extra.get("enum_values")
+    enum = frozenset(enum) if enum and "+" not in enum else None
+    choice = extra.get("one_of_many")
+
+    check = _primitive(annotation)
+    if check is not None:
+        return _Element(_PRIMITIVE, is_list, check, enum, choice)
+    model = annotation.get_model_klass() if hasattr(annotation, "get_model_klass") else None
+    if model is None:
+        return _Element(_ANY, is_list, None, None, choice)
+    if model.__name__ in ("Resource", "DomainResource"):
+        return _Element(_RESOURCE, is_list, None, None, choice)
+    return _Element(_COMPLEX, is_list, model, None, choice)
+
+
+@lru_cache(maxsize=None)
+def _fhir_spec(model) -> _TypeSpec:
+    """The compiled validator of a fhir.resources model class (a resource, a type or a backbone element)."""
+    elements, required, choices = {}, [], {}
+    for name, field in model.model_fields.items():
+        if name == "fhir_comments":
+            continue
+        element = elements[field.alias] = _element(field)
+        extra = field.json_schema_extra or {}
+        if element.choice:
+            choices[element.choice] = choices.get(element.choice, False) or bool(extra.get("one_of_many_required"))
+        elif field.is_required() or extra.get("element_required"):
+            ext = f"_{field.alias}" if f"{name}__ext" in model.model_fields else None
+            required.append((field.alias, ext))
+    resource_type = model.get_resource_type() if issubclass(model, _RESOURCE_BASE) else None
+    return _TypeSpec(elements, tuple(required), choices, resource_type)
+
+
+def _resource_spec(resource, path: str, errors: list) -> _TypeSpec | None:
+    if not isinstance(resource, dict):
+        errors.append(f"{path}: must be a JSON object")
+        return None
+    resource_type = resource.get("resourceType")
+    if not isinstance(resource_type, str) or not resource_type:
+        errors.append(f"{path}: resourceType is missing")
+        return None
+    try:
+        model = get_fhir_model_class(resource_type)
+    except KeyError:
+        errors.append(f"{path}: '{resource_type}' is not a FHIR resource")
+        return None
+    if not issubclass(model, _RESOURCE_BASE): # a data type, e.g. "CodeableConcept"
+        errors.append(f"{path}: '{resource_type}' is not a FHIR resource")
+        return None
+    return _fhir_spec(model)
+
+
+def _check_value(element: _Element, value, path: str, key: str, index, errors: list) -> None:
+    """Check one value of `element` (item `index` when it repeats); its path is only built when needed."""
+    kind, _, target, enum, _ = element
+    if kind == _PRIMITIVE:
+        error = target(value)
+        if error is None and enum is not None and value not in enum:
+            error = f"{value!r} is not one of {sorted(enum)}"
+        if error is not None:
+            errors.append(f"{path}.{key}{'' if index is None else f'[{index}]'}: {error}")
+    elif kind == _COMPLEX:
+        where = f"{path}.{key}" if index is None else f"{path}.{key}[{index}]"
+        if isinstance(value, dict):
+            _check_object(value, _fhir_spec(target), where, errors)
+        else:
+            errors.append(f"{where}: must be a JSON object")
+    elif kind == _RESOURCE:
+        where = f"{path}.{key}" if index is None else f"{path}.{key}[{index}]"
+        spec = _resource_spec(value, where, errors)
+        if spec is not None:
+            _check_object(value, spec, where, errors)
+
+
+def _check_object(data: dict, spec: _TypeSpec, path: str, errors: list) -> None:
+    elements, required, choices, resource_type = spec
+    chosen = None
+    for key, value in data.items():
+        element = elements.get(key)
+        if element is None:
+            if key == "resourceType" and resource_type is not None:
+                if value != resource_type:
+                    errors.append(f"{path}.resourceType: must be {resource_type!r}")
+            else:
+                errors.append(f"{path}.{key}: unknown element")
+            continue
+        if value is None:
+            continue
+        choice = element.choice
+        if choice is not None:
+            chosen = chosen or {}
+            if choice in chosen:
+                errors.append(f"{path}.{key}: only one of {choice}[x] is allowed, found {chosen[choice]} too")
+            chosen.setdefault(choice, key)
+        if element.is_list:
+            if not isinstance(value, list):
+                errors.append(f"{path}.{key}: must be an array")
+                continue
+            for n, item in enumerate(value):
+                if item is not None: # a repeating primitive may have only its extension, and vice versa
+                    _check_value(element, item, path, key, n, errors)
+        elif isinstance(value, list):
+            errors.append(f"{path}.{key}: must not be an array")
+        else:
+            _check_value(element, value, path, key, None, errors)
+
+    for name, ext in required:
+        if data.get(name) is None and (ext is None or data.get(ext) is None):
+            errors.append(f"{path}.{name}: required element is missing")
+    if choices:
+        for choice, choice_required in choices.items():
+            if choice_required and (chosen is None or choice not in chosen):
+                errors.append(f"{path}.{choice}[x]: required element is missing")
+
+
+def fhir_structure_errors(resource) -> list[str]:
+    """The structural errors of a FHIR resource (a Bundle's entries included), e.g. "Observation.status: required element is missing"."""
+    errors = []
+    resource_type = resource.get("resourceType") if isinstance(resource, dict) else None
+    spec = _resource_spec(resource, resource_type or "resource", errors)
+    if spec is not None:
+        _check_object(resource, spec, resource_type, errors)
+    return errors
+
+
+# ─── HL7 v2 ───
+
+_HL7_DEFAULT_VERSION = "2.5"
+_HL7_DTM = r"\d{4}((0[1-9]|1[0-2])((0[1-9]|[12]\d|3[01])(([01]\d|2[0-3])([0-5]\d([0-5]\d(\.\d{1,4})?)?)?)?)?)?([+-]\d{4})?"
+_HL7_FORMATS = {
+    "NM": r"[+-]?(\d+(\.\d*)?|\.\d+)",
+    "SI": r"\d+",
+    "DT": r"\d{4}((0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])?)?",
+    "TM": r"([01]\d|2[0-3])([0-5]\d([0-5]\d(\.\d{1,4})?)?)?([+-]\d{4})?",
+    "DTM": _HL7_DTM,
+    "TS": _HL7_DTM, # a primitive before 2.5
+}
+_HL7_FORMATS = {name: re.compile(pattern).fullmatch for name, pattern in _HL7_FORMATS.items()}
+
+
+class _FieldSpec(typing.NamedTuple):
+    number: int
+    repeats: bool
+    checks: tuple # (component, subcomponent, datatype): 0 = the whole field / component
+    has_components: bool # whether a check is of a component
+
+
+class _SegmentSpec(typing.NamedTuple):
+    fields: tuple # _FieldSpec by field number (fields[0] is None)
+    required: tuple # the numbers of the required fields
+    field_count: int
+
+
+def _datatype_checks(structure, component: int = 0) -> list:
+    """(component, subcomponent, datatype) of the checkable primitives in a field's structure."""
+    if structure[0] == "leaf":
+        return [(0, 0, structure[2])] if structure[2] in _HL7_FORMATS else []
+    checks = []
+    for name, child, _, _ in structure[1]:
+        number = int(name.rsplit("_", 1)[1])
+        if component: # a subcomponent; HL7 goes no deeper
+            if child[0] == "leaf" and child[2] in _HL7_FORMATS:
+                checks.append((component, number, child[2]))
+        else:
+            checks.extend((number, sub, datatype) for _, sub, datatype in _datatype_checks(child, number))
+    return checks
+
+
+@lru_cache(maxsize=None)
+def _segment_spec(version: str, segment: str) -> _SegmentSpec | None:
+    library = hl7apy.load_library(version)
+    try:
+        structure = library.SEGMENTS[segment]
+    except KeyError:
+        return None
+    fields, required = {}, []
+    for name, field, (min_count, max_count), _ in structure[1]:
+        number = int(name.rsplit("_", 1)[1])
+        checks = tuple(_datatype_checks(field))
+        fields[number] = _FieldSpec(number, max_count != 1, checks, any(component for component, _, _ in checks))
+        if min_count > 0:
+            required.append(number)
+    field_count = max(fields, default=0)
+    return _SegmentSpec(tuple(fields.get(number) for number in range(field_count + 1)), tuple(required), field_count)
+
+
+@lru_cache(maxsize=None)
+def _message_spec(version: str, structure: str):
+    """The message structure as nested (name, min, max, children or None for a segment, is_choice)."""
+    library = hl7apy.load_library(version)
+    def compile_group(group):
+        kind, children = group[0], group[1]
+        compiled = tuple(
+            (name, min_count, max_count, compile_group(child) if child_kind == "GRP" else None)
+            for name, child, (min_count, max_count), child_kind in children
+        )
+        return compiled, kind == "choice"
+    return compile_group(library.MESSAGES[structure]) if structure in library.MESSAGES else None
+
+
+def _match(group, segments: list, i: int, errors: list, where: str) -> int:
+    """Match `segments[i:]` against `group` greedily; the position after what it matched."""
+    children, is_choice = group
+    for name, min_count, max_count, sub_group in children:
+        count = 0
+        while max_count == -1 or count < max_count:
+            if sub_group is None:
+                if i < len(segments) and segments[i][0] == name:
+                    i, count = i + 1, count + 1
+                    continue
+                break
+            group_errors = []
+            end = _match(sub_group, segments, i, group_errors, name)
+            if end == i:
+                break
+            errors.extend(group_errors)
+            i, count = end, count + 1
+        if is_choice and count:
+            return i
+        if count < min_count and not is_choice:
+            missing = f"segment {name}" if sub_group is None else f"group {name}"
+            errors.append(f"{where}: required {missing} is missing" + (f" (before segment {i + 1})" if i < len(segments) else ""))
+    return i
+
+
+def _check_segment(fields: list, spec: _SegmentSpec, is_msh: bool, separators: str, label: str, errors: list) -> None:
+    component_sep, repetition_sep, _, subcomponent_sep = separators
+    # MSH-1 is the field separator itself, so MSH-n is fields[n - 1]; MSH-1 and MSH-2 are not checked.
+    offset, first = (1, 3) if is_msh else (0, 1)
+    field_count = len(fields) - 1 + offset
+    if field_count > spec.field_count:
+        errors.append(f"{label}: has {field_count} fields, {spec.field_count} are defined")
+    for number in spec.required:
+        if number >= first and (number - offset >= len(fields) or not fields[number - offset]):
+            errors.append(f"{label}-{number}: required field is missing")
+
+    for index in range(first - offset, min(len(fields), spec.field_count + 1 - offset)):
+        value = fields[index]
+        field = spec.fields[index + offset]
+        if not value or value == '""' or field is None: # empty, or an explicit null
+            continue
+        if repetition_sep in value:
+            if not field.repeats:
+                errors.append(f"{label}-{field.number}: does not repeat")
+            repetitions = value.split(repetition_sep)
+        else:
+            repetitions = (value,)
+        if not field.checks:
+            continue
+        for repetition in repetitions:
+            components = repetition.split(component_sep) if field.has_components else None
+            for component, subcomponent, datatype in field.checks:
+                if component:
+                    text = components[component - 1] if component <= len(components) else ""
+                    if subcomponent:
+                        parts = text.split(subcomponent_sep)
+                        text = parts[subcomponent - 1] if subcomponent <= len(parts) else ""
+                else: # a primitive field; when it has components anyway, the first
+                    text = repetition.split(component_sep, 1)[0]
+                if text and text != '""' and _HL7_FORMATS[datatype](text) is None:
+                    position = f"{field.number}" + (f".{component}" if component else "") + (f".{subcomponent}" if subcomponent else "")
+                    errors.append(f"{label}-{position}: {text!r} is not a valid {datatype}")
+
+
+def hl7_structure_errors(message: str) -> list[str]:
+    """The structural errors of an HL7 v2 message (segments separated by CR, LF or CRLF), e.g. "PID-3: required field is missing"."""
+    lines = [line for line in message.replace("\r\n", "\n").replace("\r", "\n").split("\n") if line.strip()]
+    if not lines or not lines[0].startswith("MSH") or len(lines[0]) < 8:
+        return ["message must start with an MSH segment"]
+    field_sep = lines[0][3]
+    separators = lines[0][4:8] # component, repetition, escape, subcomponent
+    msh = lines[0].split(field_sep)
+    version = msh[11].split(separators[0], 1)[0] if len(msh) > 11 and msh[11] else _HL7_DEFAULT_VERSION
+    if version not in hl7apy.SUPPORTED_LIBRARIES:
+        return [f"MSH-12: HL7 version {version!r} is not supported"]
+
+    errors, segments, counts = [], [], {}
+    for line in lines:
+        fields = line.split(field_sep)
+        name = fields[0]
+        counts[name] = counts.get(name, 0) + 1
+        label = name if counts[name] == 1 else f"{name}[{counts[name]}]"
+        if name.startswith("Z"): # site-defined; no definition to check against
+            continue
+        segments.append((name, label))
+        spec = _segment_spec(version, name)
+        if spec is None:
+            errors.append(f"{label}: unknown segment")
+            continue
+        _check_segment(fields, spec, name == "MSH", separators, label, errors)
+
+    message_type = msh[8].split(separators[0]) if len(msh) > 8 else []
+    if len(message_type) < 2 or not message_type[0]:
+        errors.append("MSH-9: message type is missing")
+        return errors
+    structure = message_type[2] if len(message_type) > 2 and message_type[2] else f"{message_type[0]}_{message_type[1]}"
+    group = _message_spec(version, structure) or _message_spec(version, message_type[0])
+    if group is not None:
+        end = _match(group, segments, 0, errors, structure)
+        if end < len(segments):
+            errors.append(f"{segments[end][1]}: unexpected segment for {structure}")
+    return errors
@@ -16,9 +16,16 @@ Here we generate suggestions (transform_type + config) based on the following fl
         If the field types don't match then it will return the appropriate transform type and config based on the field type.
     
     3. if the type is not mention, then by default it will be string, means it will be just the copy, with no transformation needed.
+
+4. generate_bulk_suggestions
+    1. we give the src and dest servers and all the fields of a src and a dest endpoint.
+    2. every dest field whose canonical name is also a src field's name gets a one-to-one rule, with the
+        transform and config of get_suggestion (once per name), in the rules format of /add-route.
+    3. field types come from FIELD_TYPE_BY_NAME, computed once for the names of the mapping tables.
 """
 
 from api.endpoint import logger
+from validation.mappings import CANONICAL_BY_PATH
 
 def generate_single_suggestion(
     src_server: dict,
@@ -73,6 +80,47 @@ def generate_single_suggestion(
         return previous_suggestion if previous_suggestion else {"transform": "copy", "config": {}}
 
 
+def generate_bulk_suggestions(src_server, dest_server, src_fields: list, dest_fields: list) -> dict:
+    """
+        Returns the suggested rules for a whole src->dest endpoint pair, matching fields by canonical name.
+        Each dest field gets one rule from the first src field with its name (by field id).
+    """
+    src_profile = src_server.profile if src_server.profile else {}
+    dest_profile = dest_server.profile if dest_server.profile else {}
+
+    src_by_name = {}
+    for field in sorted(src_fields, key=lambda field: field.endpoint_field_id):
+        src_by_name.setdefault(field.name, field)
+
+    mappings, unmatched_dest, matched_src = [], [], set()
+    suggestions = {} # canonical name -> suggestion
+    for field in sorted(dest_fields, key=lambda field: field.endpoint_field_id):
+        src_field = src_by_name.get(field.name)
+        if src_field is None:
+            unmatched_dest.append(field.endpoint_field_id)
+            continue
+        suggestion = suggestions.get(field.name)
+        if suggestion is None: # same name, so same type on both sides
+            field_type = get_field_type(field.name)
+            suggestion = get_suggestion(src_profile, dest_profile, field_type, field_type, field.name, field.name)
+            suggestion = suggestions[field.name] = suggestion or {"transform": "copy", "config": {}}
+        matched_src.add(src_field.endpoint_field_id)
+        mappings.append({
+            "src_paths": [src_field.endpoint_field_id],
+            "dest_paths": [field.endpoint_field_id],
+            "name": field.name,
+            "transform": suggestion["transform"],
+            "config": suggestion["config"],
+        })
+
+    logger.info(f"Bulk suggestion: {len(mappings)} rules, {len(unmatched_dest)} dest fields unmatched")
+    return {
+        "mappings": mappings,
+        "unmatched_src_field_ids": sorted(field.endpoint_field_id for field in src_fields if field.endpoint_field_id not in matched_src),
+        "unmatched_dest_field_ids": unmatched_dest,
+    }
+
+
 def get_suggestion(src_profile: dict, dest_profile: dict, src_field_type: str, dest_field_type: str, src_canonical_name: str, dest_canonical_name: str) -> dict:
 
     if (src_field_type == dest_field_type) and (src_field_type != "string"):
@@ -204,222 +252,241 @@ def get_suggestion(src_profile: dict, dest_profile: dict, src_field_type: str, d
         return {"transform": "copy", "config": {}}
 
 
+# ── Explicit overrides for ambiguous names ────────────────────────────────
+EXPLICIT_FIELD_TYPES = {
+    # regex (Here we say that different names can have the regex pattern type, so we will take the pattern from the profile based on the canonical name)
+    "NIC":                                "id_format",
+    "VID":                                "id_format",
+    "practitioner_id":                    "id_format",
+    "claim_patient_ref":                  "subject_reference_format",
+    "claim_response_patient_ref":         "subject_reference_format",
+    "coverage_patient_ref":               "subject_reference_format",
+    "invoice_patient_ref":                "subject_reference_format",
+    "encounter_patient_ref":              "subject_reference_format",
+    "lab_order_patient_ref":              "subject_reference_format",
+    "charge_item_patient_ref":            "subject_reference_format",
+
+    "practitioner_role_practitioner_ref": "practitioner_reference_format",
+    "invoice_participant_ref_id":         "practitioner_reference_format",
+
+    "claim_response_encounter_ref":          "encounter_reference_format",
+    "charge_item_encounter_ref":             "encounter_reference_format",
+    "claim_encounter_ref":                   "encounter_reference_format",
+
+    # "":  "encounter_reference_format",
+
+    # dates
+    "date":                  "date",
+    "birth_date":                  "date",
+    "deceased_date":               "date",
+    "vaccine_expiry":              "date",
+    "allergy_onset":               "date",
+    "reaction_onset":              "date",
+    "condition_onset":             "date",
+    "condition_onset_start":       "date",
+    "condition_end":               "date",
+    "condition_recorded":          "date",
+    "allergy_recorded":            "date",
+    "allergy_last_occurrence":     "date",
+    "immunization_date":           "date",
+    "immunization_recorded":       "date",
+    "rx_authored":                 "date",
+    "claim_service_date":          "date",
+    "eob_service_date":            "date",
+    "eob_payment_date":            "date",
+    "practitioner_birth_date":     "date",
+    "practitioner_qualification_start": "date",
+    "practitioner_qualification_end":   "date",
+    "coverage_start":              "date",
+    "coverage_end":                "date",
+    "coverage_start_date":         "date",
+    "coverage_end_date":           "date",
+    "plan_effective_date":         "date",
+    "plan_expiration_date":        "date",
+
+    # datetimes
+    "datetime":                    "datetime",
+    "message_datetime":            "datetime",
+    "admit_datetime":              "datetime",
+    "discharge_datetime":          "datetime",
+    "observation_date":            "datetime",
+    "observation_start":           "datetime",
+    "observation_end":             "datetime",
+    "observation_issued":          "datetime",
+    "report_date":                 "datetime",
+    "report_issued":               "datetime",
+    "report_period_start":         "datetime",
+    "report_period_end":           "datetime",
+    "claim_created":               "datetime",
+    "eob_created":                 "datetime",
+    "order_date":                  "datetime",
+    "order_authored":              "datetime",
+    "last_update_datetime":        "datetime",
+    "requested_datetime":          "datetime",
+    "observation_start_datetime":  "datetime",
+    "observation_end_datetime":    "datetime",
+    "specimen_received_datetime":  "datetime",
+    "report_status_datetime":      "datetime",
+    "scheduled_datetime":          "datetime",
+    "observation_datetime":        "datetime",
+    "analysis_datetime":           "datetime",
+    "transaction_datetime":        "datetime",
+    "diagnosis_datetime":          "datetime",
+    "rx_fill_datetime":            "datetime",
+
+    # booleans
+    "deceased":                    "boolean",
+    "multiple_birth":              "boolean",
+    "patient_active":              "boolean",
+    "practitioner_active":         "boolean",
+    "org_active":                  "boolean",
+    "rx_substitution":             "boolean",
+    "vaccine_subpotent":           "boolean",
+    "immunization_primary_source": "boolean",
+    "order_do_not_perform":        "boolean",
+    "coverage_subrogation":        "boolean",
+    "claim_insurance_focal":       "boolean",
+
+    # gender codes
+    "gender":                      "gender_code",
+    "practitioner_gender":         "gender_code",
+    "subscriber_gender":           "gender_code",
+    "guarantor_gender":            "gender_code",
+    "nok_sex":                     "gender_code",
+
+    # status codes
+    "encounter_status":            "status_code",
+    "coverage_status":             "status_code",
+    "claim_status":                "status_code",
+    "observation_status":          "status_code",
+    "report_status":               "status_code",
+    "order_status":                "status_code",
+    "rx_status":                   "status_code",
+    "allergy_status":              "status_code",
+    "immunization_status":         "status_code",
+    "procedure_status":            "status_code",
+    "condition_status":            "status_code",
+    "eob_status":                  "status_code",
+    "observation_result_status":   "status_code",
+    "result_status":               "status_code",
+
+    # marital
+    "marital_status":              "marital_code",
+
+    # name
+    "fullname":                    "name_full",
+    "practitioner_fullname":       "name_full",
+    "nok_fullname":                "name_full",
+    "guarantor_fullname":          "name_full",
+    "family_name":                 "name_part",
+    "given_name":                  "name_part",
+    "practitioner_family_name":    "name_part",
+    "practitioner_given_name":     "name_part",
+    "nok_family_name":             "name_part",
+    "nok_given_name":              "name_part",
+    "guarantor_family_name":       "name_part",
+    "guarantor_given_name":        "name_part",
+
+    # address
+    "address":                     "address_full",
+    "practitioner_address":        "address_full",
+    "org_address":                 "address_full",
+    "nok_address":                 "address_full",
+    "guarantor_address":           "address_full",
+    "address_line":                "address_part",
+    "city":                        "address_part",
+    "state":                       "address_part",
+    "postal_code":                 "address_part",
+    "country":                     "address_part",
+
+    # phone
+    "phone":                       "phone",
+    "org_phone":                   "phone",
+    "practitioner_phone":          "phone",
+    "nok_phone":                   "phone",
+    "guarantor_phone":             "phone",
+    "business_phone":              "phone",
+    "insurance_phone":             "phone",
+
+    # quantity
+    "result_value":                "quantity",
+    "ref_range_low":               "quantity",
+    "ref_range_high":              "quantity",
+    "vaccine_dose_value":          "quantity",
+    "rx_dose_value":               "quantity",
+    "rx_max_dose":                 "quantity",
+    "rx_quantity":                 "quantity",
+    "claim_total":                 "quantity",
+    "claim_unit_price":            "quantity",
+    "claim_net":                   "quantity",
+    "cost_amount":                 "quantity",
+    "eob_total_amount":            "quantity",
+    "eob_payment_amount":          "quantity",
+    "eob_adjudication_amount":     "quantity",
+    "component_value":             "quantity",
+}
+
+
+# ── Suffix-based fallback — covers all remaining fields ───────────────────
+# Checked in order, first match wins
+_SUFFIX_FIELD_TYPES = (
+    ("_datetime", "datetime"),
+    ("_issued", "datetime"),
+
+    ("_date", "date"),
+    ("_start", "date"),
+    ("_end", "date"),
+    ("_dob", "date"),
+    ("_expiry", "date"),
+    ("_recorded", "date"),
+
+    ("_active", "boolean"),
+    ("_focal", "boolean"),
+
+    ("_status", "status_code"),
+
+    ("_amount", "quantity"),
+    ("_value", "quantity"),
+    ("_price", "quantity"),
+    ("_total", "quantity"),
+    ("_cost", "quantity"),
+    ("_quantity", "quantity"),
+
+    ("_phone", "phone"),
+
+    ("_fullname", "name_full"),
+    ("_family_name", "name_part"),
+    ("_given_name", "name_part"),
+
+    ("_address", "address_full"),
+)
+
+
+def _derive_field_type(canonical_name: str) -> str:
+    if canonical_name in EXPLICIT_FIELD_TYPES:
+        return EXPLICIT_FIELD_TYPES[canonical_name]
+    for suffix, field_type in _SUFFIX_FIELD_TYPES:
+        if canonical_name.endswith(suffix):
+            return field_type
+    # everything else — plain string, just copy
+    return "string"
+
+
+# Type of every canonical name the exact mapping tables can give a field, computed once at import.
+# Names from the {resource} suffix patterns are derived on first use and added.
+FIELD_TYPE_BY_NAME = {name: _derive_field_type(name) for name in {*CANONICAL_BY_PATH.values(), *EXPLICIT_FIELD_TYPES}}
+
+
 def get_field_type(canonical_name: str) -> str:
     """
     Derive field type from canonical name suffix.
     Checked in order — first match wins.
     if no suffix matches, defaults to "string" -> means no transformation needed, just copy the value as is.
-    """
 
-    # ── Explicit overrides for ambiguous names ────────────────────────────────
-    EXPLICIT = {
-        # regex (Here we say that different names can have the regex pattern type, so we will take the pattern from the profile based on the canonical name)
-        "NIC":                                "id_format",
-        "VID":                                "id_format",
-        "practitioner_id":                    "id_format",
-        "claim_patient_ref":                  "subject_reference_format",
-        "claim_response_patient_ref":         "subject_reference_format",
-        "coverage_patient_ref":               "subject_reference_format",
-        "invoice_patient_ref":                "subject_reference_format",
-        "encounter_patient_ref":              "subject_reference_format",
-        "lab_order_patient_ref":              "subject_reference_format",
-        "charge_item_patient_ref":            "subject_reference_format",
-
-        "practitioner_role_practitioner_ref": "practitioner_reference_format",
-        "invoice_participant_ref_id":         "practitioner_reference_format",
-
-        "claim_response_encounter_ref":          "encounter_reference_format",
-        "charge_item_encounter_ref":             "encounter_reference_format",
-        "claim_encounter_ref":                   "encounter_reference_format",
-
-        # "":  "encounter_reference_format",
-
-        # dates
-        "date":                  "date",
-        "birth_date":                  "date",
-        "deceased_date":               "date",
-        "vaccine_expiry":              "date",
-        "allergy_onset":               "date",
-        "reaction_onset":              "date",
-        "condition_onset":             "date",
-        "condition_onset_start":       "date",
-        "condition_end":               "date",
-        "condition_recorded":          "date",
-        "allergy_recorded":            "date",
-        "allergy_last_occurrence":     "date",
-        "immunization_date":           "date",
-        "immunization_recorded":       "date",
-        "rx_authored":                 "date",
-        "claim_service_date":          "date",
-        "eob_service_date":            "date",
-        "eob_payment_date":            "date",
-        "practitioner_birth_date":     "date",
-        "practitioner_qualification_start": "date",
-        "practitioner_qualification_end":   "date",
-        "coverage_start":              "date",
-        "coverage_end":                "date",
-        "coverage_start_date":         "date",
-        "coverage_end_date":           "date",
-        "plan_effective_date":         "date",
-        "plan_expiration_date":        "date",
-
-        # datetimes
-        "datetime":                    "datetime",
-        "message_datetime":            "datetime",
-        "admit_datetime":              "datetime",
-        "discharge_datetime":          "datetime",
-        "observation_date":            "datetime",
-        "observation_start":           "datetime",
-        "observation_end":             "datetime",
-        "observation_issued":          "datetime",
-        "report_date":                 "datetime",
-        "report_issued":               "datetime",
-        "report_period_start":         "datetime",
-        "report_period_end":           "datetime",
-        "claim_created":               "datetime",
-        "eob_created":                 "datetime",
-        "order_date":                  "datetime",
-        "order_authored":              "datetime",
-        "last_update_datetime":        "datetime",
-        "requested_datetime":          "datetime",
-        "observation_start_datetime":  "datetime",
-        "observation_end_datetime":    "datetime",
-        "specimen_received_datetime":  "datetime",
-        "report_status_datetime":      "datetime",
-        "scheduled_datetime":          "datetime",
-        "observation_datetime":        "datetime",
-        "analysis_datetime":           "datetime",
-        "transaction_datetime":        "datetime",
-        "diagnosis_datetime":          "datetime",
-        "rx_fill_datetime":            "datetime",
-
-        # booleans
-        "deceased":                    "boolean",
-        "multiple_birth":              "boolean",
-        "patient_active":              "boolean",
-        "practitioner_active":         "boolean",
-        "org_active":                  "boolean",
-        "rx_substitution":             "boolean",
-        "vaccine_subpotent":           "boolean",
-        "immunization_primary_source": "boolean",
-        "order_do_not_perform":        "boolean",
-        "coverage_subrogation":        "boolean",
-        "claim_insurance_focal":       "boolean",
-
-        # gender codes
-        "gender":                      "gender_code",
-        "practitioner_gender":         "gender_code",
-        "subscriber_gender":           "gender_code",
-        "guarantor_gender":            "gender_code",
-        "nok_sex":                     "gender_code",
-
-        # status codes
-        "encounter_status":            "status_code",
-        "coverage_status":             "status_code",
-        "claim_status":                "status_code",
-        "observation_status":          "status_code",
-        "report_status":               "status_code",
-        "order_status":                "status_code",
-        "rx_status":                   "status_code",
-        "allergy_status":              "status_code",
-        "immunization_status":         "status_code",
-        "procedure_status":            "status_code",
-        "condition_status":            "status_code",
-        "eob_status":                  "status_code",
-        "observation_result_status":   "status_code",
-        "result_status":               "status_code",
-
-        # marital
-        "marital_status":              "marital_code",
-
-        # name
-        "fullname":                    "name_full",
-        "practitioner_fullname":       "name_full",
-        "nok_fullname":                "name_full",
-        "guarantor_fullname":          "name_full",
-        "family_name":                 "name_part",
-        "given_name":                  "name_part",
-        "practitioner_family_name":    "name_part",
-        "practitioner_given_name":     "name_part",
-        "nok_family_name":             "name_part",
-        "nok_given_name":              "name_part",
-        "guarantor_family_name":       "name_part",
-        "guarantor_given_name":        "name_part",
-
-        # address
-        "address":                     "address_full",
-        "practitioner_address":        "address_full",
-        "org_address":                 "address_full",
-        "nok_address":                 "address_full",
-        "guarantor_address":           "address_full",
-        "address_line":                "address_part",
-        "city":                        "address_part",
-        "state":                       "address_part",
-        "postal_code":                 "address_part",
-        "country":                     "address_part",
-
-        # phone
-        "phone":                       "phone",
-        "org_phone":                   "phone",
-        "practitioner_phone":          "phone",
-        "nok_phone":                   "phone",
-        "guarantor_phone":             "phone",
-        "business_phone":              "phone",
-        "insurance_phone":             "phone",
-
-        # quantity
-        "result_value":                "quantity",
-        "ref_range_low":               "quantity",
-        "ref_range_high":              "quantity",
-        "vaccine_dose_value":          "quantity",
-        "rx_dose_value":               "quantity",
-        "rx_max_dose":                 "quantity",
-        "rx_quantity":                 "quantity",
-        "claim_total":                 "quantity",
-        "claim_unit_price":            "quantity",
-        "claim_net":                   "quantity",
-        "cost_amount":                 "quantity",
-        "eob_total_amount":            "quantity",
-        "eob_payment_amount":          "quantity",
-        "eob_adjudication_amount":     "quantity",
-        "component_value":             "quantity",
-    }
-
-    if canonical_name in EXPLICIT:
-        return EXPLICIT[canonical_name]
-
-    # ── Suffix-based fallback — covers all remaining fields ───────────────────
-    # Checked in order, first match wins
-
-    if canonical_name.endswith("_datetime"):    return "datetime"
-    if canonical_name.endswith("_issued"):      return "datetime"
-
-    if canonical_name.endswith("_date"):        return "date"
-    if canonical_name.endswith("_start"):       return "date"
-    if canonical_name.endswith("_end"):         return "date"
-    if canonical_name.endswith("_dob"):         return "date"
-    if canonical_name.endswith("_expiry"):      return "date"
-    if canonical_name.endswith("_recorded"):    return "date"
-
-    if canonical_name.endswith("_active"):      return "boolean"
-    if canonical_name.endswith("_focal"):       return "boolean"
-
-    if canonical_name.endswith("_status"):      return "status_code"
-
-    if canonical_name.endswith("_amount"):      return "quantity"
-    if canonical_name.endswith("_value"):       return "quantity"
-    if canonical_name.endswith("_price"):       return "quantity"
-    if canonical_name.endswith("_total"):       return "quantity"
-    if canonical_name.endswith("_cost"):        return "quantity"
-    if canonical_name.endswith("_quantity"):    return "quantity"
-
-    if canonical_name.endswith("_phone"):       return "phone"
-
-    if canonical_name.endswith("_fullname"):    return "name_full"
-    if canonical_name.endswith("_family_name"): return "name_part"
-    if canonical_name.endswith("_given_name"):  return "name_part"
-
-    if canonical_name.endswith("_address"):     return "address_full"
-
-    # everything else — plain string, just copy
-    return "string"
\ No newline at end of file
+    Explicit overrides for ambiguous names (EXPLICIT_FIELD_TYPES) come first, then the suffixes
+    (_SUFFIX_FIELD_TYPES); the result is looked up in FIELD_TYPE_BY_NAME.
+    """
+    field_type = FIELD_TYPE_BY_NAME.get(canonical_name)
+    if field_type is None:
+        field_type = FIELD_TYPE_BY_NAME[canonical_name] = _derive_field_type(canonical_name)
+    return field_type
@@ -0,0 +1,68 @@
+"""
+Code generation for MappingPlan layouts.
+
+A layout fixes which source path feeds which destination path, so the copy/map/regex/format
+assignments and concats of one message shape can be written out as a straight-line function:
+
+    def transform(row):
+        v0 = row['PID[1]-5.1']
+        v1 = row['PID[1]-8']
+        v1 = m1.get(str(v1).lower(), v1)
+        v2 = s2(r2, row['PID[1]-3'])
+        return {'Patient[1]-name[0].given': v0, 'Patient[1]-gender': v1, ...}
+
+No rule dispatch, no rule.config lookups, no increment_segment: map tables, compiled regexes and
+date rules are bound as constants. The source is compiled once per distinct text (so the
+workers of one route, and a restarted worker whose rules did not change, share the code
+object) and cached per layout. Splits stay with the interpreter, since where their parts go
+depends on the values.
+
+`compile_layout` returns None for layouts it does not handle (code-set maps, unknown transform
+types); MappingPlan interprets those.
+"""
+from functools import lru_cache
+
+
+@lru_cache(maxsize=512)
+def _code(source: str):
+    return compile(source, "<route transform>", "exec")
+
+
+def compile_layout(layout, value_transform, compiled_regex_rules: dict):
+    """A function row -> output data (assignments and concats of `layout`), or None."""
+    lines = ["def transform(row):"]
+    namespace = {}
+    items = []
+    for n, (rule, src_path, dest_path) in enumerate(layout.assignments):
+        source_value = f"row[{src_path!r}]"
+        if rule.transform_type == "copy":
+            lines.append(f"    v{n} = {source_value}")
+        elif rule.transform_type == "map":
+            if "code_set" in rule.config: # the table can be re-imported at any time; leave it to the interpreter
+                return None
+            namespace[f"m{n}"] = rule.config
+            lines.append(f"    v{n} = {source_value}")
+            lines.append(f"    v{n} = m{n}.get(str(v{n}).lower(), v{n})")
+        elif rule.transform_type == "regex" and rule.mapping_rule_id in compiled_regex_rules:
+            pattern, replacement = compiled_regex_rules[rule.mapping_rule_id]
+            namespace[f"s{n}"], namespace[f"r{n}"] = pattern.sub, replacement
+            lines.append(f"    v{n} = s{n}(r{n}, {source_value})")
+        elif rule.transform_type in ("regex", "format"):
+            namespace[f"t{n}"] = value_transform(rule)
+            lines.append(f"    v{n} = t{n}({source_value})")
+        else:
+            return None
+        if dest_path is not None:
+            items.append(f"{dest_path!r}: v{n}")
+
+    for n, (dest_path, delimiter, src_paths) in enumerate(layout.concats):
+        namespace[f"d{n}"] = delimiter
+        values = ", ".join(f"str(row[{src_path!r}])" for src_path in src_paths)
+        items.append(f"{dest_path!r}: d{n}.join(({values},))")
+
+    lines.append("    return {" + ", ".join(items) + "}")
+    source = "\n".join(lines) + "\n"
+    exec(_code(source), namespace)
+    transform = namespace["transform"]
+    transform.source = source # for debugging a route's generated code
+    return transform
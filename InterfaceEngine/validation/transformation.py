@@ -1,5 +1,64 @@
+from functools import lru_cache
+import logging
+import os
 import re
 
+# Shares main.py's mapping logger, so these lines go through its queued file handler.
+logger = logging.getLogger("interface_engine.mapping")
+
+# Variable parts recognised in a regex rule, checked in this order; the first one found in
+# pattern_from becomes capture group 1.
+_COMMON_PATTERNS = (r"\d+", r"\d", r"\w+", r"\w", r".*", r".+", r"[^/]+", r"[^\s]+")
+_REGEX_RULE_CACHE_SIZE = int(os.getenv("REGEX_RULE_CACHE_SIZE", "1024"))
+# \1..\99 (not followed by another digit, which re could read as octal) and \g<...>.
+_GROUP_REFERENCE = re.compile(r"\\([1-9]\d?)(?!\d)|\\g<(\w+)>")
+
+def _expansion(pattern: re.Pattern, template: str):
+    """
+    The replacement to pass to pattern.sub. re also caches parsed templates in a small cache of
+    its own, so templates made of literals and group references are expanded by a function built
+    here once; anything with other escapes is left to re.
+    """
+    if "\\" not in template:
+        return template
+    parts = _GROUP_REFERENCE.split(template) # literal, number, name, literal, number, name, ...
+    literals = parts[0::3]
+    if any("\\" in literal for literal in literals):
+        return template
+    groups = [int(number or name) if (number or name.isdigit()) else pattern.groupindex[name]
+              for number, name in zip(parts[1::3], parts[2::3])]
+    pieces = list(zip(groups, literals[1:]))
+    head = literals[0]
+
+    def expand(match: re.Match) -> str:
+        out = head
+        for group, literal in pieces:
+            out += (match.group(group) or "") + literal
+        return out
+    return expand
+
+def compile_regex_rule(pattern_from: str, pattern_to: str) -> tuple[re.Pattern, object]:
+    """
+    Compile a regex rule into (pattern, replacement) for pattern.sub — see regex_replace_with_template.
+    Raises re.error when the pattern or the template is invalid, so routes can be checked on save.
+    """
+    captured_pattern = next((p for p in _COMMON_PATTERNS if p in pattern_from), None)
+    if not captured_pattern:
+        pattern, template = re.compile(pattern_from), pattern_to
+    else:
+        # Wrap the variable part in a capture group, and put \1 where it appears in pattern_to.
+        pattern = re.compile(pattern_from.replace(captured_pattern, f"({captured_pattern})", 1))
+        template = pattern_to.replace(captured_pattern, r"\1", 1)
+    try:
+        pattern.sub(template, "") # re parses the template eagerly; bad group references fail here
+        return pattern, _expansion(pattern, template)
+    except (IndexError, KeyError) as exp: # an unknown group name, e.g. \g<foo>
+        raise re.error(f"invalid group reference in template: {exp}") from exp
+
+# Ad-hoc callers (and rules added after a worker started) share this cache instead of re's own,
+# which only holds a few hundred patterns across the whole process.
+_cached_regex_rule = lru_cache(maxsize=_REGEX_RULE_CACHE_SIZE)(compile_regex_rule)
+
 def regex_replace_with_template(value: str, pattern_from: str, pattern_to: str) -> str:
     r"""
     Replace using regex with capture groups - bidirectional!
@@ -16,30 +75,8 @@ def regex_replace_with_template(value: str, pattern_from: str, pattern_to: str)
         pattern_to: r"\\d+"
     Captures the \d+ convert it into (\d+), then replaces entire match with just \1 = "2"
     """
-    # Find common regex patterns
-    common_patterns = [r"\d+", r"\d", r"\w+", r"\w", r".*", r".+", r"[^/]+", r"[^\s]+"]
-    captured_pattern = None
-    
-    for regex_pattern in common_patterns:
-        if regex_pattern in pattern_from:
-            captured_pattern = regex_pattern
-            break
-    
-    if not captured_pattern:
-        return re.sub(pattern=pattern_from, repl=pattern_to, string=value)
-    
-    # Wrap the variable part in a capture group
-    pattern_from_captured = pattern_from.replace(captured_pattern, f"({captured_pattern})", 1)
-    
-    # Replace that pattern in pattern_to with the capture group reference \1
-    replacement_template = pattern_to.replace(captured_pattern, r"\1", 1)
-    
-    # print(f"Value: {value}")
-    # print(f"Pattern from: {pattern_from}")
-    # print(f"Pattern from (with capture): {pattern_from_captured}")
-    # print(f"Replacement template: {replacement_template}")
-    
-    return re.sub(pattern=pattern_from_captured, repl=replacement_template, string=value)
+    pattern, template = _cached_regex_rule(pattern_from, pattern_to)
+    return pattern.sub(template, value)
 
 # --------------------------------------------------------------------------------------------------
 
@@ -96,8 +133,8 @@ async def set_null_if_not_available(output_data: dict, dest_path_to_resource: di
         else:
             segment_count[segment_name] = max(segment_count[segment_name], counter)
 
-    print("segment_count --> ", segment_count)
-    print("output_data before filling missing values --> ", output_data)
+    logger.debug("segment_count --> %s", segment_count)
+    logger.debug("output_data before filling missing values --> %s", output_data)
 
     null_paths_to_value = dict()
     for output_path, output_value in output_data.items():
@@ -187,12 +224,12 @@ def fill_duplicate_missing_values(output_data):
                     first_occurance_segment_value = output_data[output_key]
 
         if first_occurance_segment_value is not None and segment_max_count > 1:
-            print("first occurance segment value for ", segment, " is ", first_occurance_segment_value)
+            logger.debug("first occurance segment value for %s is %s", segment, first_occurance_segment_value)
             for i in range(1, segment_max_count+1):
                 segment_to_fill = segment_simple_name + f"[{i}]" + "-" + segment_field # OBR[1]-2, OBR[2]-2, OBR[3]-2
                 if segment_to_fill not in output_data:
                     output_data[segment_to_fill] = first_occurance_segment_value
-                    print("filling the missing value for ", segment_to_fill, " with value ", first_occurance_segment_value)
+                    logger.debug("filling the missing value for %s with value %s", segment_to_fill, first_occurance_segment_value)
     
     return output_data
 
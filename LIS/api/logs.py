@@ -1,34 +1,71 @@
-from fastapi import APIRouter, HTTPException
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Response
 import httpx
-from typing import List
 
 router = APIRouter(tags=["Logs"])
 
-ENGINE_API_URL = "http://localhost:9000/logs/engine/logs"
+ENGINE_API_URL = "http://localhost:9000/logs/query"
+ENGINE_MAX_PAGE_SIZE = 500 # /logs/query ka max limit
 
 @router.get("/v1/logs")
-async def get_filtered_logs_from_ehr_lis(system_id: str):
+async def get_filtered_logs_from_ehr_lis(
+    system_id: str,
+    response: Response,
+    status: str | None = None,
+    dest_system_name: str | None = None,
+    channel: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    view: str = "full",
+    limit: int | None = None,
+    cursor: str | None = None,
+):
     """
-    Front-end se system_id aayegi. Yeh API Engine se saara data legi 
-    aur yahan EHR/LIS side par filter kar ke return karegi.
+    Front-end se system_id aayegi. Engine khud filter karta hai.
+
+    Default (na `limit` na `cursor`): pehle jaisa — saare matching logs, src/dest message bodies
+    ke saath, oldest first. Iske liye engine ke saare pages yahin follow kiye jaate hain.
+
+    `limit` ya `cursor` dene par sirf ek page aata hai (newest first); agla page `X-Next-Cursor`
+    header wale cursor se milega. `view=summary` par message bodies nahi aati.
     """
+    paginate = limit is not None or cursor is not None
+    params = {
+        "src_systemid": system_id,
+        "status": status,
+        "dest_system_name": dest_system_name,
+        "channel": channel,
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        "view": view,
+        "limit": limit if paginate else ENGINE_MAX_PAGE_SIZE,
+        "cursor": cursor,
+    }
+    items = []
     async with httpx.AsyncClient() as client:
-        try:
-            # 1. Engine se saara data mangwaya
-            response = await client.get(ENGINE_API_URL)
-            
-            if response.status_code != 200:
+        while True:
+            try:
+                engine_response = await client.get(
+                    ENGINE_API_URL, params={k: v for k, v in params.items() if v is not None}
+                )
+            except httpx.RequestError as exc:
+                raise HTTPException(status_code=500, detail=f"Engine se raabta nahi ho saka: {exc}")
+
+            if engine_response.status_code == 400:
+                raise HTTPException(status_code=400, detail=engine_response.json().get("detail"))
+            if engine_response.status_code != 200:
                 raise HTTPException(status_code=500, detail="Engine API se data nahi mila")
-                
-            all_logs = response.json()
-            
-            # 2. Filter lagaya front-end se aane wali system_id ki base par
-            filtered_logs = [
-                log for log in all_logs 
-                if log.get("src_systemid") == system_id 
-            ]
-            
-            return filtered_logs
-            
-        except httpx.RequestError as exc:
-            raise HTTPException(status_code=500, detail=f"Engine se raabta nahi ho saka: {exc}")
\ No newline at end of file
+
+            page = engine_response.json()
+            items.extend(page["items"])
+            if paginate:
+                if page.get("next_cursor"):
+                    response.headers["X-Next-Cursor"] = page["next_cursor"]
+                return items
+            if not page.get("next_cursor"):
+                break
+            params["cursor"] = page["next_cursor"]
+
+    items.reverse() # engine newest first deta hai; purana response oldest first tha
+    return items
@@ -24,6 +24,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_headers=["*"],
     allow_methods=["*"], # allow all methods like POST, GET...
+    expose_headers=["X-Next-Cursor"], # /v1/logs pagination cursor
 )
 
 model.base.metadata.create_all(bind=engine) 
@@ -2,12 +2,12 @@ from datetime import datetime
 import logging
 from logging.handlers import RotatingFileHandler
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, HTTPException, Request, status
 from fastapi.responses import JSONResponse
 import httpx
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import run_db
 from hl7_validation import get_hl7_value_by_path, hl7_extract_paths
 import models
 
@@ -28,8 +28,40 @@ logger.addHandler(handler)
 # PID|1||37201-7687308-3||saad^Muhammad||20041006|M|||||
 # IN1|||||||||||||||Silver|||||||||||||||||||||9||||||||||||||||
 
+def _update_registered_patient(db: Session, insurance_id: str, nic: str, gender: str, date_of_birth: str,
+                               policy_id: str, plan_type: str, src_system_id: str | None) -> bool:
+    """
+    Set the NIC (and routing target) of the pre-registered patient matching the HL7 demographics
+    and policy. Returns False when no patient matches. Runs on the DB executor.
+    """
+    if db.get(models.Insurance, insurance_id) is None:
+        logger.warning(f"Received new patient HL7 message with unknown System-Id: {insurance_id}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown System-Id: {insurance_id}")
+
+    existing_patient = (
+        db.query(models.Patient)
+        .join(models.InsurancePolicy, models.InsurancePolicy.policy_id == int(str(policy_id).strip()))
+        .filter(
+            models.Patient.gender == gender,
+            models.Patient.date_of_birth == date_of_birth,
+            models.InsurancePolicy.policy_id == int(str(policy_id).strip()),
+            models.InsurancePolicy.category_name == str(plan_type).strip()
+        )
+        .first()
+    )
+    if not existing_patient:
+        return False
+
+    # Patient already registered in Payer — update NIC and (re-)set the routing target.
+    logger.info(f"Found existing patient for HL7 data. Updating NIC to {nic} for patient ID {existing_patient.pid}")
+    existing_patient.nic = nic
+    if src_system_id:
+        existing_patient.dest_system_id = src_system_id
+    db.commit()
+    return True
+
 @router.post("/get/registed_patient")
-async def get_registed_patient(req: Request, db: Session = Depends(get_db)):
+async def get_registed_patient(req: Request):
     """
     Internal engine endpoint to receive a patient from an HL7 v2.x message (plain text).
 
@@ -68,10 +100,6 @@ async def get_registed_patient(req: Request, db: Session = Depends(get_db)):
             logger.warning("Received new patient HL7 message without System-Id header")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing System-Id header")
         
-        if db.get(models.Insurance, insurance_id) is None:
-            logger.warning(f"Received new patient HL7 message with unknown System-Id: {insurance_id}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown System-Id: {insurance_id}")
-        
         raw = await req.body()
         data = raw.decode("utf-8", errors="replace")
         logger.info(f"Received HL7 message for patient registration: {data}")
@@ -125,31 +153,16 @@ async def get_registed_patient(req: Request, db: Session = Depends(get_db)):
         logger.warning(f"Missing plan type in IN1 segment of HL7 message: {data}. Cannot match patient without plan type.")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required IN1-15 or IN1-3 field for plan type")
         
-    existing_patient = (
-        db.query(models.Patient)
-        .join(models.InsurancePolicy, models.InsurancePolicy.policy_id == int(str(policy_id).strip()))
-        .filter(
-            models.Patient.gender == gender,
-            models.Patient.date_of_birth == date_of_birth,
-            models.InsurancePolicy.policy_id == int(str(policy_id).strip()),
-            models.InsurancePolicy.category_name == str(plan_type).strip()
-        )
-        .first()
-    )
-
     # InterfaceEngine forwards the original sender's system_id in `Src-System-Id`. Capture it
     # so when the Payer sends a claim response back, MSH-5 can be set to this value and the
     # engine routes the reply to the correct EHR.
     src_system_id = req.headers.get("Src-System-Id")
 
-    if existing_patient:
-        # Patient already registered in Payer — update NIC and (re-)set the routing target.
-        logger.info(f"Found existing patient for HL7 data. Updating NIC to {nic} for patient ID {existing_patient.pid}")
-        existing_patient.nic = nic
-        if src_system_id:
-            existing_patient.dest_system_id = src_system_id
-        db.commit()
-        db.refresh(existing_patient)
+    # Insurance check, patient match and NIC update run in one executor hop.
+    updated = await run_db(
+        _update_registered_patient, insurance_id, nic, gender, date_of_birth, policy_id, plan_type, src_system_id,
+    )
+    if updated:
         return JSONResponse(content={"message": "Patient NIC updated successfully"}, status_code=status.HTTP_200_OK)
     else:
         # raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
@@ -182,8 +195,68 @@ async def get_registed_patient(req: Request, db: Session = Depends(get_db)):
                     status_code=status.HTTP_404_NOT_FOUND
                 )
 
+def _store_claim(db: Session, insurance_id: str, data: str) -> JSONResponse:
+    """Parse an HL7 claim submission and insert its PatientClaim (DB executor)."""
+    if db.get(models.Insurance, insurance_id) is None:
+        logger.warning(f"Received new patient HL7 message with unknown System-Id: {insurance_id}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown System-Id: {insurance_id}")
+    
+    logger.info(f"Received HL7 claim submission: {data}")
+
+    # Parse all segments
+    all_values = {}
+    for segment in data.splitlines()[1:]:
+        if not segment.strip():
+            logger.warning(f"Skipping empty HL7 segment in message: {data}")
+            continue
+        _, paths = hl7_extract_paths(segment=segment)
+        segment_values = get_hl7_value_by_path(data, paths)
+        all_values.update(segment_values)
+
+    logger.info(f"Extracted values from claim HL7 message: {all_values}")
+
+    nic = all_values.get('PID-3')
+    vid = all_values.get('PV1-19') or all_values.get('PV1-20')
+    if not nic or not vid:
+        logger.error(f"Missing required NIC or VID in claim submission from engine: {data}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required nic or VID in claim submission")
+    
+    is_patient = db.query(models.Patient).filter(models.Patient.nic == nic.strip(), models.Patient.insurance_id == insurance_id).first()
+
+    if not is_patient:
+        logger.error(f"No patient found with NIC {nic.strip()} in insurance {insurance_id} for claim submission from engine: {data}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No patient found with NIC {nic.strip()} in insurance {insurance_id} for claim submission")
+
+    policy = db.query(models.InsurancePolicy).filter(models.InsurancePolicy.pid == is_patient.pid).first()
+    if not policy:
+        logger.error(f"No insurance policy found for patient with NIC {nic.strip()} in insurance {insurance_id} for claim submission from engine: {data}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No insurance policy found for patient with NIC {nic.strip()} in insurance {insurance_id} for claim submission")
+
+    dt = datetime.strptime(all_values.get('FT1-4'), "%Y%m%d%H%M%S")
+    date_time = dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    service_included = True
+    tests_included = False
+    if all_values.get('FT1-7', "") == "Service_LabTest":
+        tests_included = True
+    total_fee = float(all_values.get('FT1-8', 0))
+
+    new_claim = models.PatientClaim(
+        policy_id = policy.policy_id,
+        pid = is_patient.pid,
+        vid = int(vid.strip()),
+        service_included = service_included,
+        tests_included = tests_included,
+        bill_amount = total_fee,
+        created_at = date_time
+    )
+    db.add(new_claim)
+    db.commit()
+    logger.info(f"Successfully added claim to db for patient with NIC {nic.strip()} from claim submission from engine: {data}")
+    return JSONResponse(content={"message": "Claim received successfully"}, status_code=status.HTTP_200_OK)
+
 @router.post("/submit-claim")
-async def submit_claim_from_engine(req: Request, db: Session = Depends(get_db)):
+async def submit_claim_from_engine(req: Request):
     """
     Internal engine endpoint to receive a claim submission from the InterfaceEngine.
 
@@ -196,65 +269,10 @@ async def submit_claim_from_engine(req: Request, db: Session = Depends(get_db)):
             logger.warning("Received new patient HL7 message without System-Id header")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing System-Id header")
         
-        if db.get(models.Insurance, insurance_id) is None:
-            logger.warning(f"Received new patient HL7 message with unknown System-Id: {insurance_id}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown System-Id: {insurance_id}")
-        
         raw = await req.body()
         data = raw.decode("utf-8", errors="replace")
-        logger.info(f"Received HL7 claim submission: {data}")
-
-        # Parse all segments
-        all_values = {}
-        for segment in data.splitlines()[1:]:
-            if not segment.strip():
-                logger.warning(f"Skipping empty HL7 segment in message: {data}")
-                continue
-            _, paths = hl7_extract_paths(segment=segment)
-            segment_values = get_hl7_value_by_path(data, paths)
-            all_values.update(segment_values)
-
-        logger.info(f"Extracted values from claim HL7 message: {all_values}")
-
-        nic = all_values.get('PID-3')
-        vid = all_values.get('PV1-19') or all_values.get('PV1-20')
-        if not nic or not vid:
-            logger.error(f"Missing required NIC or VID in claim submission from engine: {data}")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing required nic or VID in claim submission")
-        
-        is_patient = db.query(models.Patient).filter(models.Patient.nic == nic.strip(), models.Patient.insurance_id == insurance_id).first()
-
-        if not is_patient:
-            logger.error(f"No patient found with NIC {nic.strip()} in insurance {insurance_id} for claim submission from engine: {data}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No patient found with NIC {nic.strip()} in insurance {insurance_id} for claim submission")
-
-        policy = db.query(models.InsurancePolicy).filter(models.InsurancePolicy.pid == is_patient.pid).first()
-        if not policy:
-            logger.error(f"No insurance policy found for patient with NIC {nic.strip()} in insurance {insurance_id} for claim submission from engine: {data}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No insurance policy found for patient with NIC {nic.strip()} in insurance {insurance_id} for claim submission")
-
-        dt = datetime.strptime(all_values.get('FT1-4'), "%Y%m%d%H%M%S")
-        date_time = dt.strftime("%Y-%m-%d %H:%M:%S")
-
-        service_included = True
-        tests_included = False
-        if all_values.get('FT1-7', "") == "Service_LabTest":
-            tests_included = True
-        total_fee = float(all_values.get('FT1-8', 0))
-
-        new_claim = models.PatientClaim(
-            policy_id = policy.policy_id,
-            pid = is_patient.pid,
-            vid = int(vid.strip()),
-            service_included = service_included,
-            tests_included = tests_included,
-            bill_amount = total_fee,
-            created_at = date_time
-        )
-        db.add(new_claim)
-        db.commit()
-        logger.info(f"Successfully added claim to db for patient with NIC {nic.strip()} from claim submission from engine: {data}")
-        return JSONResponse(content={"message": "Claim received successfully"}, status_code=status.HTTP_200_OK)
+        # Parsing, the patient/policy lookups and the claim insert run in one executor hop.
+        return await run_db(_store_claim, insurance_id, data)
     except Exception as exp:
         logger.error(f"Error processing claim submission from engine: {str(exp)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exp))
@@ -6,7 +6,8 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from fhir_validation import fhir_extract_paths, get_fhir_value_by_path
 
-from database import get_db
+from database import get_db, run_db
+import json_codec
 import model
 
 router = APIRouter(tags=["Engine-Service"])
@@ -27,9 +28,10 @@ if not logger.handlers:
 
 async def send_to_engine(data: dict, url: str, system_id: str):
     try:
+        body = json_codec.dumps(data) # encoded once, sent as is
         async with httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=5.0)) as client:
             headers = {"Content-Type": "application/json", "System-Id": system_id}
-            response = await client.post(url, json=data, headers=headers)
+            response = await client.post(url, content=body, headers=headers)
             if response.status_code in (200, 201, 202, 203, 204):
                 return
 
@@ -57,7 +59,7 @@ async def add_patient(req: Request, db: Session = Depends(get_db)):
         src_system_id = req.headers.get("Src-System-Id", "Unknown-hospital-id")
         src_system_name = req.headers.get("Src-System-Name", "Unknown-hospital")
         
-        json_data = await req.json()
+        json_data = json_codec.loads(await req.body())
 
         # print(f"Recieved FHIR Data: {json_data}")
         logger.info(f"Recieved FHIR Data: {json_data}")
@@ -128,8 +130,98 @@ async def add_patient(req: Request, db: Session = Depends(get_db)):
         logger.error(f"Error processing FHIR data: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+def _save_visit_note(db: Session, src_system_id: str, doctor: dict, visit_note: dict, lab_tests: list[dict]) -> dict:
+    """Store the doctor, patient relation, visit note and lab reports parsed from a visit-note bundle (DB executor)."""
+    patient = db.query(model.Patient).filter(model.Patient.nic == visit_note['nic']).first()
+    if not patient:
+        logger.warning(f"No patient found with NIC in database: {visit_note['nic']}")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No patient found with NIC in database: {visit_note['nic']}")
+    
+    is_doctor = db.query(model.Doctor).filter(model.Doctor.doctor_id == doctor['doctor_id']).first()
+    # if doctor is not avaiable then add the doctor else update the doctor information.
+    if not is_doctor:
+        doctor_obj = model.Doctor(
+            doctor_id = doctor['doctor_id'],
+            hospital_id = src_system_id,
+            name = doctor['name'],
+            specialization = doctor['specialization'],
+            phone_no = doctor['phone_no'],
+            about = doctor['about'],
+        )
+        db.add(doctor_obj)
+    else:
+        is_doctor.name = doctor['name']
+        is_doctor.specialization = doctor['specialization']
+        is_doctor.phone_no = doctor['phone_no']
+        is_doctor.about = doctor['about']
+        db.add(is_doctor)
+    
+    is_patient_relation = db.query(model.PatientRelation) \
+        .filter(model.PatientRelation.patient_nic == str(visit_note['nic']).strip(), model.PatientRelation.hospital_id == src_system_id).first()
+    
+    # if no relation exists than add the relation.
+    if not is_patient_relation:
+        patient_relation_obj = model.PatientRelation(
+            patient_nic = visit_note['nic'],
+            doctor_id = doctor['doctor_id'],
+            hospital_id = src_system_id
+        )
+        db.add(patient_relation_obj)
+    elif is_patient_relation.doctor_id is not None: # if patient has encounterd with another doctor of the same hospital then add this doctor as well.
+        if is_patient_relation.doctor_id == doctor['doctor_id']:
+            logger.info(f"Patient with NIC {visit_note['nic']} already has a relation with doctor id {doctor['doctor_id']} in hospital id {src_system_id}")
+            pass
+
+        patient_relation_obj = model.PatientRelation(
+            patient_nic = visit_note['nic'],
+            doctor_id = doctor['doctor_id'],
+            hospital_id = src_system_id
+        )
+        db.add(patient_relation_obj)
+    else:
+        is_patient_relation.doctor_id = doctor['doctor_id']
+        db.add(is_patient_relation)
+    
+    is_visit_note = db.query(model.VisitingNotes).filter(model.VisitingNotes.note_id == visit_note['note_id']).first()
+    if is_visit_note:
+        logger.warning(f"Visit note with the same id already exists in the database: {visit_note['note_id']}")
+        return {"message": f"Visit note with the same id already exists in the database: {visit_note['note_id']}"}
+    
+    visit_note_obj = model.VisitingNotes(
+        note_id = visit_note['note_id'],
+        nic = visit_note['nic'],
+        doctor_id = doctor['doctor_id'],
+        note_title = visit_note.get('note_title', None),
+        patient_complaint = visit_note.get('patient_complaint', None),
+        diagnosis = visit_note.get('diagnosis', None),
+        note_details = visit_note.get('note_details', None),
+        consultation_bill = visit_note.get('consultation_bill', 0),
+        # payment_status = visit_note.get('payment_status', "unpaid") if visit_note.get('payment_status', None) == 'issued' else "unpaid"
+        payment_status = "unpaid" # By default, it is unpaid, but we can add logic to this later.
+    )
+    db.add(visit_note_obj)
+    db.flush()
+
+    for lab_test in lab_tests:
+        if db.query(model.LabReport).filter(model.LabReport.test_code == lab_test['test_code'], model.LabReport.visit_id == lab_test['visit_id']).first():
+            logger.warning(f"Lab test with the same code and the same visit id already exists in the lab report table")
+            continue
+
+        lab_report_obj = model.LabReport(
+            visit_id = lab_test['visit_id'],
+            lab_id = lab_test['lab_id'],
+            lab_name = lab_test['lab_name'],
+            test_code = lab_test['test_code'],
+            test_name = lab_test['test_name'],
+            description = None
+        )
+        db.add(lab_report_obj)
+    db.commit()
+    logger.info(f"Visit note and lab tests added to DB for patient NIC: {visit_note['nic']}")
+    return {"message": "Visit note and lab tests added to DB successfully"}
+
 @router.post("/get-visit-note", status_code=status.HTTP_200_OK)
-async def get_visit_note(req: Request, db: Session = Depends(get_db)):
+async def get_visit_note(req: Request):
     """
     Ingest visit-note bundle from InterfaceEngine and persist doctor, visit, and lab references.
 
@@ -149,7 +241,7 @@ async def get_visit_note(req: Request, db: Session = Depends(get_db)):
         # adding dest_server_system id means phr system id.
         phr_system_id = req.headers.get("System-Id", "Unknown_phr_system_id")
         
-        json_data = await req.json()
+        json_data = json_codec.loads(await req.body())
 
         # print(f"Recieved FHIR Data: {json_data}")
         logger.info(f"Recieved FHIR Data: {json_data}")
@@ -316,104 +408,16 @@ async def get_visit_note(req: Request, db: Session = Depends(get_db)):
         logger.info(f"Extracted Visit Note Data: {visit_note}")
         logger.info(f"Extracted Lab Tests Data: {lab_tests}")
 
-        patient = db.query(model.Patient).filter(model.Patient.nic == visit_note['nic']).first()
-        if not patient:
-            logger.warning(f"No patient found with NIC in database: {visit_note['nic']}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No patient found with NIC in database: {visit_note['nic']}")
-        
-        is_doctor = db.query(model.Doctor).filter(model.Doctor.doctor_id == doctor['doctor_id']).first()
-        # if doctor is not avaiable then add the doctor else update the doctor information.
-        if not is_doctor:
-            doctor_obj = model.Doctor(
-                doctor_id = doctor['doctor_id'],
-                hospital_id = src_system_id,
-                name = doctor['name'],
-                specialization = doctor['specialization'],
-                phone_no = doctor['phone_no'],
-                about = doctor['about'],
-            )
-            db.add(doctor_obj)
-        else:
-            is_doctor.name = doctor['name']
-            is_doctor.specialization = doctor['specialization']
-            is_doctor.phone_no = doctor['phone_no']
-            is_doctor.about = doctor['about']
-            db.add(is_doctor)
-        
-        is_patient_relation = db.query(model.PatientRelation) \
-            .filter(model.PatientRelation.patient_nic == str(visit_note['nic']).strip(), model.PatientRelation.hospital_id == src_system_id).first()
-        
-        # if no relation exists than add the relation.
-        if not is_patient_relation:
-            patient_relation_obj = model.PatientRelation(
-                patient_nic = visit_note['nic'],
-                doctor_id = doctor['doctor_id'],
-                hospital_id = src_system_id
-            )
-            db.add(patient_relation_obj)
-        elif is_patient_relation.doctor_id is not None: # if patient has encounterd with another doctor of the same hospital then add this doctor as well.
-            if is_patient_relation.doctor_id == doctor['doctor_id']:
-                logger.info(f"Patient with NIC {visit_note['nic']} already has a relation with doctor id {doctor['doctor_id']} in hospital id {src_system_id}")
-                pass
-
-            patient_relation_obj = model.PatientRelation(
-                patient_nic = visit_note['nic'],
-                doctor_id = doctor['doctor_id'],
-                hospital_id = src_system_id
-            )
-            db.add(patient_relation_obj)
-        else:
-            is_patient_relation.doctor_id = doctor['doctor_id']
-            db.add(is_patient_relation)
-        
-        is_visit_note = db.query(model.VisitingNotes).filter(model.VisitingNotes.note_id == visit_note['note_id']).first()
-        if is_visit_note:
-            logger.warning(f"Visit note with the same id already exists in the database: {visit_note['note_id']}")
-            return {"message": f"Visit note with the same id already exists in the database: {visit_note['note_id']}"}
-        
-        visit_note_obj = model.VisitingNotes(
-            note_id = visit_note['note_id'],
-            nic = visit_note['nic'],
-            doctor_id = doctor['doctor_id'],
-            note_title = visit_note.get('note_title', None),
-            patient_complaint = visit_note.get('patient_complaint', None),
-            diagnosis = visit_note.get('diagnosis', None),
-            note_details = visit_note.get('note_details', None),
-            consultation_bill = visit_note.get('consultation_bill', 0),
-            # payment_status = visit_note.get('payment_status', "unpaid") if visit_note.get('payment_status', None) == 'issued' else "unpaid"
-            payment_status = "unpaid" # By default, it is unpaid, but we can add logic to this later.
-        )
-        db.add(visit_note_obj)
-        db.flush()
-
-        for lab_test in lab_tests:
-            if db.query(model.LabReport).filter(model.LabReport.test_code == lab_test['test_code'], model.LabReport.visit_id == lab_test['visit_id']).first():
-                logger.warning(f"Lab test with the same code and the same visit id already exists in the lab report table")
-                continue
-
-            lab_report_obj = model.LabReport(
-                visit_id = lab_test['visit_id'],
-                lab_id = lab_test['lab_id'],
-                lab_name = lab_test['lab_name'],
-                test_code = lab_test['test_code'],
-                test_name = lab_test['test_name'],
-                description = None
-            )
-            db.add(lab_report_obj)
-        db.commit()
-        logger.info(f"Visit note and lab tests added to DB for patient NIC: {visit_note['nic']}")
-        return {"message": "Visit note and lab tests added to DB successfully"}
+        # Doctor, relation, visit note and lab report writes run in one executor hop.
+        return await run_db(_save_visit_note, src_system_id, doctor, visit_note, lab_tests)
 
     except HTTPException as exp:
-        db.rollback()
         logger.exception(f"HTTP Exception: {str(exp)}")
         raise exp
     except ValueError as exp:
-        db.rollback()
         logger.exception(f"Invalid numeric identifier in payload: {str(exp)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid numeric identifier in payload")
     except Exception as e:
-        db.rollback()
         logger.exception(f"Error processing FHIR data: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
@@ -431,7 +435,7 @@ async def submit_claim_from_engine(req: Request, db: Session = Depends(get_db)):
     - `400 Bad Request`: Payload parsing, mapping, or database error.
     """
     try:
-        json_data = await req.json()
+        json_data = json_codec.loads(await req.body())
 
         logger.info(f"Recieved FHIR Data: {json_data}")
 
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import os
 
 from dotenv import load_dotenv
@@ -14,4 +16,15 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Receivers called by the InterfaceEngine run their session work here, off the event loop.
+# create_engine's default pool is 5 + 10 overflow; keep the executor within it.
+_db_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DB_EXECUTOR_WORKERS", "5")), thread_name_prefix="db")
+
+async def run_db(fn, *args, **kwargs):
+    """Run `fn(db, *args, **kwargs)` with its own session on the DB executor and return the result."""
+    def _call():
+        with session_local() as db:
+            return fn(db, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, _call)